@@ -1,28 +1,74 @@
 
-from typing import List, Optional
+from typing import Annotated, List, Optional
+import operator
 from pydantic import BaseModel, Field
 from datetime import datetime
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
 from langchain_core.tools import tool
-import serpapi
 import os
 from dotenv import load_dotenv, find_dotenv
-from langgraph.graph import StateGraph, MessagesState, START
-from langgraph.prebuilt import tools_condition, ToolNode
+# Before the local imports below, which read their settings from the environment at import time
+load_dotenv()
+from langgraph.graph import StateGraph, MessagesState, START, END
 from langgraph.graph.state import CompiledStateGraph
-import re
-from urllib.parse import urlparse
+import asyncio
+import json
+import threading
+from serp_client import cached_search
+from hotel_index import hotel_index
+from destinations import destination_pack
+from booking_links import (
+    BOOKING_DEFAULT_PLATFORM, batch_booking_links, booking_dates, booking_link, booking_options, refresh_booking_links,
+)
+from image_dedup import assign_hotel_images, dedupe_images
+from image_probe import filter_live_images
+from url_classifier import filter_reliable_images, is_valid_booking_url
+from tool_executor import ParallelToolNode
+from prefetch import normalize_cities, plan_searches, recorded_searches, run_searches
+from optimizer import optimize_budget
+from compaction import compact_messages, compaction_stats, message_tokens
+from edits import (
+    changed_fields, describe_changes, edit_prompt, edit_stats, edited_draft, itinerary_cost, merge_results,
+    path_cities, plan_edit_searches, trip_fields,
+)
+from prompts import get_system_messages, prompt_cache_stats
+from llm_router import build_router
+from quota import quota
+from replay import decode_message, describe_llm_request, encode_message, fixture_store, llm_request
+from telemetry import get_logger, log_payload, traced_node
+from itinerary_schema import (
+    ITINERARY_REPAIR_ATTEMPTS, apply_budget_plan, apply_patch, parse_itinerary_text, repair_prompt,
+    validate_sections, validation_stats,
+)
 
 
 
-load_dotenv()
-open_api_key = os.getenv("OPENAI_API_KEY")
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY") 
-print(f"SERPAPI_API_KEY...",SERPAPI_API_KEY)
+logger = get_logger("agent")
+GRAPH_MODE = os.getenv("GRAPH_MODE", "agent")
+
 
-from langchain_openai import ChatOpenAI
-llm = ChatOpenAI(model="gpt-4o-mini", api_key=open_api_key)
+
+def get_llm_router():
+    """
+    The process-wide LLM router, built on first use so importing this module stays cheap
+    (provider SDKs are only imported once a model is actually needed)
+    """
+    return globals().get("llm_router") or __getattr__("llm_router")
+
+
+async def invoke_llm(messages, route, tools=None):
+    """
+    One model call through the router, charged to the caller's LLM quota first.
+
+    Goes through the fixture store, so a replayed run never reaches a model or needs a key.
+    """
+    async def call():
+        await quota.acquire("llm")
+        return await get_llm_router().ainvoke(messages, route=route, tools=tools)
+
+    return await fixture_store.call("llm", llm_request(messages, route, tools), call,
+                                    encode=encode_message, decode=decode_message, describe=describe_llm_request)
 
 
 
@@ -36,7 +82,16 @@ class AgentState(MessagesState):
     city: List[str]
     days: int
     travel_date: str
-    itinerary: List[dict]  
+    itinerary: dict  # validated itinerary, set once the final reply passes (or repair gives up)
+    itinerary_draft: dict  # parsed reply being repaired
+    invalid_sections: dict  # section path -> problem, non-empty while a repair is pending
+    itinerary_errors: dict  # problems left after the last repair attempt
+    repair_attempts: int
+    tool_results: dict  # search results by city, filled by the prefetch node
+    tokens_saved: Annotated[int, operator.add]  # prompt tokens removed by history compaction
+    budget_plan: dict  # exact per-day choices and costs from the optimizer node
+    edit_request: dict  # new trip fields for an edit of the stored itinerary, cleared by the edit node
+    edit_summary: dict  # what the last edit changed, kept and redid
 
 
 
@@ -56,9 +111,9 @@ class HotelsInputSchema(BaseModel):
     params: HotelsInput
 
 
-def extract_booking_url(hotel_data):
+def provider_booking_url(hotel_data):
     """
-    Extract actual booking URL from hotel data, avoiding SerpAPI internal URLs
+    The hotel's own booking URL from the search result, avoiding SerpAPI internal URLs
     """
   
     url_fields = [
@@ -92,133 +147,63 @@ def extract_booking_url(hotel_data):
                 if url and is_valid_booking_url(url):
                     return url
     
+    return None
+
+
+def extract_booking_url(hotel_data, dates=None, location=""):
+    """
+    Extract actual booking URL from hotel data, or build a search link for the stay ``dates``
+    """
+    url = provider_booking_url(hotel_data)
+    if url:
+        return url
+    
    
     hotel_name = hotel_data.get('name', '')
-    location = hotel_data.get('location', '') or hotel_data.get('address', '')
+    location = hotel_data.get('location', '') or hotel_data.get('address', '') or location
     
     if hotel_name:
    
-        return create_direct_booking_url(hotel_name, location)
+        return create_direct_booking_url(hotel_name, location, dates)
     
     return None
 
-def create_direct_booking_url(hotel_name, location=""):
+def create_direct_booking_url(hotel_name, location="", dates=None):
     """
-    Create direct booking URLs prioritizing Pakistani booking platforms first
+    Create a direct booking URL on the preferred (Pakistani) platform for the stay ``dates``
     """
-   
-    clean_name = hotel_name.replace(' ', '+').replace('&', 'and')
-    clean_location = location.replace(' ', '+').replace(',', '') if location else ""
-    
-   
-    booking_platforms = [
-        {
-            'name': 'Sastaticket',
-            'url': f"https://www.sastaticket.pk/hotels/search?destination={clean_location}&checkin=2025-05-31&checkout=2025-06-07"
-        },
-        {
-            'name': 'FlyPakistan',
-            'url': f"https://flypakistan.pk/hotels?destination={clean_name}&location={clean_location}"
-        },
-        {
-            'name': 'Booking.com',
-            'url': f"https://www.booking.com/searchresults.html?ss={clean_name}+{clean_location}&checkin=2025-05-31&checkout=2025-06-07"
-        },
-        {
-            'name': 'Agoda',
-            'url': f"https://www.agoda.com/search?city=&searchText={clean_name}&checkIn=2025-05-31&checkOut=2025-06-07"
-        },
-        {
-            'name': 'Hotels.com',
-            'url': f"https://www.hotels.com/search.do?q-destination={clean_name}+{clean_location}&q-check-in=2025-05-31&q-check-out=2025-06-07"
-        },
-        {
-            'name': 'Expedia',
-            'url': f"https://www.expedia.com/Hotel-Search?destination={clean_name}+{clean_location}&startDate=2025-05-31&endDate=2025-06-07"
-        }
-    ]
-    
-   
-    return booking_platforms[0]['url']
+    return booking_link(hotel_name, location, dates)
 
-def get_multiple_booking_options(hotel_name, location=""):
+def get_multiple_booking_options(hotel_name, location="", dates=None, platforms=None):
     """
-    Get multiple booking platform URLs prioritizing Pakistani sites
+    Get booking platform URLs prioritizing Pakistani sites; only ``platforms`` are built when given
     """
-    clean_name = hotel_name.replace(' ', '+').replace('&', 'and')
-    clean_location = location.replace(' ', '+').replace(',', '') if location else ""
-    
-    return {
-         'sastaticket': f"https://www.sastaticket.pk/hotels/search?destination={clean_location}&checkin=2025-05-31&checkout=2025-06-07",
-        'flypakistan': f"https://flypakistan.pk/hotels?destination={clean_name}&location={clean_location}",
-        'booking_com': f"https://www.booking.com/searchresults.html?ss={clean_name}+{clean_location}&checkin=2025-05-31&checkout=2025-06-07",
-        'agoda': f"https://www.agoda.com/search?searchText={clean_name}&checkIn=2025-05-31&checkOut=2025-06-07",
-        'hotels_com': f"https://www.hotels.com/search.do?q-destination={clean_name}+{clean_location}&q-check-in=2025-05-31&q-check-out=2025-06-07",
-        'expedia': f"https://www.expedia.com/Hotel-Search?destination={clean_name}+{clean_location}&startDate=2025-05-31&endDate=2025-06-07"
-    }
+    return booking_options(hotel_name, location, dates, platforms)
 
-def is_valid_booking_url(url):
+def process_hotel_data(hotels_list, dates=None, location=""):
     """
-    Check if URL is a valid booking URL, prioritizing Pakistani sites
+    Process hotel data to extract valid booking URLs and clean data.
+
+    Hotels without a booking URL of their own get search links for the stay ``dates``,
+    built in one batch; ``location`` stands in when a result has no address.
     """
-    if not url or not isinstance(url, str):
-        return False
-    
-   
-    invalid_patterns = [
-        'serpapi.com',
-        'search.json',
-        'property_token=',
-        'engine=google_hotels'
-    ]
-    
-    for pattern in invalid_patterns:
-        if pattern in url.lower():
-            return False
-    
-   
-    valid_domains = [
-        'sastaticket.pk',
-        'flypakistan.pk',
-        'booking.com',
-        'expedia.com',
-        'hotels.com',
-        'agoda.com',
-        'priceline.com',
-        'kayak.com',
-        'trivago.com',
-        'hotel.com',
-        'google.com',
-        'hotelscombined.com'
+    provider_urls = [provider_booking_url(hotel) for hotel in hotels_list]
+    missing = [
+        {'name': hotel.get('name', ''), 'location': hotel.get('location', '') or hotel.get('address', '') or location}
+        for hotel, url in zip(hotels_list, provider_urls) if not url
     ]
+    generated = iter(batch_booking_links(missing, dates))
     
-   
-    if any(domain in url.lower() for domain in valid_domains):
-        return True
-    
-   
-    if url.startswith(('http://', 'https://')) and '.' in url:
-        return True
-    
-    return False
-
-def process_hotel_data(hotels_list):
-    """
-    Process hotel data to extract valid booking URLs and clean data
-    """
     processed_hotels = []
     
-    for hotel in hotels_list:
-   
-        booking_url = extract_booking_url(hotel)
-        
+    for hotel, booking_url in zip(hotels_list, provider_urls):
    
         processed_hotel = {
             'name': hotel.get('name', 'Unknown Hotel'),
             'price': hotel.get('rate_per_night', {}).get('extracted_lowest', 0) or hotel.get('price', 0),
             'rating': hotel.get('overall_rating', 0) or hotel.get('rating', 0),
             'reviews': hotel.get('reviews', 0) or hotel.get('review_count', 0),
-            'booking_url': booking_url or create_direct_booking_url(hotel.get('name', ''), hotel.get('location', ''))
+            'booking_url': booking_url or next(generated)[BOOKING_DEFAULT_PLATFORM]
         }
         
         processed_hotels.append(processed_hotel)
@@ -226,13 +211,10 @@ def process_hotel_data(hotels_list):
     return processed_hotels
 
 
-@tool(args_schema=HotelsInputSchema)
-def hotels_finder(params: HotelsInput):
-    '''
-    Find hotels using the Google Hotels engine with valid booking URLs.
-    Returns:
-        list: Processed hotel data with valid booking URLs.
-    '''
+async def search_hotels(params: HotelsInput):
+    """
+    Run one Google Hotels search and add every returned property to the hotel index
+    """
     search_params = {
         'api_key': SERPAPI_API_KEY,
         'engine': 'google_hotels',
@@ -249,21 +231,103 @@ def hotels_finder(params: HotelsInput):
         'hotel_class': params.hotel_class
     }
 
-    search = serpapi.search(search_params)
-    results = search.data
+    results = await cached_search(search_params, 'hotels')
     
 
-    raw_hotels = results.get('properties', [])[:5]
+    raw_hotels = results.get('properties', [])
     
 
-    processed_hotels = process_hotel_data(raw_hotels)
+    dates = booking_dates(params.check_in_date, params.check_out_date)
+    processed_hotels = process_hotel_data(raw_hotels, dates, location=params.q)
+    
+    hotel_index.add(params.q, params.check_in_date, params.check_out_date, [
+        {**hotel, 'hotel_class': raw.get('extracted_hotel_class')}
+        for hotel, raw in zip(processed_hotels, raw_hotels)
+    ], adults=params.adults)
+    
+    return processed_hotels
+
+
+@tool(args_schema=HotelsInputSchema)
+async def hotels_finder(params: HotelsInput):
+    '''
+    Find hotels using the Google Hotels engine with valid booking URLs.
+    Returns:
+        list: Processed hotel data with valid booking URLs.
+    '''
+    processed_hotels = (await search_hotels(params))[:5]
     
-    print(f"Processed {len(processed_hotels)} hotels with valid booking URLs")
+    logger.debug("Processed %d hotels with valid booking URLs", len(processed_hotels))
     
     return processed_hotels
 
 
-def clean_hotel_booking_urls(hotel_data_list):
+class HotelsBatchInput(BaseModel):
+    cities: List[str] = Field(description='Cities to search, e.g. ["Lahore", "Skardu"]')
+    check_in_date: str = Field(description='Check-in date. The format is YYYY-MM-DD. e.g. 2024-06-22')
+    check_out_date: str = Field(description='Check-out date. The format is YYYY-MM-DD. e.g. 2024-06-28')
+    adults: Optional[int] = Field(1, description='Number of adults. Default to 1.')
+    children: Optional[int] = Field(0, description='Number of children. Default to 0.')
+    rooms: Optional[int] = Field(1, description='Number of rooms. Default to 1.')
+    hotel_class: Optional[str] = Field(
+        None, description='Parameter defines to include only certain hotel class in the results. for example- 2,3,4')
+
+
+@tool(args_schema=HotelsBatchInput)
+async def hotels_batch_finder(cities: List[str], check_in_date: str, check_out_date: str, adults: int = 1,
+                              children: int = 0, rooms: int = 1, hotel_class: Optional[str] = None):
+    '''
+    Find hotels for several cities at once, all searched in parallel.
+    Every hotel found is also indexed for hotel_index_query.
+    Returns:
+        dict: Top hotels per city with valid booking URLs.
+    '''
+    searches = [
+        search_hotels(HotelsInput(
+            q=f"{city} Pakistan", check_in_date=check_in_date, check_out_date=check_out_date,
+            adults=adults, children=children, rooms=rooms, hotel_class=hotel_class
+        ))
+        for city in cities
+    ]
+    results = await asyncio.gather(*searches, return_exceptions=True)
+    
+    return {
+        city: {"error": str(result)} if isinstance(result, Exception) else result[:5]
+        for city, result in zip(cities, results)
+    }
+
+
+@tool
+def hotel_index_query(city: str, check_in_date: str, check_out_date: str, adults: Optional[int] = None,
+                      max_price_per_night: Optional[float] = None, min_rating: Optional[float] = None,
+                      hotel_class: Optional[int] = None, price_band: Optional[str] = None,
+                      sort_by: str = "rating", limit: int = 3) -> list:
+    '''
+    Pick hotels from the ones hotels_finder or hotels_batch_finder already found for the same stay,
+    without a new search. Use it to get cheaper or better-rated alternatives.
+    Args:
+        city: City that was already searched
+        check_in_date: Check-in date of that search, YYYY-MM-DD
+        check_out_date: Check-out date of that search, YYYY-MM-DD
+        adults: Number of adults of that search, if it matters
+        max_price_per_night: Highest nightly price in PKR
+        min_rating: Lowest acceptable rating (0-5)
+        hotel_class: Star class, e.g. 3
+        price_band: "budget", "mid", "upscale" or "luxury"
+        sort_by: "rating" (best first) or "price" (cheapest first)
+        limit: Number of hotels to return
+    Returns:
+        list: Matching hotels with valid booking URLs; empty if this stay was never searched,
+        in which case search it with hotels_finder
+    '''
+    hotels = hotel_index.query(
+        city, check_in_date, check_out_date, adults=adults, max_price=max_price_per_night,
+        min_rating=min_rating, hotel_class=hotel_class, price_band=price_band, sort_by=sort_by, limit=limit
+    )
+    return hotels or []
+
+
+def clean_hotel_booking_urls(hotel_data_list, dates=None):
     """
     Clean up hotel data to remove invalid booking URLs and replace with direct booking URLs
     """
@@ -273,19 +337,21 @@ def clean_hotel_booking_urls(hotel_data_list):
                 # Replace with direct booking URL
                 hotel_name = hotel.get('name', 'hotel')
                 location = hotel.get('location', '') or hotel.get('address', '')
-                hotel['booking_url'] = create_direct_booking_url(hotel_name, location)
+                hotel['booking_url'] = create_direct_booking_url(hotel_name, location, dates)
     
     return hotel_data_list
 
 
-def enhance_hotel_with_booking_options(hotel_data):
+def enhance_hotel_with_booking_options(hotel_data, dates=None):
     """
     Add multiple booking platform URLs to hotel data
     """
     hotel_name = hotel_data.get('name', '')
     location = hotel_data.get('location', '') or hotel_data.get('address', '')
     
-    booking_options = get_multiple_booking_options(hotel_name, location)
+    booking_options = get_multiple_booking_options(
+        hotel_name, location, dates, platforms=('booking_com', 'agoda', 'hotels_com', 'expedia')
+    )
     
  
     hotel_data['booking_url'] = booking_options['booking_com']
@@ -316,103 +382,8 @@ class ImageSearchInput(BaseModel):
     q: str = Field(description="Search query for the image")
     safe: Optional[str] = Field(default="active", description="Safe search setting: active, moderate, or off")
 
-def is_problematic_url(url):
-    """
-    Check if URL is from known problematic sources
-    """
-    if not url:
-        return True
-    
-    problematic_patterns = [
- 
-        r'lh\d+\.googleusercontent\.com/p/',
-        r'drive\.google\.com',
-        r'photos\.google\.com',
-        
- 
-        r'\.trvl-media\.com', 
-        r'booking\.com.*images',
-        r'expedia\.com.*images',
-        
- 
-        r'.*[?&](token|auth|signature|expires)=',
-        
- 
-        r'lh\d+\.googleusercontent\.com.*=s\d+$',
-        
-        
-        r'.*[?&](utm_|fbclid|gclid)',
-    ]
-    
-    for pattern in problematic_patterns:
-        if re.search(pattern, url, re.IGNORECASE):
-            return True
-    
-    return False
-
-def filter_reliable_images(image_results, max_images=10):
-    """
-    Filter image results to exclude problematic URLs and prioritize reliable sources
-    """
-    reliable_images = []
-    
-  
-    preferred_domains = [
-        'upload.wikimedia.org',
-        'commons.wikimedia.org',
-        'unsplash.com',
-        'pixabay.com',
-        'pexels.com',
-        'flickr.com',
-        'staticflickr.com'
-    ]
-    
-  
-    for img in image_results:
-        if len(reliable_images) >= max_images:
-            break
-            
-        url_candidates = [
-            img.get('original'),
-            img.get('link'),
-            img.get('thumbnail'),
-            img.get('source')
-        ]
-        
-        for url in url_candidates:
-            if url and not is_problematic_url(url):
-                domain = urlparse(url).netloc.lower()
-                
-             
-                if any(pref_domain in domain for pref_domain in preferred_domains):
-                    reliable_images.append({"url": url})
-                    break
-    
-   
-    if len(reliable_images) < max_images:
-        for img in image_results:
-            if len(reliable_images) >= max_images:
-                break
-                
-            url_candidates = [
-                img.get('original'),
-                img.get('link'),
-                img.get('thumbnail'),
-                img.get('source')
-            ]
-            
-            for url in url_candidates:
-                if url and not is_problematic_url(url):
-                  
-                    if not any(existing['url'] == url for existing in reliable_images):
-                        reliable_images.append({"url": url})
-                        break
-    
-    return reliable_images
-
-
 @tool
-def image_finder(q: str, safe: str = "active") -> list:
+async def image_finder(q: str, safe: str = "active") -> list:
     '''
     Find reliable images using Google Images via SerpAPI, filtering out problematic URLs.
     Args:
@@ -421,6 +392,11 @@ def image_finder(q: str, safe: str = "active") -> list:
     Returns:
         list: List of reliable image results with working URLs
     '''
+    # Usual destinations have vetted results in the destination pack, so no search is needed
+    packed = destination_pack.images(q, safe)
+    if packed is not None:
+        return packed
+
     search_params = {
         "api_key": SERPAPI_API_KEY,
         "engine": "google_images",
@@ -432,45 +408,52 @@ def image_finder(q: str, safe: str = "active") -> list:
         "num": "20"    
     }
 
-    search = serpapi.search(search_params)
-    results = search.data
+    results = await cached_search(search_params, "images")
     
    
     raw_images = results.get("images_results", [])
     
    
-    reliable_images = filter_reliable_images(raw_images, max_images=10)
+    # Take more candidates than needed, so dropping copies of one photo rarely forces a fallback search
+    candidates = filter_reliable_images(raw_images, max_images=20, with_thumbnails=True)
+    reliable_images = await filter_live_images(await dedupe_images(candidates, max_images=10))
     
    
-    if len(reliable_images) < 5:
-        print(f"Only found {len(reliable_images)} reliable images for '{q}', trying broader search...")
+    # Fallback searches are optional, so they are the first thing dropped when SerpAPI quota runs low
+    if len(reliable_images) < 5 and quota.degraded("serpapi"):
+        logger.info("Only %d reliable images for %r; skipping fallback searches, SerpAPI quota is low",
+                    len(reliable_images), q)
+    elif len(reliable_images) < 5:
+        logger.info("Only found %d reliable images for %r, trying broader search", len(reliable_images), q)
         
       
         alt_queries = [f"{q} wallpaper", f"{q} landscape photos", f"{q} tourism photos"]
         
+        # One at a time, in priority order, so searches stop as soon as there are enough images
         for alt_q in alt_queries:
             if len(reliable_images) >= 8:
                 break
+            try:
+                alt_result = await cached_search({**search_params, "q": alt_q}, "images")
+            except Exception as e:
+                logger.warning("Fallback image search %r failed: %s", alt_q, e)
+                continue
                 
-            alt_search_params = search_params.copy()
-            alt_search_params["q"] = alt_q
-            
-            alt_search = serpapi.search(alt_search_params)
-            alt_results = alt_search.data
-            alt_images = alt_results.get("images_results", [])
+            alt_images = alt_result.get("images_results", [])
             
-            additional_reliable = filter_reliable_images(
+            alt_candidates = filter_reliable_images(
                 alt_images, 
-                max_images=10-len(reliable_images)
+                max_images=10-len(reliable_images),
+                exclude={img['url'] for img in reliable_images},
+                with_thumbnails=True
             )
-            
-          
-            for new_img in additional_reliable:
-                if not any(existing['url'] == new_img['url'] for existing in reliable_images):
-                    reliable_images.append(new_img)
+            # Deduplicated against the images already kept, which always come first
+            kept = {img['url'] for img in reliable_images}
+            distinct = await dedupe_images(reliable_images + alt_candidates)
+            reliable_images.extend(await filter_live_images([img for img in distinct if img['url'] not in kept]))
     
-    print(f"Found {len(reliable_images)} reliable images for '{q}'")
-    return reliable_images
+    logger.debug("Found %d reliable images for %r", len(reliable_images), q)
+    return [{"url": img["url"]} for img in reliable_images]
 
 
 
@@ -483,129 +466,301 @@ def image_finder(q: str, safe: str = "active") -> list:
 
 
 
-def get_system_prompt(state: AgentState):
-    return f"""You are a smart travel assistant. Create a detailed itinerary in JSON format considering:
-    - Budget: PKR {state['budget']}
-    - Travel Interests: {', '.join(state['interests'])}
-    - Companions: {state['companions']} people
-    - Destination: {state['city']}
-    - Duration: {state['days']} days
-    - Travel Date: {state['travel_date']}
+tools = [hotels_finder,image_finder,hotels_batch_finder,hotel_index_query]
 
-   IMPORTANT: For each city in the destinations list, you must:
-    1. Use hotels_finder tool to get hotel information for EACH city separately
-    2. Use image_finder tool to get destination images for EACH city separately
-    3. Use image_finder tool to get hotel images for EACH city separately
 
-    For each city ({', '.join(state['city'])}), perform these searches:
-    1. Destination images: search for "[City Name] Pakistan tourism photos"
-    2. Hotel search: use hotels_finder for each city
-    3. Hotel images: search for "[City Name] Pakistan hotels interior rooms"
-    
-    CRITICAL: Each hotel must have its own unique image. Do NOT reuse the same image URL for different hotels.
-
-    The response should be a valid JSON object with the following structure:
-    {{
-        "trip_details": {{
-            "destination": string,
-            "duration": number,
-            "travel_date": string,
-            "companions": number,
-            "budget": number,  # in PKR
-            "interests": string[]
-        }},
-
-        "destination_images": [
-            {{
-                "url": string,
-            }}
-        ],
-
-        "hotel_images": [
-                           {{
-                              "url": string,
-                           }}
-        ],
-
-        "daily_itinerary": [
-            {{
-                "day": number,
-                "date": string,
-                "day_title": string,  # e.g., "Cultural Tour", "Arrival Day", "Adventure Day"
-                "description": string,  # Brief description of the day's theme and activities
-                "hotel": {{
-                    "name": string,
-                    "price": number,  # in PKR
-                    "rating": number,
-                    "reviews": number,
-                    "booking_url": string,
-                    "hotel_image": string  # This should be unique for each hotel
-                }},
-                }},
-                "transportation": {{
-                    "type": string,
-                    "cost": number  # in PKR
-                }},
-                "meals": [
-                    {{
-                        "type": string,
-                        "venue": string,
-                        "cost": number  # in PKR
-                    }}
-                ],
-                "activities": [
-                    {{
-                        "name": string,
-                        "description": string,
-                        "cost": number,  # in PKR
-                    }}
-                ],
-            }}
-        ],
-
-        "total_cost": number,  # in PKR
-        "remaining_budget": number  # in PKR
-    }}
-
-    Instructions:
-    1. Use image_finder to get 8-10 high-quality images of destination:{state['city']} and "{', '.join(state['city'])} hotel images.
-    2. Include destination images in the destination_images array
-    3. Include hotel images in the hotel_images array
-    4. Ensure all image URLs are valid and accessible
-
-    For each day:
-    1. Provide a meaningful day_title that describes the theme (e.g., "Cultural Tour", "Adventure Day")
-    2. Include a brief description explaining the day's focus and highlights
-
-
-    In the cost_summary:
-    1. Calculate the total trip cost in PKR
-    2. Show the remaining budget from the original amount in PKR
-    """
-
-
-tools = [hotels_finder,image_finder]
-llm_with_tools = llm.bind_tools(tools)
-
-def assistant(state: AgentState)->AgentState:
-    system_prompt = SystemMessage(content=get_system_prompt(state))
-    print("state",[system_prompt] + state["messages"])
-    return {"messages": [llm_with_tools.invoke([system_prompt] + state["messages"])]}
-
-
-builder: StateGraph = StateGraph(AgentState)
-
-
-builder.add_node("assistant", assistant)
-builder.add_node("tools", ToolNode(tools))
-
-
-builder.add_edge(START, "assistant")
-builder.add_conditional_edges(
-    "assistant",
-    # If the latest message (result) from assistant is a tool call -> tools_condition routes to tools
-    # If the latest message (result) from assistant is a not a tool call -> tools_condition routes to END
-    tools_condition,
-)
-builder.add_edge("tools", "assistant")
-graph: CompiledStateGraph = builder.compile()
\ No newline at end of file
+def assistant_route(state: AgentState):
+    """
+    Cheap model while it is still choosing searches, the final-itinerary model once every
+    planned search (hotels and both image sets per city) has come back, failed or not
+    """
+    try:
+        planned = {(search["city"], search["purpose"]) for search in plan_searches(state)}
+    except ValueError:
+        # No stays to check against: done once any search has come back
+        return "final" if any(isinstance(m, ToolMessage) for m in state["messages"]) else "tools"
+    return "final" if planned <= recorded_searches(state).keys() else "tools"
+
+
+async def assistant(state: AgentState)->AgentState:
+    system_messages = get_system_messages(state)
+    messages, tokens_before, tokens_after = compact_messages(
+        state["messages"], reserved_tokens=sum(message_tokens(m) for m in system_messages)
+    )
+    compaction_stats.record(tokens_before, tokens_after)
+    log_payload(logger, "Assistant prompt", [m.content for m in system_messages + messages])
+    response = await invoke_llm(system_messages + messages, route=assistant_route(state), tools=tools)
+    prompt_cache_stats.record(response)
+    return {
+        "messages": [response],
+        "tokens_saved": tokens_before - tokens_after,
+    }
+
+
+tools_by_name = {t.name: t for t in tools}
+
+
+async def prefetch(state: AgentState)->AgentState:
+    searches = plan_searches(state)
+    logger.info("Prefetching %d searches for %s", len(searches), normalize_cities(state["city"]))
+    return {"tool_results": await run_searches(searches, tools_by_name)}
+
+
+def optimize(state: AgentState)->AgentState:
+    plan = optimize_budget(state)
+    logger.info("Budget plan: PKR %.0f of %s (within budget: %s)", plan["total_cost"], state["budget"], plan["within_budget"])
+    return {"budget_plan": plan}
+
+
+async def write_itinerary(state: AgentState)->AgentState:
+    instructions = (
+        "All hotel and image searches have already been run; do not call any tools. "
+        "Write the final itinerary JSON using only this data (grouped by city):\n"
+        + json.dumps(state["tool_results"], ensure_ascii=False)
+    )
+    if state.get("budget_plan"):
+        instructions += (
+            "\n\nThe hotels, meal budgets, activities, transportation and costs below are already chosen "
+            "to fit the budget. Use them exactly for each day: keep every cost, total_cost and remaining_budget "
+            "as given, and only write the day titles, descriptions, venue names and specific activities "
+            "that match each category:\n"
+            + json.dumps(state["budget_plan"], ensure_ascii=False)
+        )
+    fetched_data = HumanMessage(content=instructions)
+    response = await invoke_llm(get_system_messages(state) + state["messages"] + [fetched_data], route="final")
+    prompt_cache_stats.record(response)
+    return {"messages": [response]}
+
+
+async def edit(state: AgentState)->AgentState:
+    """
+    Apply ``edit_request`` to the stored itinerary: run only the searches the stored results
+    can't answer and write only the days whose city, stay or budget picks changed
+    """
+    new_fields = trip_fields(state["edit_request"])
+    changes = changed_fields(state, new_fields)
+    edited = {**state, **new_fields}
+
+    reused, searches = plan_edit_searches(state, edited)
+    fetched = await run_searches(searches, tools_by_name) if searches else {}
+    tool_results = merge_results(reused, fetched)
+    plan = optimize_budget({**edited, "tool_results": tool_results})
+    draft, paths = edited_draft(state, edited, tool_results, plan)
+    logger.info("Editing itinerary (%s): keeping %d days, writing %d, running %d searches",
+                describe_changes(changes), len(draft["daily_itinerary"]) - len(paths), len(paths), len(searches))
+
+    if paths:
+        cities = path_cities(paths, edited)
+        results = {city: found for city, found in tool_results.items() if city in cities}
+        request = HumanMessage(content=edit_prompt(paths, changes, results, plan))
+        response = await invoke_llm(get_system_messages(edited) + [request], route="final")
+        prompt_cache_stats.record(response)
+        patch, _ = parse_itinerary_text(response.content)
+        draft, _ = apply_patch(draft, patch, paths)
+    # Trips written from a budget plan take their totals from it in validate; others add up their days
+    if not state.get("budget_plan"):
+        draft["total_cost"] = itinerary_cost(draft)
+
+    summary = {
+        "changes": {field: list(values) for field, values in changes.items()},
+        "days_kept": len(draft["daily_itinerary"]) - len(paths),
+        "days_written": len(paths),
+        "searches_reused": sum(len(purposes) for purposes in reused.values()),
+        "searches_run": len(searches),
+    }
+    edit_stats.record(summary["days_kept"], summary["days_written"], summary["searches_reused"], summary["searches_run"])
+    return {
+        **new_fields,
+        "edit_request": {},
+        "edit_summary": summary,
+        "tool_results": tool_results,
+        "budget_plan": plan if state.get("budget_plan") else {},
+        "itinerary": {},
+        "invalid_sections": {},
+        "itinerary_draft": {},
+        "repair_attempts": 0,
+        # validate reads the merged itinerary from the last reply, like a freshly written one
+        "messages": [HumanMessage(content=f"Change the trip: {describe_changes(changes)}"),
+                     AIMessage(content=json.dumps(draft, ensure_ascii=False))],
+    }
+
+
+def final_reply(state: AgentState):
+    for message in reversed(state["messages"]):
+        if isinstance(message, AIMessage) and not message.tool_calls:
+            return message
+    return None
+
+
+def validate(state: AgentState)->AgentState:
+    """
+    Check the final reply against the itinerary schema; broken sections go to ``repair``
+    """
+    reply = final_reply(state)
+    if state.get("invalid_sections"):
+        draft = state["itinerary_draft"]
+        attempts = state.get("repair_attempts", 0)
+    else:
+        draft, complete = parse_itinerary_text(reply.content if reply else "")
+        attempts = 0
+        validation_stats.replies += 1
+        if not complete:
+            logger.info("Itinerary reply was cut off; repairing the missing sections")
+
+    if isinstance(draft, dict):
+        draft = apply_budget_plan(draft, state.get("budget_plan"), state.get("budget"))
+    itinerary, invalid = validate_sections(draft, state.get("days"))
+
+    if invalid and attempts < ITINERARY_REPAIR_ATTEMPTS and quota.degraded("llm"):
+        # Repairs are optional: with LLM quota low the partial itinerary is returned as is
+        logger.info("Skipping repair of %d invalid sections, LLM quota is low", len(invalid))
+    elif invalid and attempts < ITINERARY_REPAIR_ATTEMPTS:
+        logger.info("Itinerary has %d invalid sections: %s", len(invalid), list(invalid))
+        return {"itinerary_draft": draft if isinstance(draft, dict) else {}, "invalid_sections": invalid,
+                "repair_attempts": attempts}
+
+    if not invalid and attempts == 0:
+        validation_stats.valid_first_try += 1
+    if invalid:
+        validation_stats.unrepaired += 1
+    if itinerary.get("daily_itinerary"):
+        itinerary["daily_itinerary"] = [day for day in itinerary["daily_itinerary"] if day is not None]
+        assign_hotel_images(itinerary)
+        refresh_booking_links(itinerary, state)
+
+    update = {"itinerary": itinerary, "itinerary_errors": invalid, "invalid_sections": {}, "itinerary_draft": {},
+              "repair_attempts": attempts}
+    if reply is not None and itinerary:
+        # Same id, so the reply in the history is replaced by the validated document
+        update["messages"] = [AIMessage(content=json.dumps(itinerary, ensure_ascii=False), id=reply.id)]
+    return update
+
+
+async def repair(state: AgentState)->AgentState:
+    """
+    Ask the model to re-emit only the invalid sections and merge them into the draft
+    """
+    invalid = state["invalid_sections"]
+    request = HumanMessage(content=repair_prompt(state["itinerary_draft"], invalid, state.get("budget_plan")))
+    system_messages = get_system_messages(state)
+    messages, _, _ = compact_messages(
+        state["messages"], reserved_tokens=sum(message_tokens(m) for m in system_messages + [request])
+    )
+    response = await invoke_llm(system_messages + messages + [request], route="repair")
+    prompt_cache_stats.record(response)
+
+    patch, _ = parse_itinerary_text(response.content)
+    draft, applied = apply_patch(state["itinerary_draft"], patch, invalid)
+    validation_stats.repair_calls += 1
+    validation_stats.sections_repaired += len(applied)
+    return {"itinerary_draft": draft, "repair_attempts": state.get("repair_attempts", 0) + 1}
+
+
+def tools_condition(state: AgentState):
+    """
+    "tools" while the assistant is asking for tool calls, END once it answers
+    (same as langgraph.prebuilt.tools_condition, without importing the prebuilt agents)
+    """
+    last_message = state["messages"][-1]
+    return "tools" if isinstance(last_message, AIMessage) and last_message.tool_calls else END
+
+
+def route_itinerary(state: AgentState):
+    return "repair" if state.get("invalid_sections") else END
+
+
+def add_validation(builder: StateGraph):
+    builder.add_node("validate", traced_node("validate", validate))
+    builder.add_node("repair", traced_node("repair", repair))
+    builder.add_conditional_edges("validate", route_itinerary, ["repair", END])
+    builder.add_edge("repair", "validate")
+
+
+def add_entry(builder: StateGraph, first_node: str):
+    """
+    Start at ``first_node``, or at ``edit`` when the run edits a stored itinerary
+    """
+    builder.add_node("edit", traced_node("edit", edit))
+    builder.add_conditional_edges(
+        START, lambda state: "edit" if state.get("edit_request") else first_node, ["edit", first_node]
+    )
+    builder.add_edge("edit", "validate")
+
+
+def build_graph(mode: str = "agent", checkpointer=None) -> CompiledStateGraph:
+    """
+    Build the itinerary graph, optionally persisting state per thread with ``checkpointer``.
+
+    - "agent": the model drives tool calls, looping assistant -> tools until it answers.
+    - "prefetch": searches are derived from the request and run up front, a budget optimizer
+      picks hotels, meals and activities, then a single model call writes the itinerary.
+
+    Either way the final reply is validated, and only its invalid sections are sent back for repair.
+    A run with ``edit_request`` set goes through ``edit`` instead, which rewrites the stored
+    itinerary for the changed trip.
+    """
+    builder: StateGraph = StateGraph(AgentState)
+
+    if mode == "prefetch":
+        builder.add_node("prefetch", traced_node("prefetch", prefetch))
+        builder.add_node("optimize", traced_node("optimize", optimize))
+        builder.add_node("assistant", traced_node("assistant", write_itinerary))
+        add_entry(builder, "prefetch")
+        builder.add_edge("prefetch", "optimize")
+        builder.add_edge("optimize", "assistant")
+        builder.add_edge("assistant", "validate")
+        add_validation(builder)
+        return builder.compile(checkpointer=checkpointer)
+
+    if mode != "agent":
+        raise ValueError(f"Unknown graph mode: {mode!r}")
+
+    builder.add_node("assistant", traced_node("assistant", assistant))
+    builder.add_node("tools", traced_node("tools", ParallelToolNode(tools)))
+    add_validation(builder)
+
+
+    add_entry(builder, "assistant")
+    builder.add_conditional_edges(
+        "assistant",
+        # If the latest message (result) from assistant is a tool call -> tools_condition routes to tools
+        # If the latest message (result) from assistant is a not a tool call -> tools_condition routes to END,
+        # which here means on to validation
+        tools_condition,
+        {"tools": "tools", END: "validate"},
+    )
+    builder.add_edge("tools", "assistant")
+    return builder.compile(checkpointer=checkpointer)
+
+
+# Module attributes built on first access (``agent.graph`` from langgraph.json, the router from
+# the nodes) and then cached as ordinary globals; assigning one, e.g. a fake router, overrides it.
+LAZY_ATTRIBUTES = {
+    "graph": lambda: build_graph(GRAPH_MODE),
+    "prefetch_graph": lambda: build_graph("prefetch"),
+    "llm_router": build_router,
+}
+
+
+_lazy_lock = threading.RLock()
+
+
+def __getattr__(name):
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    # Background warm-up builds these in a thread; a request arriving meanwhile waits for it
+    with _lazy_lock:
+        if name not in globals():
+            globals()[name] = LAZY_ATTRIBUTES[name]()
+        return globals()[name]
+
+
+def warm_up():
+    """
+    Build the router and bind the tools ahead of the first request (imports provider SDKs)
+    """
+    router = get_llm_router()
+    for endpoints in router.routes.values():
+        for endpoint in endpoints:
+            endpoint.bound(tools)
+    return router
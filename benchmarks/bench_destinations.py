@@ -0,0 +1,113 @@
+"""
+Trips planned with and without a destination pack built from their own recorded searches.
+
+    python -m benchmarks.bench_destinations --mode prefetch --serp-latency 0.3 --llm-latency 1.0
+
+Records a set of trips with REPLAY_MODE=record against the offline fakes (as in load_test),
+builds a pack from that recording, then plans the trips again (different dates, so nothing is
+shared through caches) without and with the pack. Reports SerpAPI searches and wall time for
+both passes, what went into the pack, and the cost of a pack lookup in microseconds.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+import timeit
+
+from benchmarks.fake_serpapi import FakeSerpApi
+from benchmarks.load_test import configure_environment, install_fake_llm
+
+
+CITIES = ["Lahore", "Islamabad", "Hunza", "Skardu", "Karachi", "Swat"]
+LOOKUPS = 100000
+
+
+def trips(travel_date):
+    # Two cities per trip, each city in two trips
+    pairs = [(CITIES[i], CITIES[(i + 1) % len(CITIES)]) for i in range(len(CITIES))]
+    return [
+        {"budget": 200000, "companions": 2, "interests": ["culture", "food"], "days": 4,
+         "city": ", ".join(pair), "travel_date": travel_date}
+        for pair in pairs
+    ]
+
+
+async def plan(app, payloads, serp):
+    import httpx
+
+    searches = sum(serp.requests.values())
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            responses = await asyncio.gather(*(client.post("/create_itinerary", json=p) for p in payloads))
+    for response in responses:
+        response.raise_for_status()
+    return {"seconds": round(time.perf_counter() - started, 3), "searches": sum(serp.requests.values()) - searches}
+
+
+def lookup_micros(pack, city):
+    query = f"{city} Pakistan tourism photos"
+    images = timeit.timeit(lambda: pack.images(query), number=LOOKUPS)
+    costs = timeit.timeit(lambda: pack.city(city, "meal_plans"), number=LOOKUPS)
+    return {"images": round(images / LOOKUPS * 1e6, 3), "city_costs": round(costs / LOOKUPS * 1e6, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["agent", "prefetch"], default="prefetch")
+    parser.add_argument("--serp-latency", type=float, default=0.3)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    # load_test's settings, without its jitter and truncation
+    args.serp_jitter = args.llm_jitter = args.truncate_rate = 0.0
+    args.cache = False
+
+    with tempfile.TemporaryDirectory(prefix="destinations-") as directory:
+        os.environ["REPLAY_MODE"] = "record"
+        os.environ["REPLAY_DIR"] = os.path.join(directory, "replay")
+        os.environ.setdefault("CHECKPOINTER", "memory")
+
+        with FakeSerpApi(latency=args.serp_latency, jitter=0) as serp:
+            configure_environment(args, serp.url)
+            import main as app_module
+            from destinations import build_pack, destination_pack
+            from replay import fixture_store
+
+            install_fake_llm(args)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                asyncio.run(plan(app_module.app, trips("2025-06-01"), serp))
+                fixture_store.mode = "off"
+                pack_path = os.path.join(directory, "destinations.sqlite")
+                built = build_pack(os.environ["REPLAY_DIR"], pack_path)
+
+                payloads = trips("2025-07-01")
+                without_pack = asyncio.run(plan(app_module.app, payloads, serp))
+                destination_pack.open(pack_path)
+                with_pack = asyncio.run(plan(app_module.app, payloads, serp))
+
+        report = {
+            "trips": len(payloads),
+            "pack": {"image_queries": built["image_queries"], "cities": len(built["cities"]),
+                     "bytes": os.path.getsize(pack_path)},
+            "without_pack": without_pack,
+            "with_pack": with_pack,
+            "lookup_us": lookup_micros(destination_pack, CITIES[0]),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    pack = report["pack"]
+    print(f"pack: {pack['image_queries']} image queries, {pack['cities']} cities, {pack['bytes']} bytes")
+    for name in ("without_pack", "with_pack"):
+        print(f"{name:<14}" + "  ".join(f"{key}={value}" for key, value in report[name].items()))
+    print("lookup_us     " + "  ".join(f"{key}={value}" for key, value in report["lookup_us"].items()))
+
+
+if __name__ == "__main__":
+    main()
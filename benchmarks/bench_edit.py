@@ -0,0 +1,108 @@
+"""
+Cost of editing a stored itinerary against generating the edited trip from scratch.
+
+    python -m benchmarks.bench_edit --mode prefetch --serp-latency 0.3 --llm-latency 1.0
+
+Creates one itinerary, then applies each edit to a copy of it with POST /edit_itinerary and
+generates the same edited trip with POST /create_itinerary, offline as in load_test.
+Reports latency, SerpAPI searches and LLM calls for both, and how many days the edit kept.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import time
+import uuid
+
+from benchmarks.fake_serpapi import FakeSerpApi
+from benchmarks.load_test import configure_environment, install_fake_llm
+
+
+BASE_TRIP = {
+    "budget": 250000,
+    "interests": ["culture", "food"],
+    "companions": 2,
+    "city": "Lahore, Islamabad, Hunza",
+    "days": 6,
+    "travel_date": "2025-06-01",
+}
+
+EDITS = {
+    "add_day": {"days": 7},
+    "lower_budget": {"budget": 180000},
+    "reorder_cities": {"city": "Hunza, Islamabad, Lahore"},
+    "swap_last_city": {"city": "Lahore, Islamabad, Skardu"},
+    "new_interests": {"interests": ["adventure", "nature"]},
+}
+
+
+def counts(model, serp):
+    return model.counters["llm_turns"], sum(serp.requests.values())
+
+
+async def timed(client, path, payload, model, serp):
+    turns, searches = counts(model, serp)
+    started = time.perf_counter()
+    response = await client.post(path, json=payload)
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    after_turns, after_searches = counts(model, serp)
+    return response.json(), {
+        "seconds": round(elapsed, 3),
+        "searches": after_searches - searches,
+        "llm_calls": after_turns - turns,
+    }
+
+
+async def bench(args, app, model, serp):
+    import httpx
+
+    report = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for name, change in EDITS.items():
+                thread_id = uuid.uuid4().hex
+                await timed(client, "/create_itinerary", {**BASE_TRIP, "thread_id": thread_id}, model, serp)
+                edited, edit_cost = await timed(client, "/edit_itinerary", {**BASE_TRIP, **change, "thread_id": thread_id},
+                                                model, serp)
+                _, full_cost = await timed(client, "/create_itinerary", {**BASE_TRIP, **change}, model, serp)
+                report[name] = {
+                    "edit": {**edit_cost, "days_kept": edited["edit"]["days_kept"],
+                             "days_written": edited["edit"]["days_written"]},
+                    "full": full_cost,
+                }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["agent", "prefetch"], default="prefetch")
+    parser.add_argument("--serp-latency", type=float, default=0.3)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    # load_test's settings, without its jitter and truncation
+    args.serp_jitter = args.llm_jitter = args.truncate_rate = 0.0
+    args.cache = False
+
+    with FakeSerpApi(latency=args.serp_latency, jitter=0) as serp:
+        configure_environment(args, serp.url)
+        os.environ.setdefault("CHECKPOINTER", "memory")
+        import main as app_module
+
+        model = install_fake_llm(args)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = asyncio.run(bench(args, app_module.app, model, serp))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, result in report.items():
+        print(f"{name:<16}edit " + "  ".join(f"{key}={value}" for key, value in result["edit"].items()))
+        print(f"{'':<16}full " + "  ".join(f"{key}={value}" for key, value in result["full"].items()))
+
+
+if __name__ == "__main__":
+    main()
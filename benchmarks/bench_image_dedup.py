@@ -0,0 +1,132 @@
+"""
+Accuracy and cost of perceptual image de-duplication.
+
+    python -m benchmarks.bench_image_dedup --photos 40 --variants 3
+
+Synthetic photos are served from FakeImageServer together with resized, recompressed,
+brightened and cropped copies under unrelated file names, so only pixel hashes can match
+them. Reports how many distinct photos survive (ideal: --photos), copies missed, photos
+wrongly merged, cold and warm-cache time, and HashIndex against a pure-Python scan.
+Needs Pillow and NumPy.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import time
+
+# In-process cache only; must be set before the app modules are imported
+os.environ.setdefault("SERP_CACHE_PATH", "")
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from benchmarks.fake_image_server import FakeImageServer
+from image_dedup import HashIndex, IMAGE_DEDUP_DISTANCE, dedupe_images, hamming, pixel_hashing_available
+
+
+def photo(rng, width=160, height=120):
+    """Smooth random scene: low-resolution noise scaled up, so it has structure like a photo"""
+    coarse = rng.integers(0, 256, size=(6, 8, 3), dtype=np.uint8)
+    return Image.fromarray(coarse).resize((width, height), Image.Resampling.BICUBIC)
+
+
+def variants(image):
+    width, height = image.size
+    return [
+        image.resize((width * 2 // 3, height * 2 // 3)),
+        image,  # recompressed below at a low quality
+        ImageEnhance.Brightness(image).enhance(1.15),
+        image.crop((width // 25, height // 25, width - width // 25, height - height // 25)),
+    ]
+
+
+def jpeg(image, quality=85):
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def build_results(server, photos, copies, seed):
+    rng = np.random.default_rng(seed)
+    shuffle = random.Random(seed)
+    results = []
+    for index in range(photos):
+        base = photo(rng)
+        images = [(base, 85)] + [(variant, 40 if n == 1 else 85) for n, variant in enumerate(variants(base))][:copies]
+        for image, quality in images:
+            name = f"{rng.integers(1 << 40):x}.jpg"
+            thumbnail = server.add_file(name, jpeg(image, quality))
+            results.append({"url": f"https://cdn{shuffle.randint(1, 9)}.example.com/{name}", "thumbnail": thumbnail,
+                            "photo": index})
+    shuffle.shuffle(results)
+    return results
+
+
+async def run(results, photos):
+    started = time.perf_counter()
+    kept = await dedupe_images(results)
+    elapsed = time.perf_counter() - started
+    kept_photos = [image["photo"] for image in kept]
+    return {
+        "kept": len(kept),
+        "missed_copies": len(kept_photos) - len(set(kept_photos)),
+        "merged_photos": photos - len(set(kept_photos)),
+        "seconds": round(elapsed, 3),
+    }
+
+
+def bench_index(size, queries, seed):
+    rng = random.Random(seed)
+    hashes = [rng.getrandbits(64) for _ in range(size)]
+    probes = [rng.getrandbits(64) for _ in range(queries)]
+    index = HashIndex()
+    for value in hashes:
+        index.add(value)
+
+    started = time.perf_counter()
+    index_hits = sum(index.find(p, IMAGE_DEDUP_DISTANCE) is not None for p in probes)
+    index_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    scan_hits = sum(any(hamming(p, h) <= IMAGE_DEDUP_DISTANCE for h in hashes) for p in probes)
+    scan_seconds = time.perf_counter() - started
+    assert index_hits == scan_hits
+    return {"hashes": size, "queries": queries, "hash_index_ms": round(index_seconds * 1000, 2),
+            "linear_scan_ms": round(scan_seconds * 1000, 2)}
+
+
+async def bench(args):
+    with FakeImageServer(latency=args.latency) as server:
+        results = build_results(server, args.photos, args.variants, args.seed)
+        cold = await run(results, args.photos)
+        warm = await run(results, args.photos)
+    return {"images": len(results), "photos": args.photos, "cold": cold, "warm": warm}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=40)
+    parser.add_argument("--variants", type=int, default=3, help="copies of each photo, up to 4")
+    parser.add_argument("--latency", type=float, default=0.02, help="image host latency per request")
+    parser.add_argument("--index-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    if not pixel_hashing_available():
+        parser.error("pixel hashing is unavailable (install Pillow and NumPy, and keep IMAGE_DEDUP_PIXELS=1)")
+
+    report = asyncio.run(bench(args))
+    report["index"] = bench_index(args.index_size, 200, args.seed)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['images']} images of {report['photos']} photos")
+    for name in ("cold", "warm"):
+        print(f"{name:<6}" + "  ".join(f"{key}={value}" for key, value in report[name].items()))
+    print("index " + "  ".join(f"{key}={value}" for key, value in report["index"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Cost and accuracy of image liveness probing against a local image host.
+
+    python -m benchmarks.bench_image_probe --images 70 --batch 10
+
+The same URLs are probed twice: once with an empty verdict cache and once warm. Each
+batch stands for one image_finder call. "wrong" counts images kept or dropped against
+FakeImageServer's expected verdict; slow images missing the deadline are kept and counted
+as unverified instead.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks.fake_image_server import EXPECTED_LIVE, FakeImageServer
+from benchmarks.load_test import percentile
+from cache import TwoTierCache
+from image_probe import ImageProber
+
+
+async def run(prober, urls, batch):
+    latencies = []
+    kept = set()
+    started = time.perf_counter()
+    for offset in range(0, len(urls), batch):
+        images = [{"url": url} for url in urls[offset:offset + batch]]
+        call_started = time.perf_counter()
+        kept.update(image["url"] for image in await prober.filter_live(images))
+        latencies.append(time.perf_counter() - call_started)
+    wall = time.perf_counter() - started
+
+    wrong = sum(1 for url in urls if (url in kept) != EXPECTED_LIVE[url.split("/")[3]])
+    return {
+        "p50": round(percentile(latencies, 50), 3),
+        "max": round(max(latencies), 3),
+        "kept": len(kept),
+        "wrong": wrong,
+        "wall_seconds": round(wall, 3),
+    }
+
+
+async def bench(args):
+    with FakeImageServer(latency=args.latency, slow_latency=args.slow_latency) as server:
+        urls = server.urls(args.images)
+        prober = ImageProber(deadline=args.deadline, max_concurrency=args.concurrency, cache=TwoTierCache(path=""))
+        cold = await run(prober, urls, args.batch)
+        # Let probes that missed the deadline land in the cache
+        await asyncio.sleep(args.slow_latency)
+        probed_cold = prober.stats["probed"]
+        warm = await run(prober, urls, args.batch)
+        await prober.aclose()
+        return {
+            "cold": {**cold, "probes": probed_cold},
+            "warm": {**warm, "probes": prober.stats["probed"] - probed_cold},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=70)
+    parser.add_argument("--batch", type=int, default=10, help="images per image_finder call")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="image host latency per request")
+    parser.add_argument("--slow-latency", type=float, default=1.0)
+    parser.add_argument("--deadline", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(bench(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    columns = list(report["cold"])
+    print(f"{'':<6}" + "".join(f"{c:>14}" for c in columns))
+    for name, row in report.items():
+        print(f"{name:<6}" + "".join(f"{row[c]:>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
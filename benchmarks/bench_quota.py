@@ -0,0 +1,123 @@
+"""
+How QuotaScheduler shares a SerpAPI budget between clients and lanes, in simulated time.
+
+    python -m benchmarks.bench_quota --minutes 5 --per-minute 60 --burst 30
+
+One noisy client sends far more than its share, a few quiet clients send a little, and a
+high-lane client (a priority job) sends steadily. Everything runs on SimulatedClock, so
+minutes of traffic take milliseconds and the results are the same on every run. Reports,
+per client, calls granted and rejected and the wait before a grant, and checks that the
+global bucket never let through more than its burst plus its refill.
+"""
+import argparse
+import asyncio
+import json
+import os
+
+# Rejections are the point of the benchmark; don't log each one. Set before the app modules are imported
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from quota import QuotaExceededError, QuotaScheduler, SimulatedClock
+
+
+STEP_SECONDS = 0.1
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def traffic(args):
+    """(client, lane, seconds between calls) per simulated caller"""
+    callers = [("noisy", "normal", 1 / args.noisy_rate)]
+    callers += [(f"quiet-{n}", "normal", args.quiet_interval) for n in range(args.quiet_clients)]
+    callers += [("priority-job", "high", args.priority_interval)]
+    callers += [("batch", "low", args.quiet_interval / 2)]
+    return callers
+
+
+async def simulate(args):
+    clock = SimulatedClock()
+    limits = {"serpapi": (args.per_minute, args.burst, args.client_per_minute, args.client_burst)}
+    scheduler = QuotaScheduler(limits, clock=clock, wait_seconds=args.wait)
+    report = {}
+    tasks = []
+
+    async def call(client, lane):
+        started = clock.now()
+        stats = report[client]
+        try:
+            await scheduler.acquire("serpapi", client=client, lane=lane)
+        except QuotaExceededError:
+            stats["rejected"] += 1
+            return
+        stats["granted"] += 1
+        stats["waits"].append(clock.now() - started)
+
+    callers = traffic(args)
+    for client, lane, _ in callers:
+        report[client] = {"lane": lane, "granted": 0, "rejected": 0, "waits": []}
+    next_call = {client: 0.0 for client, _, _ in callers}
+    duration = args.minutes * 60
+    while clock.now() < duration:
+        for client, lane, interval in callers:
+            while next_call[client] <= clock.now():
+                tasks.append(asyncio.ensure_future(call(client, lane)))
+                next_call[client] += interval
+        await clock.advance(STEP_SECONDS)
+    # Let queued calls finish or hit their deadline
+    while not all(task.done() for task in tasks):
+        await clock.advance(STEP_SECONDS)
+
+    granted = sum(stats["granted"] for stats in report.values())
+    ceiling = args.burst + args.per_minute * clock.now() / 60
+    clients = {
+        client: {
+            "lane": stats["lane"],
+            "granted": stats["granted"],
+            "rejected": stats["rejected"],
+            "p50_wait": round(percentile(stats["waits"], 50), 2),
+            "p95_wait": round(percentile(stats["waits"], 95), 2),
+        }
+        for client, stats in report.items()
+    }
+    return {
+        "simulated_seconds": round(clock.now(), 1),
+        "granted": granted,
+        "global_ceiling": round(ceiling, 1),
+        "within_budget": granted <= ceiling,
+        "clients": clients,
+        "scheduler": scheduler.snapshot()["serpapi"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, default=5)
+    parser.add_argument("--per-minute", type=float, default=60, help="global SerpAPI budget")
+    parser.add_argument("--burst", type=float, default=30)
+    parser.add_argument("--client-per-minute", type=float, default=20)
+    parser.add_argument("--client-burst", type=float, default=10)
+    parser.add_argument("--wait", type=float, default=10, help="seconds a call may queue")
+    parser.add_argument("--noisy-rate", type=float, default=5, help="noisy client calls per second")
+    parser.add_argument("--quiet-clients", type=int, default=4)
+    parser.add_argument("--quiet-interval", type=float, default=10, help="seconds between a quiet client's calls")
+    parser.add_argument("--priority-interval", type=float, default=5)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(simulate(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['simulated_seconds']}s simulated: {report['granted']} granted "
+          f"(ceiling {report['global_ceiling']}, within budget: {report['within_budget']})")
+    for client, stats in report["clients"].items():
+        print(f"{client:<14}" + "  ".join(f"{key}={value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Record itineraries against the offline fakes, then replay them with no upstream at all.
+
+    python -m benchmarks.bench_replay --mode prefetch --trips 3 --serp-latency 0.3 --llm-latency 1.0
+
+The record pass runs with REPLAY_MODE=record behind FakeSerpApi and ScriptedChatModel, as in
+load_test. The replay pass switches the fixture store to replay, shuts the fake SerpAPI down,
+drops the API keys and the fake model, and asks for the same trips again. Reports fixtures
+written (files and compressed bytes per kind), wall time for both passes, and whether every
+replayed itinerary matches its recording. ``--latency-scale 1`` replays with recorded latencies.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.fake_serpapi import FakeSerpApi
+from benchmarks.load_test import configure_environment, install_fake_llm
+
+
+TRIPS = [
+    {"city": "Lahore, Islamabad", "days": 4, "interests": ["culture", "food"]},
+    {"city": "Hunza, Skardu", "days": 5, "interests": ["adventure", "nature"]},
+    {"city": "Karachi", "days": 3, "interests": ["food", "shopping"]},
+    {"city": "Islamabad, Murree, Swat", "days": 6, "interests": ["nature", "history"]},
+]
+
+
+def payload(trip):
+    return {"budget": 200000, "companions": 2, "travel_date": "2025-06-01", **trip}
+
+
+async def run_trips(app, trips):
+    import httpx
+
+    itineraries = []
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            for trip in trips:
+                response = await client.post("/create_itinerary", json=payload(trip))
+                response.raise_for_status()
+                # The last node's update, e.g. {"validate": {"itinerary": ...}}
+                update = next(value for key, value in response.json().items() if key != "thread_id")
+                itineraries.append(update.get("itinerary"))
+    return itineraries, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["agent", "prefetch"], default="prefetch")
+    parser.add_argument("--trips", type=int, default=3, choices=range(1, len(TRIPS) + 1))
+    parser.add_argument("--serp-latency", type=float, default=0.3)
+    parser.add_argument("--llm-latency", type=float, default=1.0)
+    parser.add_argument("--latency-scale", type=float, default=0.0, help="share of recorded latency to replay")
+    parser.add_argument("--dir", help="fixture directory (a temporary one by default)")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+    # load_test's settings, without its jitter and truncation; no cache, so every call reaches the store
+    args.serp_jitter = args.llm_jitter = args.truncate_rate = 0.0
+    args.cache = False
+    trips = TRIPS[:args.trips]
+
+    with contextlib.ExitStack() as stack:
+        directory = args.dir or stack.enter_context(tempfile.TemporaryDirectory(prefix="replay-"))
+        os.environ["REPLAY_MODE"] = "record"
+        os.environ["REPLAY_DIR"] = directory
+        os.environ["REPLAY_LATENCY_SCALE"] = str(args.latency_scale)
+        os.environ.setdefault("CHECKPOINTER", "memory")
+
+        with FakeSerpApi(latency=args.serp_latency, jitter=0) as serp:
+            configure_environment(args, serp.url)
+            import agent
+            import main as app_module
+            from replay import fixture_store
+
+            install_fake_llm(args)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                recorded, record_seconds = asyncio.run(run_trips(app_module.app, trips))
+            searches = sum(serp.requests.values())
+
+        # Nothing live is left: the fake SerpAPI is down, and the router is rebuilt from real
+        # provider specs without keys on first use
+        fixture_store.mode = "replay"
+        fixture_store._loaded.clear()
+        for name in ("OPENAI_API_KEY", "SERPAPI_API_KEY", "GOOGLE_API_KEY"):
+            os.environ.pop(name, None)
+        del agent.llm_router
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            replayed, replay_seconds = asyncio.run(run_trips(app_module.app, trips))
+
+        stats = fixture_store.snapshot()
+        report = {
+            "trips": len(trips),
+            "record_seconds": round(record_seconds, 3),
+            "replay_seconds": round(replay_seconds, 3),
+            "live_searches": searches,
+            "fixtures": {kind: {"files": files, "bytes": size} for kind, (files, size) in fixture_store.fixtures().items()},
+            "recorded": stats["recorded"],
+            "replayed": stats["replayed"],
+            "misses": stats["misses"],
+            "identical": recorded == replayed and all(recorded),
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['trips']} trips: record {report['record_seconds']}s ({report['live_searches']} searches), "
+          f"replay {report['replay_seconds']}s, identical: {report['identical']}")
+    for kind, fixtures in report["fixtures"].items():
+        print(f"{kind:<12}files={fixtures['files']}  bytes={fixtures['bytes']}")
+    print(f"calls recorded={report['recorded']}  replayed={report['replayed']}  misses={report['misses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Tail latency of LLM calls through llm_router when the primary provider degrades.
+
+    python -m benchmarks.bench_router --calls 300 --concurrency 20 --tail-rate 0.1 --tail-latency 2.0
+
+Both providers are ScriptedChatModel instances, so no keys or network are needed. The same
+workload runs with hedging off and on; add --error-rate to watch retries and the breaker.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from scripted_llm import ScriptedChatModel
+from benchmarks.load_test import percentile
+from llm_router import CircuitBreaker, LLMRouter, ModelEndpoint, RetryBudget
+
+
+MESSAGES = [
+    SystemMessage(content="Trip request:\n    - Destination: Lahore\n    - Duration: 3 days"),
+    HumanMessage(content="Plan my trip to Pakistan"),
+]
+
+
+def build(args, hedge_percentile):
+    primary = ScriptedChatModel(latency=args.latency, jitter=args.jitter, tail_rate=args.tail_rate,
+                                tail_latency=args.tail_latency, error_rate=args.error_rate)
+    backup = ScriptedChatModel(latency=args.backup_latency, jitter=args.jitter)
+    endpoints = [
+        ModelEndpoint("primary", primary, CircuitBreaker(args.breaker_failures, args.breaker_reset)),
+        ModelEndpoint("backup", backup, CircuitBreaker(args.breaker_failures, args.breaker_reset)),
+    ]
+    return LLMRouter({"final": endpoints}, hedge_percentile=hedge_percentile, hedge_min_samples=args.min_samples,
+                     retry_budget=RetryBudget(args.budget_ratio, args.budget_burst))
+
+
+async def run(router, args):
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await router.ainvoke(MESSAGES, route="final")
+            except Exception:
+                failures += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.calls)))
+    wall = time.perf_counter() - started
+    stats = router.snapshot()
+    return {
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+        "p99": round(percentile(latencies, 99), 3),
+        "max": round(max(latencies), 3),
+        "failures": failures,
+        "hedges": stats["hedges"],
+        "hedge_wins": stats["hedge_wins"],
+        "retries": stats["retries"],
+        "breaker_trips": stats["models"]["primary"]["breaker_trips"],
+        "wall_seconds": round(wall, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.2, help="primary's normal latency")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--tail-rate", type=float, default=0.1, help="share of primary calls that stall")
+    parser.add_argument("--tail-latency", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of primary calls that fail")
+    parser.add_argument("--backup-latency", type=float, default=0.3)
+    parser.add_argument("--hedge-percentile", type=float, default=90)
+    parser.add_argument("--min-samples", type=int, default=20)
+    parser.add_argument("--budget-ratio", type=float, default=0.2)
+    parser.add_argument("--budget-burst", type=float, default=10)
+    parser.add_argument("--breaker-failures", type=int, default=5)
+    parser.add_argument("--breaker-reset", type=float, default=1.0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    report = {
+        "no_hedging": asyncio.run(run(build(args, 0), args)),
+        "hedging": asyncio.run(run(build(args, args.hedge_percentile), args)),
+    }
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    columns = list(report["hedging"])
+    print(f"{'':<12}" + "".join(f"{c:>14}" for c in columns))
+    for name, row in report.items():
+        print(f"{name:<12}" + "".join(f"{row[c]:>14}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Cold-start cost of the API: import time, startup, and the first itinerary request.
+
+    python -m benchmarks.bench_startup --runs 5
+
+Every measurement runs in a fresh interpreter. "eager" is what importing the app used to
+cost: importing agent plus building the LLM client, binding tools and compiling the graph.
+The first request runs offline against FakeSerpApi, with ScriptedChatModel swapped in
+after the real LLM clients are built. "idle" leaves --idle seconds between startup and the
+first request, as when an instance boots ahead of traffic.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+PAYLOAD = {"budget": 150000, "interests": ["culture"], "companions": 2, "city": "Lahore",
+           "days": 2, "travel_date": "2025-06-01"}
+
+
+def child_import():
+    started = time.perf_counter()
+    import main  # noqa: F401
+    return {"import_main": time.perf_counter() - started}
+
+
+def child_eager():
+    started = time.perf_counter()
+    import main  # noqa: F401
+    import agent
+    agent.warm_up()
+    agent.graph
+    return {"eager_import": time.perf_counter() - started}
+
+
+def child_first_request(warmup, delay):
+    from benchmarks.fake_serpapi import FakeSerpApi
+
+    with FakeSerpApi(latency=0, jitter=0) as serp:
+        os.environ.update(SERPAPI_BASE_URL=serp.url, SERP_CACHE_PATH="", CHECKPOINTER="memory",
+                          STARTUP_WARMUP=warmup, LOG_LEVEL="WARNING",
+                          IMAGE_PROBE_ENABLED="0", IMAGE_DEDUP_PIXELS="0")
+        started = time.perf_counter()
+        import httpx
+        import main
+        imported = time.perf_counter()
+
+        build_router = main.agent.LAZY_ATTRIBUTES["llm_router"]
+
+        def build_then_fake():
+            # The real clients are built (by warm-up or on first use) but the calls go to the fake
+            from scripted_llm import ScriptedChatModel
+            router = build_router()
+            for endpoint in router.endpoints().values():
+                endpoint.model = ScriptedChatModel()
+            return router
+
+        main.agent.LAZY_ATTRIBUTES["llm_router"] = build_then_fake
+
+        async def run():
+            async with main.app.router.lifespan_context(main.app):
+                ready = time.perf_counter()
+                # Time between the process being ready and traffic arriving
+                await asyncio.sleep(delay)
+                transport = httpx.ASGITransport(app=main.app)
+                async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+                    sent = time.perf_counter()
+                    response = await client.post("/create_itinerary", json=PAYLOAD)
+                    response.raise_for_status()
+                return ready, sent, time.perf_counter()
+
+        ready, sent, answered = asyncio.run(run())
+    return {
+        "import_main": imported - started,
+        "startup": ready - imported,
+        "first_request": answered - sent,
+    }
+
+
+def run_child(args):
+    # Building the OpenAI client needs a key, but nothing is sent
+    env = {"OPENAI_API_KEY": "offline-benchmark", **os.environ}
+    output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child", *args],
+                            check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--idle", type=float, default=3.0, help="seconds between startup and the first request")
+    parser.add_argument("--child", nargs="+", help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        phase = args.child[0]
+        if phase == "import":
+            result = child_import()
+        elif phase == "eager":
+            result = child_eager()
+        else:
+            result = child_first_request(args.child[1], float(args.child[2]))
+        print(json.dumps(result))
+        return
+
+    scenarios = {
+        "import only": ["import"],
+        "eager (old behaviour)": ["eager"],
+        "warm-up off": ["request", "off", "0"],
+        "warm-up blocking": ["request", "blocking", "0"],
+        "background, no idle": ["request", "background", "0"],
+        "background, idle": ["request", "background", str(args.idle)],
+    }
+    report = {}
+    for name, child_args in scenarios.items():
+        samples = [run_child(child_args) for _ in range(args.runs)]
+        report[name] = {key: round(statistics.median(s[key] for s in samples), 3) for key in samples[0]}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    for name, values in report.items():
+        print(f"{name:<24}" + "  ".join(f"{key}={value:.3f}s" for key, value in values.items()))
+
+
+if __name__ == "__main__":
+    main()
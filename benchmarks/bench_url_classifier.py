@@ -0,0 +1,128 @@
+"""
+Per-URL cost of image filtering and booking-URL validation.
+
+    python -m benchmarks.bench_url_classifier --sizes 100 200 500
+
+Compares url_classifier against the previous per-pattern implementation, kept
+below as ``legacy_*`` purely as a baseline.
+"""
+import argparse
+import json
+import os
+import re
+import timeit
+from urllib.parse import urlparse
+
+import url_classifier
+from benchmarks.fake_serpapi import FIXTURES_DIR
+
+
+def legacy_is_problematic_url(url):
+    if not url:
+        return True
+    for pattern in [
+        r'lh\d+\.googleusercontent\.com/p/', r'drive\.google\.com', r'photos\.google\.com',
+        r'\.trvl-media\.com', r'booking\.com.*images', r'expedia\.com.*images',
+        r'.*[?&](token|auth|signature|expires)=', r'lh\d+\.googleusercontent\.com.*=s\d+$',
+        r'.*[?&](utm_|fbclid|gclid)',
+    ]:
+        if re.search(pattern, url, re.IGNORECASE):
+            return True
+    return False
+
+
+def legacy_filter_reliable_images(image_results, max_images=10):
+    reliable_images = []
+    preferred_domains = ['upload.wikimedia.org', 'commons.wikimedia.org', 'unsplash.com', 'pixabay.com',
+                         'pexels.com', 'flickr.com', 'staticflickr.com']
+    for img in image_results:
+        if len(reliable_images) >= max_images:
+            break
+        for url in [img.get('original'), img.get('link'), img.get('thumbnail'), img.get('source')]:
+            if url and not legacy_is_problematic_url(url):
+                domain = urlparse(url).netloc.lower()
+                if any(pref_domain in domain for pref_domain in preferred_domains):
+                    reliable_images.append({"url": url})
+                    break
+    if len(reliable_images) < max_images:
+        for img in image_results:
+            if len(reliable_images) >= max_images:
+                break
+            for url in [img.get('original'), img.get('link'), img.get('thumbnail'), img.get('source')]:
+                if url and not legacy_is_problematic_url(url):
+                    if not any(existing['url'] == url for existing in reliable_images):
+                        reliable_images.append({"url": url})
+                        break
+    return reliable_images
+
+
+def legacy_is_valid_booking_url(url):
+    if not url or not isinstance(url, str):
+        return False
+    for pattern in ['serpapi.com', 'search.json', 'property_token=', 'engine=google_hotels']:
+        if pattern in url.lower():
+            return False
+    valid_domains = ['sastaticket.pk', 'flypakistan.pk', 'booking.com', 'expedia.com', 'hotels.com', 'agoda.com',
+                     'priceline.com', 'kayak.com', 'trivago.com', 'hotel.com', 'google.com', 'hotelscombined.com']
+    if any(domain in url.lower() for domain in valid_domains):
+        return True
+    if url.startswith(('http://', 'https://')) and '.' in url:
+        return True
+    return False
+
+
+def image_page(size):
+    """
+    A results page of ``size`` images built from the recorded fixture.
+
+    Preferred-domain images are pushed to the end so both implementations
+    have to scan the whole page, which is the expensive case.
+    """
+    with open(os.path.join(FIXTURES_DIR, "google_images.json")) as f:
+        template = json.load(f)["images_results"]
+    page = []
+    for i in range(size):
+        img = dict(template[i % len(template)])
+        for field in ("original", "link", "thumbnail"):
+            img[field] = img[field].replace("{query_slug}", f"lahore-{i}")
+        page.append(img)
+    page.sort(key=lambda img: "wikimedia" in img["original"] or "flickr" in img["original"])
+    return page
+
+
+def booking_urls(size):
+    base = [
+        "https://www.booking.com/hotel/pk/serena.html", "https://serpapi.com/search.json?engine=google_hotels",
+        "https://www.sastaticket.pk/hotels/search?destination=Lahore", "agoda.com/pc-lahore",
+        "https://www.pc.com.pk/lahore?property_token=abc", "hotel-lahore",
+    ]
+    return [base[i % len(base)] + f"&n={i}" for i in range(size)]
+
+
+def per_call_us(fn, repeat):
+    best = min(timeit.repeat(fn, number=repeat, repeat=5))
+    return best / repeat * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 200, 500])
+    parser.add_argument("--max-images", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    print(f"{'benchmark':<28}{'size':>6}{'legacy us/url':>16}{'new us/url':>14}{'speedup':>10}")
+    for size in args.sizes:
+        page = image_page(size)
+        legacy = per_call_us(lambda: legacy_filter_reliable_images(page, args.max_images), args.repeat) / size
+        new = per_call_us(lambda: url_classifier.filter_reliable_images(page, args.max_images), args.repeat) / size
+        print(f"{'filter_reliable_images':<28}{size:>6}{legacy:>16.2f}{new:>14.2f}{legacy / new:>9.1f}x")
+
+        urls = booking_urls(size)
+        legacy = per_call_us(lambda: [legacy_is_valid_booking_url(u) for u in urls], args.repeat) / size
+        new = per_call_us(lambda: [url_classifier.is_valid_booking_url(u) for u in urls], args.repeat) / size
+        print(f"{'is_valid_booking_url':<28}{size:>6}{legacy:>16.2f}{new:>14.2f}{legacy / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
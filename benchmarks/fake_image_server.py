@@ -0,0 +1,135 @@
+"""
+Stand-in image host for exercising image_probe and image_dedup offline.
+
+The first path segment picks the behaviour, anything after it is ignored:
+
+    /good/...      200 image/jpeg, 40 KB
+    /broken/...    404
+    /html/...      200 text/html (a "not found" page served with 200)
+    /tiny/...      200 image/gif, 43 bytes (tracking pixel)
+    /slow/...      a good image after ``slow_latency`` seconds
+    /hotlink/...   403 when the Referer is another site, otherwise a good image
+    /nohead/...    405 to HEAD, a good image to GET
+    /files/<name>  whatever was registered with ``add_file``, else 404
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+KINDS = ("good", "broken", "html", "tiny", "slow", "hotlink", "nohead")
+# What image_probe should decide for each kind ("slow" depends on the deadline)
+EXPECTED_LIVE = {"good": True, "broken": False, "html": False, "tiny": False, "slow": True,
+                 "hotlink": False, "nohead": True}
+
+IMAGE_BYTES = b"\xff\xd8\xff\xe0" + b"\0" * (40 * 1024)
+PIXEL_BYTES = b"GIF89a" + b"\0" * 37
+
+
+class FakeImageServer:
+    """
+    Threaded HTTP server with one path prefix per failure mode.
+
+    ``latency`` applies to every response, ``slow_latency`` to ``/slow/``. ``requests``
+    counts requests per (method, kind).
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.01, slow_latency=5.0):
+        self.latency = latency
+        self.slow_latency = slow_latency
+        self.requests = {}
+        self.files = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self, count, seed=0):
+        """``count`` distinct image URLs, cycling through every kind in a shuffled order"""
+        rng = random.Random(seed)
+        kinds = [KINDS[i % len(KINDS)] for i in range(count)]
+        rng.shuffle(kinds)
+        return [f"{self.url}/{kind}/{i}.jpg" for i, kind in enumerate(kinds)]
+
+    def add_file(self, name, body, content_type="image/jpeg"):
+        self.files[name] = (content_type, body)
+        return f"{self.url}/files/{name}"
+
+    def respond(self, method, kind, referer, has_range, path=""):
+        """(status, content type, body) for a request"""
+        if kind == "files":
+            content_type, body = self.files.get(path.split("/files/", 1)[-1], ("text/plain", None))
+            return (404, content_type, b"not found") if body is None else (200, content_type, body)
+        if kind == "broken":
+            return 404, "text/plain", b"not found"
+        if kind == "html":
+            return 200, "text/html; charset=utf-8", b"<html><body>Image not found</body></html>"
+        if kind == "tiny":
+            return 200, "image/gif", PIXEL_BYTES
+        if kind == "hotlink" and referer and not referer.startswith(self.url):
+            return 403, "text/plain", b"hotlinking not allowed"
+        if kind == "nohead" and method == "HEAD":
+            return 405, "", b""
+        if kind in ("good", "slow", "hotlink", "nohead"):
+            return (206 if has_range else 200), "image/jpeg", IMAGE_BYTES
+        return 404, "text/plain", b"unknown kind"
+
+    def _handler(server):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self, method):
+                path = urlparse(self.path).path
+                kind = path.strip("/").split("/")[0]
+                with server._lock:
+                    server.requests[(method, kind)] = server.requests.get((method, kind), 0) + 1
+                time.sleep(server.slow_latency if kind == "slow" else server.latency)
+
+                range_header = self.headers.get("Range", "")
+                status, content_type, body = server.respond(method, kind, self.headers.get("Referer"),
+                                                            bool(range_header), path)
+                total = len(body)
+                if status == 206:
+                    body = body[:1024]
+                self.send_response(status)
+                if content_type:
+                    self.send_header("Content-Type", content_type)
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes 0-{len(body) - 1}/{total}")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if method == "GET":
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                self._serve("HEAD")
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,118 @@
+"""
+Stand-in SerpAPI server that replays recorded fixtures with configurable latency.
+
+Responses come from ``fixtures/<engine>.json`` with ``{query}``/``{query_slug}`` and
+``{city}``/``{city_slug}`` placeholders filled from the request, so every query
+returns distinct but realistic-looking results.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def slugify(text):
+    return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def load_fixtures(directory=FIXTURES_DIR):
+    fixtures = {}
+    for filename in os.listdir(directory):
+        if filename.endswith(".json"):
+            with open(os.path.join(directory, filename)) as f:
+                fixtures[filename[:-len(".json")]] = f.read()
+    return fixtures
+
+
+class FakeSerpApi:
+    """
+    Threaded HTTP server answering ``GET /search`` from fixtures.
+
+    Each response waits ``latency`` seconds plus uniform jitter in ``[0, jitter]``.
+    ``requests`` counts searches per engine.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.3, jitter=0.2, fixtures=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fixtures = fixtures or load_fixtures()
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _delay(self):
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def render(self, engine, query):
+        template = self.fixtures.get(engine)
+        if template is None:
+            return None
+        city = query.split(" Pakistan")[0].strip() or query
+        substitutions = {
+            "{query}": json.dumps(query)[1:-1],
+            "{query_slug}": slugify(query),
+            "{city}": json.dumps(city)[1:-1],
+            "{city_slug}": slugify(city),
+        }
+        for placeholder, value in substitutions.items():
+            template = template.replace(placeholder, value)
+        return template.encode()
+
+    def _handler(server):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                engine = params.get("engine", "")
+                with server._lock:
+                    server.requests[engine] = server.requests.get(engine, 0) + 1
+
+                time.sleep(server._delay())
+                body = server.render(engine, params.get("q", "")) if parsed.path == "/search" else None
+                if body is None:
+                    body = json.dumps({"error": f"No fixture for engine {engine!r}"}).encode()
+                    self.send_response(400)
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,165 @@
+"""
+Drive /create_itinerary offline at a fixed concurrency and report latency and throughput.
+
+    python -m benchmarks.load_test --requests 50 --concurrency 10 --serp-latency 0.3 --llm-latency 1.0
+
+OpenAI is replaced by ScriptedChatModel and SerpAPI by FakeSerpApi, so no keys or
+network are needed. The app runs in-process behind httpx's ASGI transport.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+
+from benchmarks.fake_serpapi import FakeSerpApi
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def build_payload(index, args):
+    cities = args.cities.split(",")
+    return {
+        # Distinct budgets keep requests from being coalesced unless asked to be identical
+        "budget": 150000 if args.identical else 150000 + index,
+        "interests": ["culture", "food"],
+        "companions": 2,
+        "city": ", ".join(cities),
+        "days": args.days,
+        "travel_date": "2025-06-01",
+    }
+
+
+def configure_environment(args, serp_url):
+    # Must happen before the app modules are imported; they read settings at import time
+    os.environ["SERPAPI_BASE_URL"] = serp_url
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    os.environ.setdefault("SERPAPI_API_KEY", "offline-benchmark")
+    os.environ["GRAPH_MODE"] = args.mode
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # Fixture image URLs point at real hosts; bench_image_probe and bench_image_dedup cover these offline
+    os.environ.setdefault("IMAGE_PROBE_ENABLED", "0")
+    os.environ.setdefault("IMAGE_DEDUP_PIXELS", "0")
+    # Measures serving capacity, not admission; bench_quota covers the scheduler
+    os.environ.setdefault("QUOTA_ENABLED", "0")
+    # Measures the live search path; bench_destinations covers the destination pack
+    os.environ.setdefault("DESTINATION_PACK_PATH", "")
+    if not args.cache:
+        os.environ["SERP_CACHE_PATH"] = ""
+        os.environ["SERP_CACHE_HOTEL_TTL"] = "0"
+        os.environ["SERP_CACHE_IMAGE_TTL"] = "0"
+        os.environ["SERP_CACHE_HOTEL_STALE"] = "0"
+        os.environ["SERP_CACHE_IMAGE_STALE"] = "0"
+
+
+def install_fake_llm(args):
+    import agent
+    from scripted_llm import ScriptedChatModel
+    from llm_router import build_router
+
+    model = ScriptedChatModel(latency=args.llm_latency, jitter=args.llm_jitter, truncate_rate=args.truncate_rate)
+    agent.llm_router = build_router("fake:primary", "fake:primary", "", factory=lambda spec: model)
+    return model
+
+
+async def run_load(args, app, model, serp):
+    import httpx
+    from itinerary_schema import validation_stats
+
+    latencies = []
+    failures = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def one(index):
+                nonlocal failures
+                async with semaphore:
+                    started = time.perf_counter()
+                    response = await client.post("/create_itinerary", json=build_payload(index, args))
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200:
+                        failures += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.requests)))
+            wall = time.perf_counter() - started
+
+    completed = max(args.requests, 1)
+    return {
+        "mode": args.mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "failures": failures,
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(args.requests / wall, 2) if wall else 0.0,
+        "latency_p50": round(percentile(latencies, 50), 3),
+        "latency_p95": round(percentile(latencies, 95), 3),
+        "latency_p99": round(percentile(latencies, 99), 3),
+        "latency_mean": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "llm_turns_per_request": round(model.counters["llm_turns"] / completed, 2),
+        "tool_calls_per_request": round(model.counters["tool_calls"] / completed, 2),
+        "serpapi_searches_per_request": round(sum(serp.requests.values()) / completed, 2),
+        "repair_calls_per_request": round(validation_stats.repair_calls / completed, 2),
+        "unrepaired_itineraries": validation_stats.unrepaired,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--mode", choices=["agent", "prefetch"], default="agent")
+    parser.add_argument("--cities", default="Lahore,Islamabad,Hunza")
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--serp-latency", type=float, default=0.3)
+    parser.add_argument("--serp-jitter", type=float, default=0.2)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--truncate-rate", type=float, default=0.0,
+                        help="share of itineraries the fake model cuts off (exercises repair)")
+    parser.add_argument("--identical", action="store_true", help="send identical payloads (exercises coalescing)")
+    parser.add_argument("--cache", action="store_true", help="keep the SerpAPI cache enabled")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with FakeSerpApi(latency=args.serp_latency, jitter=args.serp_jitter) as serp:
+        configure_environment(args, serp.url)
+        import main as app_module
+
+        model = install_fake_llm(args)
+        # The app logs whole states to stdout; keep that out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = asyncio.run(run_load(args, app_module.app, model, serp))
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        width = max(len(key) for key in report)
+        for key, value in report.items():
+            print(f"{key:<{width}}  {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import os
+from collections import namedtuple
+from datetime import date
+from urllib.parse import quote_plus
+
+from prefetch import allocate_days
+
+
+# Platform used when a hotel has no booking link of its own
+BOOKING_DEFAULT_PLATFORM = os.getenv("BOOKING_DEFAULT_PLATFORM", "sastaticket")
+
+BookingDates = namedtuple("BookingDates", ["check_in", "check_out"])
+
+
+class LinkTemplate:
+    """
+    Search URL for one booking platform, split into fixed and per-hotel parts once.
+
+    ``params`` is a sequence of (query parameter, field) pairs. Fields are ``name``,
+    ``location``, ``query`` (name and location together), ``check_in`` and ``check_out``;
+    a parameter whose field is empty is left out, so the platform falls back to its own default.
+    """
+
+    def __init__(self, platform, label, base, params):
+        self.platform = platform
+        self.label = label
+        self.base = base
+        self._parts = tuple((quote_plus(key) + "=", field) for key, field in params)
+
+    def render(self, values):
+        """
+        URL for ``values``, a dict of already-encoded field values
+        """
+        query = "&".join(prefix + values[field] for prefix, field in self._parts if values.get(field))
+        return f"{self.base}?{query}" if query else self.base
+
+
+# Pakistani platforms first
+TEMPLATES = {
+    template.platform: template
+    for template in (
+        LinkTemplate("sastaticket", "Sastaticket", "https://www.sastaticket.pk/hotels/search",
+                     [("destination", "location"), ("checkin", "check_in"), ("checkout", "check_out")]),
+        LinkTemplate("flypakistan", "FlyPakistan", "https://flypakistan.pk/hotels",
+                     [("destination", "name"), ("location", "location")]),
+        LinkTemplate("booking_com", "Booking.com", "https://www.booking.com/searchresults.html",
+                     [("ss", "query"), ("checkin", "check_in"), ("checkout", "check_out")]),
+        LinkTemplate("agoda", "Agoda", "https://www.agoda.com/search",
+                     [("searchText", "name"), ("checkIn", "check_in"), ("checkOut", "check_out")]),
+        LinkTemplate("hotels_com", "Hotels.com", "https://www.hotels.com/search.do",
+                     [("q-destination", "query"), ("q-check-in", "check_in"), ("q-check-out", "check_out")]),
+        LinkTemplate("expedia", "Expedia", "https://www.expedia.com/Hotel-Search",
+                     [("destination", "query"), ("startDate", "check_in"), ("endDate", "check_out")]),
+    )
+}
+
+
+def booking_dates(check_in, check_out):
+    """
+    BookingDates from ISO dates; None when either is missing, malformed or out of order
+    """
+    try:
+        start, end = date.fromisoformat(str(check_in)), date.fromisoformat(str(check_out))
+    except ValueError:
+        return None
+    if end <= start:
+        return None
+    return BookingDates(start.isoformat(), end.isoformat())
+
+
+def day_dates(state):
+    """
+    Stay dates by day number (1-based) for the trip in ``state``, from the same split the prefetch uses
+    """
+    try:
+        stays = allocate_days(state["city"], state["days"], state["travel_date"])
+    except (KeyError, TypeError, ValueError):
+        return {}
+    return {
+        day: (stay["city"], BookingDates(stay["check_in"], stay["check_out"]))
+        for stay in stays
+        for day in stay["days"]
+    }
+
+
+def _date_values(dates):
+    if dates is None:
+        return {}
+    return {"check_in": quote_plus(dates.check_in), "check_out": quote_plus(dates.check_out)}
+
+
+def _hotel_values(hotel_name, location):
+    name = quote_plus(hotel_name or "")
+    location = quote_plus(location or "")
+    return {"name": name, "location": location, "query": "+".join(v for v in (name, location) if v)}
+
+
+def booking_link(hotel_name, location="", dates=None, platform=BOOKING_DEFAULT_PLATFORM):
+    """
+    Search link for one hotel on one platform; only that platform's URL is built
+    """
+    return TEMPLATES[platform].render({**_hotel_values(hotel_name, location), **_date_values(dates)})
+
+
+def booking_options(hotel_name, location="", dates=None, platforms=None):
+    """
+    {platform: link} for ``platforms`` (every platform by default), in preference order
+    """
+    values = {**_hotel_values(hotel_name, location), **_date_values(dates)}
+    return {platform: TEMPLATES[platform].render(values) for platform in (platforms or TEMPLATES)}
+
+
+def batch_booking_links(hotels, dates=None, platforms=(BOOKING_DEFAULT_PLATFORM,)):
+    """
+    {platform: link} per hotel dict (``name`` and ``location``/``address``) for a whole result list.
+
+    Dates are encoded once for the batch and each hotel's name once for all its platforms.
+    """
+    shared = _date_values(dates)
+    templates = [TEMPLATES[platform] for platform in platforms]
+    links = []
+    for hotel in hotels:
+        values = {**_hotel_values(hotel.get("name", ""), hotel.get("location") or hotel.get("address", "")), **shared}
+        links.append({template.platform: template.render(values) for template in templates})
+    return links
+
+
+def is_generated_link(url):
+    """
+    True for links built from TEMPLATES, as opposed to a provider's own booking link
+    """
+    return isinstance(url, str) and any(url.startswith(template.base) for template in TEMPLATES.values())
+
+
+def refresh_booking_links(itinerary, state):
+    """
+    Rebuild generated hotel links in a final itinerary with that day's real stay dates.
+
+    Links a provider returned are left alone. Returns the number of links changed.
+    """
+    dates_by_day = day_dates(state)
+    changed = 0
+    days = []
+    for day in itinerary.get("daily_itinerary") or []:
+        hotel = day.get("hotel") if isinstance(day, dict) else None
+        stay = dates_by_day.get(day.get("day")) if hotel else None
+        url = hotel.get("booking_url") if hotel else None
+        if stay and is_generated_link(url):
+            platform = next(t.platform for t in TEMPLATES.values() if url.startswith(t.base))
+            city, dates = stay
+            fresh = booking_link(hotel.get("name", ""), city, dates, platform)
+            if fresh != url:
+                day = {**day, "hotel": {**hotel, "booking_url": fresh}}
+                changed += 1
+        days.append(day)
+    if changed:
+        itinerary["daily_itinerary"] = days
+    return changed
@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+SERP_CACHE_PATH = os.getenv("SERP_CACHE_PATH", ".cache/serpapi.sqlite")
+SERP_CACHE_MAX_ENTRIES = int(os.getenv("SERP_CACHE_MAX_ENTRIES", "2048"))
+
+# (ttl, stale window) in seconds; hotel prices move daily, images barely change
+NAMESPACE_TTLS = {
+    "hotels": (
+        float(os.getenv("SERP_CACHE_HOTEL_TTL", str(6 * 3600))),
+        float(os.getenv("SERP_CACHE_HOTEL_STALE", str(3600))),
+    ),
+    "images": (
+        float(os.getenv("SERP_CACHE_IMAGE_TTL", str(7 * 24 * 3600))),
+        float(os.getenv("SERP_CACHE_IMAGE_STALE", str(30 * 24 * 3600))),
+    ),
+    # Liveness verdicts for single image URLs (image_probe)
+    "image_probe": (
+        float(os.getenv("IMAGE_PROBE_TTL", str(24 * 3600))),
+        float(os.getenv("IMAGE_PROBE_STALE", str(7 * 24 * 3600))),
+    ),
+    # Perceptual hashes of thumbnails (image_dedup); a URL's pixels don't change
+    "image_hash": (float(os.getenv("IMAGE_HASH_TTL", str(30 * 24 * 3600))), 0.0),
+}
+DEFAULT_TTL = (3600.0, 0.0)
+
+# Parameters that never change the result and must not leak into keys
+IGNORED_KEY_PARAMS = {"api_key", "output"}
+
+
+def normalize_value(value):
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    return value
+
+
+def make_cache_key(namespace, params):
+    """
+    Build a stable key from search params: case/whitespace-insensitive, order-independent
+    """
+    normalized = {
+        key: normalize_value(value)
+        for key, value in params.items()
+        if value is not None and key not in IGNORED_KEY_PARAMS
+    }
+    digest = hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class SqliteTier:
+    """
+    Shared on-disk tier; safe to point several workers at the same file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, stored_at):
+        payload = json.dumps(value, separators=(",", ":"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, payload, stored_at),
+            )
+            self._conn.commit()
+
+    def purge_older_than(self, cutoff):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries WHERE stored_at < ?", (cutoff,))
+            self._conn.commit()
+
+
+class TwoTierCache:
+    """
+    In-process LRU in front of an optional SQLite tier, with per-namespace TTLs.
+
+    Entries older than their TTL but still inside the stale window are served
+    immediately while a background task refreshes them (stale-while-revalidate).
+    """
+
+    def __init__(self, path=SERP_CACHE_PATH, max_entries=SERP_CACHE_MAX_ENTRIES, ttls=None, clock=time.time):
+        self.max_entries = max_entries
+        self.ttls = ttls or NAMESPACE_TTLS
+        self.clock = clock
+        self._memory = OrderedDict()
+        self._disk = SqliteTier(path) if path else None
+        self._refreshing = {}
+        self._inflight = {}
+        self.stats = {"hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def _remember(self, key, value, stored_at):
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    async def _lookup(self, key):
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            return entry, False
+        if self._disk is not None:
+            entry = await asyncio.to_thread(self._disk.get, key)
+            if entry is not None:
+                self._remember(key, *entry)
+                return entry, True
+        return None, False
+
+    async def _store(self, key, value):
+        stored_at = self.clock()
+        self._remember(key, value, stored_at)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.set, key, value, stored_at)
+
+    async def _refresh(self, key, fetch, cacheable=None):
+        try:
+            value = await fetch()
+            if cacheable is None or cacheable(value):
+                await self._store(key, value)
+            self.stats["refreshes"] += 1
+        except Exception:
+            self.stats["refresh_errors"] += 1
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def get_or_fetch(self, namespace, params, fetch, cacheable=None):
+        """
+        Return the cached value for ``params`` or await ``fetch()`` and store it.
+
+        ``cacheable`` can veto storing a fetched value (e.g. SerpAPI error payloads).
+        """
+        key = make_cache_key(namespace, params)
+        ttl, stale_window = self.ttls.get(namespace, DEFAULT_TTL)
+        entry, from_disk = await self._lookup(key)
+
+        if entry is not None:
+            value, stored_at = entry
+            age = self.clock() - stored_at
+            if age < ttl:
+                self.stats["disk_hits" if from_disk else "hits"] += 1
+                return value
+            if age < ttl + stale_window:
+                self.stats["stale_hits"] += 1
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key, fetch, cacheable))
+                return value
+
+        # Concurrent misses for the same key share one fetch
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["hits"] += 1
+            return await asyncio.shield(inflight)
+
+        self.stats["misses"] += 1
+        task = asyncio.ensure_future(fetch())
+        self._inflight[key] = task
+        try:
+            value = await asyncio.shield(task)
+        finally:
+            self._inflight.pop(key, None)
+        if cacheable is None or cacheable(value):
+            await self._store(key, value)
+        return value
+
+    def snapshot(self):
+        lookups = sum(self.stats[name] for name in ("hits", "disk_hits", "stale_hits", "misses"))
+        served = lookups - self.stats["misses"]
+        return {
+            **self.stats,
+            "memory_entries": len(self._memory),
+            "hit_ratio": round(served / lookups, 4) if lookups else 0.0,
+        }
+
+    def purge_expired(self):
+        """
+        Drop disk entries that are past every namespace's TTL plus stale window
+        """
+        if self._disk is None:
+            return
+        longest = max(ttl + stale for ttl, stale in self.ttls.values())
+        self._disk.purge_older_than(self.clock() - longest)
+
+
+_serp_cache = None
+
+
+def get_serp_cache():
+    global _serp_cache
+    if _serp_cache is None:
+        _serp_cache = TwoTierCache()
+    return _serp_cache
@@ -0,0 +1,128 @@
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+CHECKPOINTER = os.getenv("CHECKPOINTER", "memory")
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "1000"))
+CHECKPOINT_TTL_SECONDS = float(os.getenv("CHECKPOINT_TTL_SECONDS", str(24 * 3600)))
+CHECKPOINT_SQLITE_PATH = os.getenv("CHECKPOINT_SQLITE_PATH", ".cache/checkpoints.sqlite")
+
+
+class ThreadEvictionMixin:
+    """
+    Keeps at most ``max_threads`` threads and drops threads idle for longer than ``ttl_seconds``.
+
+    Every checkpoint read or write marks its thread as recently used; evictions happen
+    on writes so a lookup never pays for deleting another thread.
+    """
+
+    def __init__(self, *args, max_threads=CHECKPOINT_MAX_THREADS, ttl_seconds=CHECKPOINT_TTL_SECONDS,
+                 clock=time.monotonic, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_threads = max_threads
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._last_used = OrderedDict()
+        self.evicted_threads = 0
+
+    def _touch(self, config):
+        thread_id = config.get("configurable", {}).get("thread_id")
+        if thread_id is None:
+            return
+        self._last_used[thread_id] = self.clock()
+        self._last_used.move_to_end(thread_id)
+
+    def _expired_threads(self):
+        expired = []
+        cutoff = self.clock() - self.ttl_seconds
+        for thread_id, last_used in self._last_used.items():
+            if last_used >= cutoff and len(self._last_used) - len(expired) <= self.max_threads:
+                break
+            expired.append(thread_id)
+        for thread_id in expired:
+            del self._last_used[thread_id]
+        self.evicted_threads += len(expired)
+        return expired
+
+    def seed_threads(self, thread_ids):
+        """
+        Register threads that already exist in the backing store (e.g. after a restart)
+        """
+        for thread_id in thread_ids:
+            self._last_used.setdefault(thread_id, self.clock())
+
+    @property
+    def thread_count(self):
+        return len(self._last_used)
+
+    def get_tuple(self, config):
+        self._touch(config)
+        return super().get_tuple(config)
+
+    async def aget_tuple(self, config):
+        self._touch(config)
+        return await super().aget_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self._touch(config)
+        result = super().put(config, checkpoint, metadata, new_versions)
+        for thread_id in self._expired_threads():
+            self.delete_thread(thread_id)
+        return result
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        self._touch(config)
+        result = await super().aput(config, checkpoint, metadata, new_versions)
+        for thread_id in self._expired_threads():
+            await self.adelete_thread(thread_id)
+        return result
+
+
+class BoundedMemorySaver(ThreadEvictionMixin, InMemorySaver):
+    """
+    In-process checkpointer with LRU/TTL eviction of whole threads
+    """
+
+
+@asynccontextmanager
+async def open_checkpointer(kind=CHECKPOINTER):
+    """
+    Open the configured checkpointer: "memory", "sqlite" or "none".
+
+    The SQLite backend needs the optional ``langgraph-checkpoint-sqlite`` package.
+    """
+    if kind == "none":
+        yield None
+        return
+
+    if kind == "memory":
+        yield BoundedMemorySaver()
+        return
+
+    if kind != "sqlite":
+        raise ValueError(f"Unknown checkpointer: {kind!r}")
+
+    try:
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+    except ImportError as e:
+        raise RuntimeError("CHECKPOINTER=sqlite requires the langgraph-checkpoint-sqlite package") from e
+
+    class BoundedSqliteSaver(ThreadEvictionMixin, AsyncSqliteSaver):
+        """
+        SQLite checkpointer with LRU/TTL eviction of whole threads
+        """
+
+    directory = os.path.dirname(CHECKPOINT_SQLITE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_SQLITE_PATH) as base:
+        saver = BoundedSqliteSaver(base.conn, serde=base.serde)
+        await saver.setup()
+        async with saver.conn.execute("SELECT DISTINCT thread_id FROM checkpoints") as cursor:
+            saver.seed_threads([row[0] async for row in cursor])
+        yield saver
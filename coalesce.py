@@ -0,0 +1,98 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+
+COALESCE_CACHE_TTL_SECONDS = float(os.getenv("COALESCE_CACHE_TTL_SECONDS", "0"))
+COALESCE_CACHE_MAX_ENTRIES = int(os.getenv("COALESCE_CACHE_MAX_ENTRIES", "256"))
+
+
+def _norm_text(value):
+    return " ".join(str(value).lower().split())
+
+
+def request_fingerprint(payload):
+    """
+    Canonical hash of an itinerary request.
+
+    Cosmetic differences (case, whitespace, interest order, duplicate interests,
+    int vs float budget) hash the same; city order is kept since it is the visiting order.
+    """
+    canonical = {
+        "budget": float(payload["budget"]),
+        "interests": sorted({_norm_text(i) for i in payload["interests"]}),
+        "companions": int(payload["companions"]),
+        "city": [_norm_text(c) for c in payload["city"]],
+        "days": int(payload["days"]),
+        "travel_date": _norm_text(payload["travel_date"]),
+        "initial_message": _norm_text(payload.get("initial_message", "")),
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+class SingleFlight:
+    """
+    Shares one in-flight run between concurrent callers with the same key.
+
+    With ``response_ttl`` > 0, finished results are also kept for that many seconds so
+    exact repeats are answered without a new run.
+    """
+
+    def __init__(self, response_ttl=COALESCE_CACHE_TTL_SECONDS, max_cached=COALESCE_CACHE_MAX_ENTRIES,
+                 clock=time.monotonic):
+        self.response_ttl = response_ttl
+        self.max_cached = max_cached
+        self.clock = clock
+        self._inflight = {}
+        self._results = OrderedDict()
+        self.stats = {"runs": 0, "coalesced": 0, "cache_hits": 0}
+
+    def _cached(self, key):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        result, stored_at = entry
+        if self.clock() - stored_at >= self.response_ttl:
+            del self._results[key]
+            return None
+        return entry
+
+    def _remember(self, key, task):
+        if self.response_ttl <= 0 or task.cancelled() or task.exception() is not None:
+            return
+        self._results[key] = (task.result(), self.clock())
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_cached:
+            self._results.popitem(last=False)
+
+    async def run(self, key, fn):
+        """
+        Return ``(result, shared)`` where ``shared`` is True when another caller's run was reused
+        """
+        cached = self._cached(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached[0], True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(task), True
+
+        self.stats["runs"] += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+
+        def finished(done):
+            self._inflight.pop(key, None)
+            self._remember(key, done)
+
+        task.add_done_callback(finished)
+        # Shielded so one caller going away does not cancel the run for everyone else
+        return await asyncio.shield(task), False
+
+    def snapshot(self):
+        return {**self.stats, "inflight": len(self._inflight), "cached": len(self._results)}
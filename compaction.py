@@ -0,0 +1,163 @@
+import json
+import os
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "12000"))
+
+HOTEL_COLUMNS = ["name", "price", "rating", "reviews", "booking_url"]
+
+# Progressively tighter limits applied while a prompt is still over budget
+TIGHTENING_STEPS = [(10, 5), (5, 3), (3, 2)]  # (max images, max hotels) per tool result
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English/JSON; close enough for budgeting without a tokenizer
+    return len(text) // 4 + 1
+
+
+def message_tokens(message):
+    content = message.content
+    if not isinstance(content, str):
+        content = json.dumps(content, default=str)
+    tokens = estimate_tokens(content)
+    for call in getattr(message, "tool_calls", None) or []:
+        tokens += estimate_tokens(json.dumps(call.get("args", {}), default=str))
+    return tokens
+
+
+def _decode(content):
+    if not isinstance(content, str):
+        return content
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+def summarize_hotels(hotels, max_hotels):
+    rows = [[hotel.get(column) for column in HOTEL_COLUMNS] for hotel in hotels[:max_hotels] if isinstance(hotel, dict)]
+    return {"columns": HOTEL_COLUMNS, "rows": rows}
+
+
+def summarize_images(images, seen_urls, max_images):
+    urls = []
+    for image in images:
+        url = image.get("url") if isinstance(image, dict) else image
+        if not url or url in seen_urls:
+            continue
+        seen_urls.add(url)
+        urls.append(url)
+        if len(urls) >= max_images:
+            break
+    return {"image_urls": urls}
+
+
+def summarize_tool_message(message, seen_urls, max_images, max_hotels):
+    """
+    Compact copy of a tool result, or None when it isn't a result we know how to shrink
+    """
+    if message.status == "error":
+        return None
+    data = _decode(message.content)
+    if message.name in ("hotels_finder", "hotel_index_query") and isinstance(data, list):
+        summary = summarize_hotels(data, max_hotels)
+    elif message.name == "hotels_batch_finder" and isinstance(data, dict):
+        summary = {
+            city: summarize_hotels(hotels, max_hotels) if isinstance(hotels, list) else hotels
+            for city, hotels in data.items()
+        }
+    elif message.name == "image_finder" and isinstance(data, list):
+        summary = summarize_images(data, seen_urls, max_images)
+    else:
+        return None
+    return ToolMessage(
+        content=json.dumps(summary, ensure_ascii=False, separators=(",", ":")),
+        name=message.name,
+        tool_call_id=message.tool_call_id,
+        id=message.id,
+    )
+
+
+def _consumed_indexes(messages):
+    """
+    Indexes of tool results the model has already seen, i.e. followed by a later assistant turn
+    """
+    consumed = set()
+    pending = []
+    for index, message in enumerate(messages):
+        if isinstance(message, ToolMessage):
+            pending.append(index)
+        elif isinstance(message, AIMessage):
+            consumed.update(pending)
+            pending = []
+    return consumed
+
+
+def _compact_pass(messages, indexes, max_images, max_hotels):
+    # URLs in results that stay verbatim don't need repeating in any summary
+    seen_urls = set()
+    for index, message in enumerate(messages):
+        if index not in indexes and isinstance(message, ToolMessage) and message.name == "image_finder":
+            for image in _decode(message.content) or []:
+                if isinstance(image, dict) and image.get("url"):
+                    seen_urls.add(image["url"])
+
+    compacted = list(messages)
+    for index in sorted(indexes):
+        summary = summarize_tool_message(messages[index], seen_urls, max_images, max_hotels)
+        if summary is not None:
+            compacted[index] = summary
+    return compacted
+
+
+def compact_messages(messages, token_budget=PROMPT_TOKEN_BUDGET, reserved_tokens=0):
+    """
+    Shrink tool results in the history before it is sent to the model.
+
+    Results the model has already read become compact tables (hotels) or de-duplicated URL
+    lists (images). If the prompt is still over ``token_budget`` (minus ``reserved_tokens``
+    for the system prompt), fresh results are compacted too and limits tighten step by step.
+
+    Returns ``(messages, tokens_before, tokens_after)``; the input list is never modified.
+    """
+    budget = token_budget - reserved_tokens
+    tokens_before = sum(message_tokens(m) for m in messages)
+
+    max_images, max_hotels = TIGHTENING_STEPS[0]
+    compacted = _compact_pass(messages, _consumed_indexes(messages), max_images, max_hotels)
+    tokens_after = sum(message_tokens(m) for m in compacted)
+
+    if tokens_after > budget:
+        every_tool_result = {i for i, m in enumerate(messages) if isinstance(m, ToolMessage)}
+        for max_images, max_hotels in TIGHTENING_STEPS:
+            compacted = _compact_pass(messages, every_tool_result, max_images, max_hotels)
+            tokens_after = sum(message_tokens(m) for m in compacted)
+            if tokens_after <= budget:
+                break
+
+    return compacted, tokens_before, tokens_after
+
+
+class CompactionStats:
+    def __init__(self):
+        self.turns = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def record(self, tokens_before, tokens_after):
+        self.turns += 1
+        self.tokens_before += tokens_before
+        self.tokens_after += tokens_after
+
+    def snapshot(self):
+        return {
+            "turns": self.turns,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_before - self.tokens_after,
+        }
+
+
+compaction_stats = CompactionStats()
@@ -0,0 +1,255 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import json
+import os
+import sqlite3
+import statistics
+import threading
+import time
+
+from cache import normalize_value
+from hotel_index import city_key
+from replay import fixture_store
+from telemetry import get_logger
+
+
+DESTINATION_PACK_PATH = os.getenv("DESTINATION_PACK_PATH", ".cache/destinations.sqlite")
+# Image queries with fewer vetted results than this stay live, as image_finder would search again anyway
+DESTINATION_PACK_MIN_IMAGES = int(os.getenv("DESTINATION_PACK_MIN_IMAGES", "5"))
+
+PACK_VERSION = 1
+PACK_IMAGES = 10
+# A city's costs are the defaults scaled by its hotel prices against the median city, within these bounds
+PRICE_INDEX_BOUNDS = (0.6, 1.8)
+COST_ROUNDING = 100
+
+logger = get_logger("destinations")
+
+
+class DestinationPack:
+    """
+    Read-only lookups into a prebuilt destination pack: vetted image results per query and
+    cost estimates per city. An empty pack when the file is missing.
+
+    The file is read whole on first use, so lookups are dictionary hits. Hotel prices are never
+    packed; they always come from a live search.
+    """
+
+    def __init__(self, path=DESTINATION_PACK_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._images = {}
+        self._cities = {}
+        self.meta = {}
+        self.stats = {"image_hits": 0, "image_misses": 0, "cost_hits": 0, "cost_misses": 0}
+
+    def open(self, path):
+        """
+        Switch to another pack file (None or "" for none); it is read on the next lookup
+        """
+        with self._lock:
+            self.path = path
+            self._loaded = False
+            self._images, self._cities, self.meta = {}, {}, {}
+
+    def load(self):
+        """
+        Read the pack file into memory; later calls return at once
+        """
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if self.path and os.path.exists(self.path):
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+                try:
+                    self.meta = dict(conn.execute("SELECT key, value FROM meta"))
+                    self._images = {query: json.loads(urls) for query, urls in conn.execute("SELECT query, urls FROM images")}
+                    self._cities = {city: json.loads(data) for city, data in conn.execute("SELECT city, data FROM cities")}
+                finally:
+                    conn.close()
+                logger.info("Destination pack %s: %d cities, %d image queries", self.path, len(self._cities), len(self._images))
+            self._loaded = True
+
+    def images(self, q, safe="active"):
+        """
+        Vetted image_finder results for query ``q``, or None if it has to be searched live
+        """
+        self.load()
+        urls = self._images.get(normalize_value(q)) if safe == "active" else None
+        if urls is None:
+            self.stats["image_misses"] += 1
+            return None
+        self.stats["image_hits"] += 1
+        return [{"url": url} for url in urls]
+
+    def city(self, city, field):
+        """
+        One cost estimate (``meal_plans``, ``activities``, ``local_transport``, ``intercity_transfer``) for ``city``
+        """
+        self.load()
+        value = (self._cities.get(city_key(city)) or {}).get(field)
+        self.stats["cost_hits" if value is not None else "cost_misses"] += 1
+        return value
+
+    def snapshot(self):
+        self.load()
+        return {
+            "path": self.path,
+            "built_at": self.meta.get("built_at"),
+            "cities": len(self._cities),
+            "image_queries": len(self._images),
+            **self.stats,
+        }
+
+
+destination_pack = DestinationPack()
+
+
+# ---------------------------------------------------------------------------
+# Offline build
+
+
+def recorded_searches(source):
+    """
+    (params, response) for every SerpAPI search recorded under ``source`` (a REPLAY_DIR)
+    """
+    for path in sorted(glob.glob(os.path.join(source, "serpapi", "*.json.gz"))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            record = json.load(f)
+        if isinstance(record.get("response"), dict) and "error" not in record["response"]:
+            yield record["request"], record["response"]
+
+
+def hotel_price(hotel):
+    return (hotel.get("rate_per_night") or {}).get("extracted_lowest") or hotel.get("price") or 0
+
+
+def _scaled(cost, index):
+    return int(round(cost * index / COST_ROUNDING) * COST_ROUNDING)
+
+
+def city_costs(prices_by_city, overrides=None):
+    """
+    Cost estimates per city: the optimizer defaults scaled by how the city's median hotel price
+    compares with the median city, then any hand-vetted ``overrides`` ({city: {field: value}})
+    """
+    # optimizer looks costs up here, so it is only imported when building
+    from optimizer import DEFAULT_ACTIVITIES, DEFAULT_MEAL_PLANS, INTERCITY_TRANSFER, LOCAL_TRANSPORT_PER_DAY
+
+    medians = {city: statistics.median(prices) for city, prices in prices_by_city.items() if prices}
+    reference = statistics.median(medians.values()) if medians else 0
+    low, high = PRICE_INDEX_BOUNDS
+    cities = {}
+    for city, median in medians.items():
+        index = round(min(max(median / reference, low), high), 2) if reference else 1.0
+        cities[city] = {
+            "price_index": index,
+            "hotel_median": median,
+            "meal_plans": [{**plan, "cost": _scaled(plan["cost"], index)} for plan in DEFAULT_MEAL_PLANS],
+            "activities": [{**activity, "cost": _scaled(activity["cost"], index)} for activity in DEFAULT_ACTIVITIES],
+            "local_transport": {**LOCAL_TRANSPORT_PER_DAY, "cost": _scaled(LOCAL_TRANSPORT_PER_DAY["cost"], index)},
+            "intercity_transfer": {**INTERCITY_TRANSFER, "cost": _scaled(INTERCITY_TRANSFER["cost"], index)},
+        }
+    for city, fields in (overrides or {}).items():
+        cities.setdefault(city_key(city), {}).update(fields)
+    return cities
+
+
+async def vetted_images(raw_images):
+    """
+    The same filtering image_finder applies to a live result page
+    """
+    # Only the builder needs these (and the image libraries they pull in)
+    from image_dedup import dedupe_images
+    from image_probe import filter_live_images
+    from url_classifier import filter_reliable_images
+
+    candidates = filter_reliable_images(raw_images, max_images=2 * PACK_IMAGES, with_thumbnails=True)
+    images = await filter_live_images(await dedupe_images(candidates, max_images=PACK_IMAGES))
+    return [image["url"] for image in images]
+
+
+async def collect(source):
+    images = {}
+    prices = {}
+    for params, response in recorded_searches(source):
+        engine = params.get("engine")
+        if engine == "google_images" and params.get("safe", "active") == "active":
+            urls = await vetted_images(response.get("images_results", []))
+            if len(urls) >= DESTINATION_PACK_MIN_IMAGES:
+                images[normalize_value(params["q"])] = urls
+        elif engine == "google_hotels":
+            found = [hotel_price(hotel) for hotel in response.get("properties", [])]
+            prices.setdefault(city_key(params.get("q", "")), []).extend(price for price in found if price)
+    return images, prices
+
+
+def write_pack(path, images, cities, source):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.executescript(
+            "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE images (query TEXT PRIMARY KEY, urls TEXT NOT NULL);"
+            "CREATE TABLE cities (city TEXT PRIMARY KEY, data TEXT NOT NULL);"
+        )
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("version", str(PACK_VERSION)),
+            ("built_at", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+            ("source", source),
+        ])
+        conn.executemany("INSERT INTO images VALUES (?, ?)",
+                         [(query, json.dumps(urls, separators=(",", ":"))) for query, urls in sorted(images.items())])
+        conn.executemany("INSERT INTO cities VALUES (?, ?)",
+                         [(city, json.dumps(data, separators=(",", ":"))) for city, data in sorted(cities.items())])
+        conn.commit()
+    finally:
+        conn.close()
+    # Workers reading the old pack keep it; new lookups get the new file
+    os.replace(tmp, path)
+
+
+def build_pack(source, out=DESTINATION_PACK_PATH, overrides=None):
+    """
+    Build a pack from the searches recorded under ``source``; returns what went into it.
+
+    Probe verdicts and thumbnail hashes are replayed from the same recording, so the build
+    never goes online (images without a recorded probe are kept, as in a replayed run).
+    """
+    saved = fixture_store.mode, fixture_store.directory
+    fixture_store.mode, fixture_store.directory = "replay", source
+    try:
+        images, prices = asyncio.run(collect(source))
+    finally:
+        fixture_store.mode, fixture_store.directory = saved
+    cities = city_costs(prices, overrides)
+    write_pack(out, images, cities, source)
+    return {"path": out, "image_queries": len(images), "cities": sorted(cities)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the destination pack from SerpAPI searches recorded with REPLAY_MODE=record")
+    parser.add_argument("--source", default=os.getenv("REPLAY_DIR", ".cache/replay"),
+                        help="fixture directory written with REPLAY_MODE=record")
+    parser.add_argument("--out", default=DESTINATION_PACK_PATH)
+    parser.add_argument("--overrides", help="JSON file of hand-vetted {city: {field: value}} estimates")
+    args = parser.parse_args(argv)
+    overrides = None
+    if args.overrides:
+        with open(args.overrides) as f:
+            overrides = json.load(f)
+    print(json.dumps(build_pack(args.source, args.out, overrides), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import json
+import os
+from datetime import timedelta
+
+from itinerary_schema import DAY_PATH, parse_amount
+from prefetch import allocate_days, normalize_cities, parse_travel_date, plan_searches, recorded_searches
+
+
+# Images kept per city for the trip-wide image lists when the set of cities changes
+EDIT_IMAGES_PER_CITY = int(os.getenv("EDIT_IMAGES_PER_CITY", "3"))
+
+TRIP_FIELDS = ("city", "days", "travel_date", "budget", "interests", "companions")
+# Fields that change what the optimizer picks for every day, not just which days exist
+PLAN_FIELDS = ("budget", "interests", "companions")
+SEARCH_PURPOSES = ("hotels", "destination_images", "hotel_images")
+IMAGE_SECTIONS = ("destination_images", "hotel_images")
+
+
+def trip_fields(request):
+    """
+    The trip part of a request body, normalised like the initial state
+    """
+    fields = {field: request[field] for field in TRIP_FIELDS if field in request}
+    if "city" in fields:
+        fields["city"] = normalize_cities(fields["city"])
+    return fields
+
+
+def changed_fields(old, new):
+    """
+    {field: (old value, new value)} for the trip fields an edit changes
+    """
+    return {field: (old.get(field), value) for field, value in new.items() if old.get(field) != value}
+
+
+def describe_changes(changes):
+    parts = []
+    for field, (before, after) in changes.items():
+        if field == "city":
+            before, after = ", ".join(before or []), ", ".join(after)
+        elif field == "interests":
+            before, after = ", ".join(before or []) or "none", ", ".join(after) or "none"
+        parts.append(f"{field.replace('_', ' ')} {before} -> {after}")
+    return "; ".join(parts) or "no changes"
+
+
+def day_slots(state):
+    """
+    One entry per day of the trip: its number, date, city and a key that stays the same for
+    "the same day" of a trip after an edit (nth day of the nth stay in that city)
+    """
+    start = parse_travel_date(state["travel_date"])
+    slots = []
+    seen = {}
+    for stay_index, stay in enumerate(allocate_days(state["city"], state["days"], state["travel_date"])):
+        visit = seen[stay["city"]] = seen.get(stay["city"], -1) + 1
+        for offset, day in enumerate(stay["days"]):
+            slots.append({
+                "day": day,
+                "date": (start + timedelta(days=day - 1)).isoformat(),
+                "city": stay["city"],
+                # The first day of any stay but the first is a transfer day
+                "key": (stay["city"], visit, offset, stay_index == 0 or offset > 0),
+            })
+    return slots
+
+
+def plan_edit_searches(old, new_state):
+    """
+    Split the searches the edited trip needs into results reused from ``old`` and searches to run.
+
+    A stored result is reused when the old trip ran the same search (same city, dates and
+    party size) and it returned something. Agent-mode trips don't store ``tool_results``, so
+    theirs are read back from the checkpointed tool calls. Returns (reused results by city,
+    searches to run).
+    """
+    old_results = old.get("tool_results") or {}
+    old_args = {}
+    if old_results:
+        old_args = {(s["city"], s["purpose"]): s["args"] for s in plan_searches(old)}
+    elif old.get("messages"):
+        for (city, purpose), (args, result) in recorded_searches(old).items():
+            old_args[(city, purpose)] = args
+            if result:
+                old_results.setdefault(city, {})[purpose] = result
+    reused = {}
+    searches = []
+    for search in plan_searches(new_state):
+        key = (search["city"], search["purpose"])
+        stored = (old_results.get(search["city"]) or {}).get(search["purpose"])
+        if stored and old_args.get(key) == search["args"]:
+            reused.setdefault(search["city"], {})[search["purpose"]] = stored
+        else:
+            searches.append(search)
+    return reused, searches
+
+
+def merge_results(reused, fetched):
+    results = {}
+    for source in (reused, fetched):
+        for city, city_results in source.items():
+            merged = results.setdefault(city, {purpose: [] for purpose in SEARCH_PURPOSES})
+            merged.update(city_results)
+    return results
+
+
+def _plan_choices(plan_day):
+    """
+    What the optimizer picked for a day, without its number and date
+    """
+    hotel = plan_day.get("hotel") or {}
+    return (
+        (hotel.get("name"), hotel.get("cost")),
+        plan_day.get("meals"),
+        plan_day.get("activities"),
+        plan_day.get("transportation"),
+    )
+
+
+def reusable_days(old, new_state, new_plan):
+    """
+    For each day of the edited trip, the stored day it can keep (renumbered and redated), or None.
+
+    A day is kept when the old trip had the same day (same city, stay and offset) and the
+    optimizer makes the same picks for it, or, for trips written without a budget plan, when
+    budget, interests and party size are unchanged.
+    """
+    old_days = (old.get("itinerary") or {}).get("daily_itinerary") or []
+    old_plan = {day["day"]: day for day in (old.get("budget_plan") or {}).get("days", [])}
+    new_plan_days = {day["day"]: day for day in (new_plan or {}).get("days", [])}
+    old_by_key = {slot["key"]: slot["day"] for slot in day_slots(old)}
+    plan_unchanged = all(old.get(field) == new_state.get(field) for field in PLAN_FIELDS)
+
+    kept = []
+    for slot in day_slots(new_state):
+        number = old_by_key.get(slot["key"])
+        old_day = old_days[number - 1] if number and number <= len(old_days) else None
+        if isinstance(old_day, dict):
+            if old_plan:
+                same = number in old_plan and slot["day"] in new_plan_days and (
+                    _plan_choices(old_plan[number]) == _plan_choices(new_plan_days[slot["day"]]))
+            else:
+                same = plan_unchanged
+            if same:
+                kept.append({**old_day, "day": slot["day"], "date": slot["date"]})
+                continue
+        kept.append(None)
+    return kept
+
+
+def edited_images(old, new_state, tool_results, section):
+    """
+    Keep the trip-wide image list while the cities are the same; otherwise take the first
+    results per city for the new cities
+    """
+    images = (old.get("itinerary") or {}).get(section) or []
+    if images and set(old.get("city") or []) == set(new_state["city"]):
+        return images
+    per_city = round(len(images) / len(old.get("city") or [1])) if images else EDIT_IMAGES_PER_CITY
+    picked = []
+    for city in dict.fromkeys(new_state["city"]):
+        picked += (tool_results.get(city) or {}).get(section, [])[:max(per_city, 1)]
+    return picked
+
+
+def edited_draft(old, new_state, tool_results, new_plan):
+    """
+    The stored itinerary rewritten for the edited trip, with None for every day that has to be
+    written again. Returns (draft, section paths to write).
+    """
+    itinerary = old.get("itinerary") or {}
+    days = reusable_days(old, new_state, new_plan)
+    trip_details = {
+        **(itinerary.get("trip_details") or {}),
+        "destination": ", ".join(new_state["city"]),
+        "duration": new_state["days"],
+        "travel_date": new_state["travel_date"],
+        "companions": new_state["companions"],
+        "budget": new_state["budget"],
+        "interests": new_state["interests"],
+    }
+    draft = {**itinerary, "trip_details": trip_details, "daily_itinerary": days}
+    for section in IMAGE_SECTIONS:
+        draft[section] = edited_images(old, new_state, tool_results, section)
+    paths = [f"daily_itinerary[{index}]" for index, day in enumerate(days) if day is None]
+    return draft, paths
+
+
+def path_cities(paths, state):
+    """
+    Cities of the days at ``paths`` (``daily_itinerary[i]``)
+    """
+    slots = day_slots(state)
+    indexes = (int(DAY_PATH.match(path).group(1)) for path in paths)
+    return {slots[index]["city"] for index in indexes if index < len(slots)}
+
+
+def _amount(value):
+    try:
+        return float(parse_amount(value))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def itinerary_cost(draft):
+    """
+    Total of the day costs, for trips whose totals don't come from a budget plan
+    """
+    total = 0.0
+    for day in draft.get("daily_itinerary") or []:
+        if not isinstance(day, dict):
+            continue
+        total += _amount((day.get("hotel") or {}).get("price"))
+        total += _amount((day.get("transportation") or {}).get("cost"))
+        total += sum(_amount(item.get("cost")) for item in (day.get("meals") or []) + (day.get("activities") or [])
+                     if isinstance(item, dict))
+    return total
+
+
+def edit_prompt(paths, changes, tool_results, plan=None):
+    """
+    Ask for just the days an edit invalidated, keyed by path like a repair.
+
+    ``tool_results`` should hold only the cities of those days.
+    """
+    indexes = [int(DAY_PATH.match(path).group(1)) for path in paths]
+    lines = [
+        f"The trip was changed ({describe_changes(changes)}); the other days are already written. "
+        "Do not call any tools. Write ONLY these sections as one JSON object keyed by the section path "
+        '(e.g. {"daily_itinerary[2]": {...}}), following the itinerary structure from the instructions.',
+        "",
+        "Sections:",
+    ]
+    lines += [f"- {path}: day {index + 1}" for path, index in zip(paths, indexes)]
+    lines += ["", "Search results (grouped by city):", json.dumps(tool_results, ensure_ascii=False)]
+    if plan:
+        plan_days = [plan["days"][index] for index in indexes if index < len(plan["days"])]
+        lines += ["", "Budget plan for these days (use it exactly):", json.dumps(plan_days, ensure_ascii=False)]
+    return "\n".join(lines)
+
+
+class EditStats:
+    """
+    How much of each edited trip was kept rather than searched for and written again
+    """
+
+    def __init__(self):
+        self.edits = 0
+        self.days_kept = 0
+        self.days_written = 0
+        self.searches_reused = 0
+        self.searches_run = 0
+
+    def record(self, days_kept, days_written, searches_reused, searches_run):
+        self.edits += 1
+        self.days_kept += days_kept
+        self.days_written += days_written
+        self.searches_reused += searches_reused
+        self.searches_run += searches_run
+
+    def snapshot(self):
+        return dict(vars(self))
+
+
+edit_stats = EditStats()
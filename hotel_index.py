@@ -0,0 +1,109 @@
+import bisect
+import os
+import re
+import time
+from collections import OrderedDict
+
+from cache import NAMESPACE_TTLS
+
+
+HOTEL_INDEX_MAX_SEARCHES = int(os.getenv("HOTEL_INDEX_MAX_SEARCHES", "512"))
+
+# Upper bound (PKR per night, exclusive) of each price band
+PRICE_BANDS = [("budget", 8000), ("mid", 20000), ("upscale", 40000), ("luxury", float("inf"))]
+
+QUERY_NOISE_WORDS = {"hotel", "hotels", "in", "near", "pakistan", "the", "best", "cheap", "luxury"}
+
+
+def city_key(text):
+    """
+    Reduce a hotel query like "Hotels in Skardu, Pakistan" to its city ("skardu")
+    """
+    words = [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in QUERY_NOISE_WORDS]
+    return " ".join(words)
+
+
+def price_band(price):
+    for band, upper in PRICE_BANDS:
+        if price < upper:
+            return band
+    return PRICE_BANDS[-1][0]
+
+
+class IndexedSearch:
+    """
+    One hotel search (city + dates), sorted by price for range lookups
+    """
+
+    def __init__(self, hotels, indexed_at):
+        self.hotels = sorted(hotels, key=lambda h: h["price"] or 0)
+        self.prices = [h["price"] or 0 for h in self.hotels]
+        self.indexed_at = indexed_at
+
+
+class HotelIndex:
+    """
+    In-memory index of every hotel seen in recent searches.
+
+    Hotels are grouped by city, stay dates and party size and kept sorted by nightly price, so
+    "best 3 under PKR X in Skardu for these dates" is a bisect plus a filter and needs no new
+    search. Prices and booking links belong to one stay, so only a search for the same stay
+    answers a query. Searches expire with the SerpAPI hotel cache TTL.
+    """
+
+    def __init__(self, ttl=NAMESPACE_TTLS["hotels"][0], max_searches=HOTEL_INDEX_MAX_SEARCHES, clock=time.time):
+        self.ttl = ttl
+        self.max_searches = max_searches
+        self.clock = clock
+        self._searches = OrderedDict()
+
+    def add(self, query, check_in_date, check_out_date, hotels, adults=1):
+        key = (city_key(query), check_in_date, check_out_date, adults)
+        indexed = []
+        for hotel in hotels:
+            price = hotel.get("price") or 0
+            indexed.append({**hotel, "price_band": price_band(price)})
+        self._searches[key] = IndexedSearch(indexed, self.clock())
+        self._searches.move_to_end(key)
+        while len(self._searches) > self.max_searches:
+            self._searches.popitem(last=False)
+
+    def _latest(self, city, check_in_date, check_out_date, adults=None):
+        wanted = (city_key(city), check_in_date, check_out_date)
+        cutoff = self.clock() - self.ttl
+        for (*stay, key_adults), search in reversed(self._searches.items()):
+            if tuple(stay) != wanted or search.indexed_at < cutoff:
+                continue
+            if adults is not None and key_adults != adults:
+                continue
+            return search
+        return None
+
+    def query(self, city, check_in_date, check_out_date, adults=None, max_price=None, min_price=None,
+              min_rating=None, hotel_class=None, price_band=None, sort_by="rating", limit=3):
+        """
+        Best hotels in ``city`` for the stay matching the filters, or None if that stay was never searched
+        """
+        search = self._latest(city, check_in_date, check_out_date, adults)
+        if search is None:
+            return None
+        low = bisect.bisect_left(search.prices, min_price) if min_price is not None else 0
+        high = bisect.bisect_right(search.prices, max_price) if max_price is not None else len(search.prices)
+        candidates = [
+            hotel for hotel in search.hotels[low:high]
+            if (min_rating is None or (hotel.get("rating") or 0) >= min_rating)
+            and (hotel_class is None or hotel.get("hotel_class") == hotel_class)
+            and (price_band is None or hotel["price_band"] == price_band)
+        ]
+        if sort_by == "price":
+            candidates.sort(key=lambda h: h["price"] or 0)
+        else:
+            candidates.sort(key=lambda h: (-(h.get("rating") or 0), -(h.get("reviews") or 0)))
+        return candidates[:limit]
+
+    def cities(self):
+        cutoff = self.clock() - self.ttl
+        return sorted({key[0] for key, search in self._searches.items() if search.indexed_at >= cutoff})
+
+
+hotel_index = HotelIndex()
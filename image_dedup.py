@@ -0,0 +1,280 @@
+import asyncio
+import io
+import os
+import re
+from urllib.parse import unquote, urlsplit
+
+from cache import get_serp_cache
+from image_probe import image_prober, url_key
+from replay import fixture_store
+from telemetry import get_logger, span
+
+
+# Hash thumbnails (needs Pillow and NumPy); otherwise images are compared by URL fingerprint only.
+# Both are imported on first use, as NumPy alone adds ~90ms to importing agent.
+IMAGE_DEDUP_PIXELS = os.getenv("IMAGE_DEDUP_PIXELS", "1") == "1"
+# dHashes this many bits apart or fewer are the same photo (resized, recompressed, lightly cropped)
+IMAGE_DEDUP_DISTANCE = int(os.getenv("IMAGE_DEDUP_DISTANCE", "10"))
+IMAGE_DEDUP_DEADLINE_SECONDS = float(os.getenv("IMAGE_DEDUP_DEADLINE_SECONDS", "2"))
+IMAGE_DEDUP_MAX_THUMBNAIL_BYTES = int(os.getenv("IMAGE_DEDUP_MAX_THUMBNAIL_BYTES", str(256 * 1024)))
+
+NAMESPACE = "image_hash"
+
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+
+# Wikimedia thumbnails: /thumb/a/ab/Name.jpg/320px-Name.jpg
+WIKIMEDIA_THUMB_RE = re.compile(r"/thumb/(?:[0-9a-f]/[0-9a-f]{2}/)?([^/]+)/\d+px-[^/]+$", re.IGNORECASE)
+# Size and variant suffixes CDNs append to the same file name
+SIZE_SUFFIX_RE = re.compile(
+    r"(?:[-_](?:\d{2,5}x\d{2,5}|w\d{2,5}|h\d{2,5}|thumb|thumbnail|small|medium|large|scaled|cropped)|@\dx)$",
+    re.IGNORECASE,
+)
+SIZE_PREFIX_RE = re.compile(r"^\d{2,5}px-", re.IGNORECASE)
+# File stems shorter than this (or purely numeric) say nothing about the photo
+MIN_NAME_LENGTH = 8
+
+logger = get_logger("image_dedup")
+
+
+def url_fingerprint(url):
+    """
+    Key shared by the size variants and CDN copies of one file.
+
+    A distinctive file name identifies the photo within one host (unrelated sites reuse names
+    like "badshahi-mosque", so copies on other hosts are left to the dHash); generic or numeric
+    names fall back to host and path.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").removeprefix("www.")
+    path = unquote(parts.path)
+    match = WIKIMEDIA_THUMB_RE.search(path)
+    name = match.group(1) if match else path.rstrip("/").rsplit("/", 1)[-1]
+    stem = SIZE_PREFIX_RE.sub("", name.rsplit(".", 1)[0].lower())
+    while True:
+        shorter = SIZE_SUFFIX_RE.sub("", stem)
+        if shorter == stem:
+            break
+        stem = shorter
+    if len(stem) >= MIN_NAME_LENGTH and not stem.replace("-", "").replace("_", "").isdigit():
+        return f"name:{host}/{stem}"
+    return f"path:{host}{path.lower()}"
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def dhash_arrays(pixels):
+    """
+    64-bit difference hashes for a stack of 8x9 grayscale thumbnails, shape (n, 8, 9)
+    """
+    import numpy as np
+
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(pixels), -1), axis=1)
+    return [int(value) for value in packed.view(">u8").ravel()]
+
+
+def decode_thumbnails(blobs):
+    """
+    dHash for each image body; None where it can't be decoded
+    """
+    import numpy as np
+    from PIL import Image as PILImage
+
+    rows = []
+    positions = []
+    for position, blob in enumerate(blobs):
+        if not blob:
+            continue
+        try:
+            with PILImage.open(io.BytesIO(blob)) as image:
+                small = image.convert("L").resize((HASH_WIDTH, HASH_HEIGHT), PILImage.Resampling.LANCZOS)
+        except Exception:
+            continue
+        rows.append(np.asarray(small, dtype=np.int16))
+        positions.append(position)
+    hashes = [None] * len(blobs)
+    if rows:
+        for position, value in zip(positions, dhash_arrays(np.stack(rows))):
+            hashes[position] = value
+    return hashes
+
+
+class HashIndex:
+    """
+    Hamming-radius lookups over 64-bit hashes, one vectorized XOR and popcount per query.
+
+    A BK-tree prunes almost nothing at useful radii on 64-bit dHashes, so a flat scan in
+    NumPy is faster at any size image_finder sees (and far beyond it).
+    """
+
+    def __init__(self, capacity=32):
+        import numpy as np
+
+        self._hashes = np.zeros(capacity, dtype=np.uint64)
+        self.size = 0
+
+    def add(self, value):
+        import numpy as np
+
+        if self.size == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+        self._hashes[self.size] = value
+        self.size += 1
+
+    def find(self, value, radius):
+        """
+        Some stored hash within ``radius`` of ``value``, or None
+        """
+        import numpy as np
+
+        if not self.size:
+            return None
+        distances = np.bitwise_count(self._hashes[:self.size] ^ np.uint64(value))
+        index = int(distances.argmin())
+        return int(self._hashes[index]) if distances[index] <= radius else None
+
+
+class DedupStats:
+    def __init__(self):
+        self.images = 0
+        self.url_duplicates = 0
+        self.pixel_duplicates = 0
+        self.hashed = 0
+        self.hotel_images_reassigned = 0
+
+    def snapshot(self):
+        return dict(vars(self))
+
+
+dedup_stats = DedupStats()
+
+
+def pixel_hashing_available():
+    if not IMAGE_DEDUP_PIXELS:
+        return False
+    try:
+        import numpy as np
+        from PIL import Image  # noqa: F401
+    except ImportError:
+        # Without them only URL fingerprints are compared
+        return False
+    # np.bitwise_count needs NumPy 2
+    return hasattr(np, "bitwise_count")
+
+
+async def thumbnail_hash(url):
+    async def compute():
+        blob = await image_prober.fetch(url, IMAGE_DEDUP_MAX_THUMBNAIL_BYTES)
+        if blob is None:
+            return None
+        value = (await asyncio.to_thread(decode_thumbnails, [blob]))[0]
+        return None if value is None else f"{value:016x}"
+
+    async def recorded():
+        # A replayed run without a fixture for this thumbnail fails here and the image goes unhashed
+        return await fixture_store.call(NAMESPACE, url_key(url), compute)
+
+    if fixture_store.active:
+        cached = await recorded()
+    else:
+        cached = await get_serp_cache().get_or_fetch(NAMESPACE, url_key(url), recorded, cacheable=lambda v: v is not None)
+    return None if cached is None else int(cached, 16)
+
+
+async def perceptual_hashes(thumbnails, deadline=IMAGE_DEDUP_DEADLINE_SECONDS):
+    """
+    dHash per thumbnail URL (cached per URL); None where missing, undecodable or past the deadline
+    """
+    tasks = [asyncio.ensure_future(thumbnail_hash(url)) if url else None for url in thumbnails]
+    running = [task for task in tasks if task is not None]
+    if running:
+        with span("image_dedup", "thumbnails", count=len(running)):
+            await asyncio.wait(running, timeout=deadline)
+    hashes = []
+    for task in tasks:
+        if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+            if task is not None and not task.done():
+                task.cancel()
+            hashes.append(None)
+        else:
+            hashes.append(task.result())
+    dedup_stats.hashed += sum(value is not None for value in hashes)
+    return hashes
+
+
+async def dedupe_images(images, max_images=None, distance=IMAGE_DEDUP_DISTANCE):
+    """
+    Drop copies of the same photo, keeping the first of each; order is kept.
+
+    Copies are found by URL fingerprint and, when thumbnails can be hashed, by dHash
+    distance. Thumbnails are only fetched for images whose URL looks new.
+    """
+    distinct = []
+    seen = set()
+    for image in images:
+        key = url_fingerprint(image["url"])
+        if key in seen:
+            dedup_stats.url_duplicates += 1
+            continue
+        seen.add(key)
+        distinct.append(image)
+    dedup_stats.images += len(images)
+
+    if not pixel_hashing_available():
+        return distinct[:max_images] if max_images else distinct
+
+    hashes = await perceptual_hashes([image.get("thumbnail") for image in distinct])
+    index = HashIndex()
+    kept = []
+    for image, value in zip(distinct, hashes):
+        if value is not None:
+            if index.find(value, distance) is not None:
+                dedup_stats.pixel_duplicates += 1
+                logger.debug("Dropping near-duplicate image %s", image["url"])
+                continue
+            index.add(value)
+        kept.append(image)
+        if max_images and len(kept) >= max_images:
+            break
+    return kept
+
+
+def assign_hotel_images(itinerary):
+    """
+    Give every distinct hotel its own image, deterministically.
+
+    A hotel keeps the model's image unless another hotel already has it (or a copy of it),
+    in which case it gets the first unused image from ``hotel_images``. Days at the same
+    hotel share its image. Returns the number of days whose hotel image changed.
+    """
+    days = itinerary.get("daily_itinerary") or []
+    pool = [image["url"] for image in itinerary.get("hotel_images") or [] if isinstance(image, dict) and image.get("url")]
+    chosen = {}
+    used = set()
+    changed = 0
+    fixed_days = []
+    for day in days:
+        hotel = day.get("hotel") if isinstance(day, dict) else None
+        if not hotel:
+            fixed_days.append(day)
+            continue
+        name = " ".join(str(hotel.get("name", "")).lower().split())
+        if name not in chosen:
+            image = hotel.get("hotel_image")
+            if not image or url_fingerprint(image) in used:
+                image = next((url for url in pool if url_fingerprint(url) not in used), image)
+            if image:
+                used.add(url_fingerprint(image))
+            chosen[name] = image
+        image = chosen[name]
+        if image != hotel.get("hotel_image"):
+            changed += 1
+            day = {**day, "hotel": {**hotel, "hotel_image": image}}
+        fixed_days.append(day)
+    if changed:
+        itinerary["daily_itinerary"] = fixed_days
+        dedup_stats.hotel_images_reassigned += changed
+    return changed
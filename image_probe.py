@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import os
+
+import httpx
+
+from cache import get_serp_cache
+from replay import ReplayMissError, fixture_store
+from telemetry import get_logger, span
+
+
+IMAGE_PROBE_ENABLED = os.getenv("IMAGE_PROBE_ENABLED", "1") == "1"
+IMAGE_PROBE_TIMEOUT_SECONDS = float(os.getenv("IMAGE_PROBE_TIMEOUT_SECONDS", "2"))
+# Whole-batch deadline; images still unverified by then are kept and finish probing in the background
+IMAGE_PROBE_DEADLINE_SECONDS = float(os.getenv("IMAGE_PROBE_DEADLINE_SECONDS", "3"))
+IMAGE_PROBE_MAX_CONCURRENCY = int(os.getenv("IMAGE_PROBE_MAX_CONCURRENCY", "16"))
+IMAGE_PROBE_MIN_BYTES = int(os.getenv("IMAGE_PROBE_MIN_BYTES", "5000"))
+IMAGE_PROBE_MAX_BYTES = int(os.getenv("IMAGE_PROBE_MAX_BYTES", str(15 * 1024 * 1024)))
+# Sent as Referer so hotlink-protected images fail here rather than in the browser
+IMAGE_PROBE_REFERER = os.getenv("IMAGE_PROBE_REFERER", "https://pakigentravel.vercel.app/")
+
+NAMESPACE = "image_probe"
+
+# Some hosts reject HEAD outright or answer it without the headers we need
+HEAD_UNSUPPORTED = {400, 403, 405, 501}
+
+logger = get_logger("image_probe")
+
+
+def url_key(url):
+    """
+    Cache params for a per-URL entry; cache keys are lower-cased, but URL paths are case-sensitive
+    """
+    return {"url_sha256": hashlib.sha256(url.encode()).hexdigest()}
+
+
+def _size_from(response):
+    content_range = response.headers.get("content-range", "")
+    if "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total.isdigit():
+            return int(total)
+    length = response.headers.get("content-length")
+    if length and length.isdigit() and response.status_code == 200:
+        return int(length)
+    return None
+
+
+def judge(response):
+    """
+    Verdict for a HEAD or ranged GET response
+    """
+    content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+    size = _size_from(response)
+    verdict = {"ok": False, "status": response.status_code, "content_type": content_type, "bytes": size}
+    if response.status_code not in (200, 206):
+        return {**verdict, "reason": f"HTTP {response.status_code}"}
+    if not content_type.startswith("image/"):
+        return {**verdict, "reason": f"not an image ({content_type or 'no content type'})"}
+    if size is not None and size < IMAGE_PROBE_MIN_BYTES:
+        return {**verdict, "reason": f"too small ({size} bytes)"}
+    if size is not None and size > IMAGE_PROBE_MAX_BYTES:
+        return {**verdict, "reason": f"too large ({size} bytes)"}
+    return {**verdict, "ok": True, "reason": "ok"}
+
+
+class ImageProber:
+    """
+    Checks that image URLs are live, really images, and not hotlink-blocked.
+
+    Sends HEAD first and falls back to a ranged GET when HEAD is refused or inconclusive;
+    either way only headers are read. Verdicts go through the shared two-tier cache, so a
+    popular image is probed once per TTL instead of on every request. When a probe can't
+    tell (timeouts, connection errors, the batch deadline) the image is kept, and nothing
+    is cached.
+    """
+
+    def __init__(self, timeout=IMAGE_PROBE_TIMEOUT_SECONDS, deadline=IMAGE_PROBE_DEADLINE_SECONDS,
+                 max_concurrency=IMAGE_PROBE_MAX_CONCURRENCY, referer=IMAGE_PROBE_REFERER, cache=None):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_concurrency = max_concurrency
+        self.referer = referer
+        self.cache = cache
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        self._background = set()
+        self.stats = {"probed": 0, "ok": 0, "rejected": 0, "errors": 0, "unverified": 0}
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop or self._client.is_closed:
+            headers = {"User-Agent": "Mozilla/5.0 (compatible; create-itinerary-agent)", "Accept": "image/*"}
+            if self.referer:
+                headers["Referer"] = self.referer
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self.max_concurrency),
+                headers=headers,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    async def _probe_url(self, url):
+        client = self._ensure_client()
+        async with self._semaphore:
+            with span("image_probe", "probe") as probe_span:
+                self.stats["probed"] += 1
+                try:
+                    response = await client.head(url)
+                    if response.status_code in HEAD_UNSUPPORTED or not response.headers.get("content-type"):
+                        # Streamed and closed unread: a server that ignores Range would send the whole image
+                        async with client.stream("GET", url, headers={"Range": "bytes=0-1023"}) as response:
+                            pass
+                except httpx.HTTPError as e:
+                    self.stats["errors"] += 1
+                    probe_span.status = "error"
+                    return {"ok": True, "reason": f"{type(e).__name__}", "transient": True}
+                verdict = judge(response)
+                probe_span.set(ok=verdict["ok"], status_code=response.status_code)
+                return verdict
+
+    async def fetch(self, url, max_bytes):
+        """
+        Body of a small resource such as a thumbnail, or None if it fails or is larger than ``max_bytes``
+        """
+        client = self._ensure_client()
+        body = bytearray()
+        async with self._semaphore:
+            try:
+                async with client.stream("GET", url) as response:
+                    length = response.headers.get("content-length")
+                    if response.status_code != 200 or (length and length.isdigit() and int(length) > max_bytes):
+                        return None
+                    # Stop reading as soon as it is too large, whatever content-length said
+                    async for chunk in response.aiter_bytes():
+                        body.extend(chunk)
+                        if len(body) > max_bytes:
+                            return None
+            except httpx.HTTPError:
+                return None
+        return bytes(body)
+
+    async def _recorded_probe(self, url):
+        try:
+            return await fixture_store.call(NAMESPACE, url_key(url), lambda: self._probe_url(url))
+        except ReplayMissError:
+            # Like a probe still running at the deadline: the image is kept
+            return {"ok": True, "reason": "not recorded", "transient": True}
+
+    async def verdict(self, url):
+        if fixture_store.active:
+            return await self._recorded_probe(url)
+        cache = self.cache or get_serp_cache()
+        return await cache.get_or_fetch(
+            NAMESPACE,
+            url_key(url),
+            lambda: self._recorded_probe(url),
+            cacheable=lambda v: not v.get("transient"),
+        )
+
+    async def filter_live(self, images):
+        """
+        Drop images whose URL is dead, not an image, or blocked; order is kept.
+
+        Probes run concurrently and the batch waits at most ``deadline`` seconds. Images that
+        can't be checked are kept: those still unverified at the deadline (their probes finish
+        in the background and warm the cache for next time) and those whose probe failed.
+        """
+        urls = [image["url"] for image in images]
+        if not urls:
+            return images
+        tasks = {url: asyncio.ensure_future(self.verdict(url)) for url in dict.fromkeys(urls)}
+        done, pending = await asyncio.wait(tasks.values(), timeout=self.deadline)
+        for task in pending:
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+        live = []
+        for image in images:
+            task = tasks[image["url"]]
+            verdict = task.result() if task in done and task.exception() is None else None
+            if verdict is None or verdict.get("transient"):
+                self.stats["unverified"] += 1
+                live.append(image)
+                continue
+            if verdict["ok"]:
+                self.stats["ok"] += 1
+                live.append(image)
+            else:
+                self.stats["rejected"] += 1
+                logger.debug("Dropping image %s: %s", image["url"], verdict["reason"])
+        return live
+
+    def snapshot(self):
+        return {**self.stats, "background": len(self._background)}
+
+    async def aclose(self):
+        for task in list(self._background):
+            task.cancel()
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+image_prober = ImageProber()
+
+
+async def filter_live_images(images):
+    if not IMAGE_PROBE_ENABLED:
+        return images
+    return await image_prober.filter_live(images)
@@ -0,0 +1,443 @@
+import json
+import os
+import re
+from typing import Annotated, List, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, TypeAdapter, ValidationError
+
+
+ITINERARY_REPAIR_ATTEMPTS = int(os.getenv("ITINERARY_REPAIR_ATTEMPTS", "2"))
+
+# How many times a truncated reply is cut back to an earlier comma/bracket before giving up
+PARTIAL_TRIM_LIMIT = 64
+
+DAY_PATH = re.compile(r"^daily_itinerary\[(\d+)\]$")
+
+
+def parse_amount(value):
+    """
+    Accept "15,000", "PKR 15000" or "Rs. 2,500/night" where a number is expected
+    """
+    if isinstance(value, str):
+        match = re.search(r"-?\d[\d,]*(?:\.\d+)?", value)
+        if match:
+            return match.group().replace(",", "")
+    return value
+
+
+Amount = Annotated[float, BeforeValidator(parse_amount)]
+
+
+class Section(BaseModel):
+    # Extra keys the model adds are kept, not rejected
+    model_config = ConfigDict(extra="allow")
+
+
+class TripDetails(Section):
+    destination: str
+    duration: int
+    travel_date: str
+    companions: int
+    budget: Amount
+    interests: List[str] = []
+
+
+class Image(Section):
+    url: str
+
+
+class Hotel(Section):
+    name: str
+    price: Amount
+    rating: Optional[float] = None
+    reviews: Optional[int] = None
+    booking_url: Optional[str] = None
+    hotel_image: Optional[str] = None
+
+
+class Transportation(Section):
+    type: str
+    cost: Amount
+
+
+class Meal(Section):
+    type: str
+    venue: Optional[str] = None
+    cost: Amount
+
+
+class Activity(Section):
+    name: str
+    description: Optional[str] = None
+    cost: Amount
+
+
+class DayPlan(Section):
+    day: int
+    date: str
+    day_title: str
+    description: str
+    hotel: Optional[Hotel] = None
+    transportation: Optional[Transportation] = None
+    meals: List[Meal] = []
+    activities: List[Activity] = []
+
+
+class Itinerary(Section):
+    trip_details: TripDetails
+    destination_images: List[Image] = []
+    hotel_images: List[Image] = []
+    daily_itinerary: List[DayPlan]
+    total_cost: Amount
+    remaining_budget: Amount
+
+
+# Top-level sections validated (and repaired) on their own; days are handled one by one
+SECTION_ADAPTERS = {
+    "trip_details": TypeAdapter(TripDetails),
+    "destination_images": TypeAdapter(List[Image]),
+    "hotel_images": TypeAdapter(List[Image]),
+    "total_cost": TypeAdapter(Amount),
+    "remaining_budget": TypeAdapter(Amount),
+}
+
+# Path used when nothing could be recovered and the whole document has to be re-emitted
+WHOLE_ITINERARY = "itinerary"
+
+
+def _strip_fences(text):
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("\n", 1)[1] if "\n" in cleaned else ""
+        if "```" in cleaned:
+            cleaned = cleaned.rsplit("```", 1)[0]
+    start = cleaned.find("{")
+    return cleaned[start:] if start >= 0 else cleaned
+
+
+def _clean_json(text):
+    """
+    Drop ``#``/``//`` comments (copied from the prompt's schema) and trailing commas, outside strings
+    """
+    out = []
+    in_string = escape = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch == "#" or text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = len(text) if newline < 0 else newline
+            continue
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            out.append(ch)
+        else:
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+
+def _scan(text):
+    """
+    Walk ``text`` outside strings. Returns the containers still open at the end (each with its
+    key or index in its parent), whether it ends inside a string, and the position of the last
+    comma or bracket that a cut-off value can be trimmed back to.
+    """
+    stack = []
+    in_string = escape = False
+    key_chars = None
+    last_cut = -1
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if key_chars is not None:
+                    stack[-1]["key"] = "".join(key_chars)
+                    key_chars = None
+            elif key_chars is not None:
+                key_chars.append(ch)
+        elif ch == '"':
+            in_string = True
+            if stack and stack[-1]["kind"] == "{" and stack[-1]["expect_key"]:
+                key_chars = []
+        elif ch in "{[":
+            parent = stack[-1] if stack else None
+            name = None if parent is None else parent["key"] if parent["kind"] == "{" else parent["index"]
+            stack.append({"kind": ch, "name": name, "key": None, "index": 0, "expect_key": ch == "{"})
+            last_cut = i
+        elif ch in "}]" and stack:
+            stack.pop()
+        elif ch == ":" and stack:
+            stack[-1]["expect_key"] = False
+        elif ch == "," and stack:
+            stack[-1]["index"] += 1
+            stack[-1]["expect_key"] = stack[-1]["kind"] == "{"
+            last_cut = i
+    return stack, in_string, last_cut
+
+
+def _unfinished_section(stack):
+    """
+    The section a reply was cut off in: ("daily_itinerary", day index), (top-level key, None),
+    or None when it stopped between sections or days
+    """
+    path = [frame["name"] for frame in stack[1:]]
+    if path and path[0] == WHOLE_ITINERARY:
+        path = path[1:]
+    if not path or not isinstance(path[0], str):
+        return None
+    if path[0] == "daily_itinerary":
+        return ("daily_itinerary", path[1]) if len(path) > 1 and isinstance(path[1], int) else None
+    return path[0], None
+
+
+def _drop_section(data, section):
+    """
+    Remove a cut-off section; a cut-off day is replaced by None so later days keep their place
+    """
+    document = data.get(WHOLE_ITINERARY) if isinstance(data.get(WHOLE_ITINERARY), dict) else data
+    key, index = section
+    if index is None:
+        document.pop(key, None)
+        return
+    days = document.get(key)
+    if isinstance(days, list) and index < len(days):
+        days[index] = None
+
+
+def complete_partial_json(text, drop_unfinished=True):
+    """
+    Decode JSON that was cut off mid-stream by closing whatever is still open.
+
+    A half-written string, number or dangling key at the end is trimmed back to the last comma
+    or bracket, so the result only holds values that were fully written. With
+    ``drop_unfinished`` the day or top-level section the reply stopped in is dropped as well
+    (a day becomes None), so validation reports it and it gets written again.
+    """
+    candidate = text.rstrip()
+    stack, in_string, last_cut = _scan(candidate)
+    unfinished = _unfinished_section(stack)
+    for _ in range(PARTIAL_TRIM_LIMIT):
+        # Only a closed string or container, or a comma or bracket, is known to end where it was meant to
+        if candidate and not in_string and candidate[-1] in '"}],{[':
+            closed = candidate + "".join("}" if frame["kind"] == "{" else "]" for frame in reversed(stack))
+            try:
+                data = json.loads(_clean_json(closed))
+            except ValueError:
+                pass
+            else:
+                if drop_unfinished and unfinished and isinstance(data, dict):
+                    _drop_section(data, unfinished)
+                return data
+        if last_cut <= 0:
+            return None
+        # Back to the last comma or bracket (keeping it), or past it if that already failed
+        candidate = candidate[:last_cut] if last_cut == len(candidate) - 1 else candidate[:last_cut + 1]
+        stack, in_string, last_cut = _scan(candidate)
+    return None
+
+
+def parse_itinerary_text(text, drop_unfinished=True):
+    """
+    Best-effort decode of the model's itinerary reply.
+
+    Tolerates ```json fences, surrounding prose, comments, trailing commas and output that
+    stops early. Returns (data, complete) where ``complete`` is False if the reply was cut
+    off and had to be closed (see ``complete_partial_json``); data is None if nothing could
+    be recovered.
+    """
+    if not isinstance(text, str) or not text.strip():
+        return None, False
+    body = _strip_fences(text)
+    try:
+        return json.loads(body), True
+    except ValueError:
+        pass
+    cleaned = _clean_json(body)
+    try:
+        return json.loads(cleaned), True
+    except ValueError:
+        pass
+    # Complete JSON followed by prose
+    try:
+        return json.JSONDecoder().raw_decode(cleaned)[0], True
+    except ValueError:
+        pass
+    return complete_partial_json(body, drop_unfinished), False
+
+
+def _errors(exc):
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc']) or 'value'}: {err['msg']}" for err in exc.errors()[:5]
+    )
+
+
+def validate_sections(data, expected_days=None):
+    """
+    Validate an itinerary section by section.
+
+    Returns (normalized, invalid) where ``normalized`` holds the coerced values of every valid
+    section and ``invalid`` maps section paths such as ``daily_itinerary[2]`` to the problem.
+    Days missing from a truncated reply are reported as invalid so only they get rewritten.
+    """
+    if not isinstance(data, dict):
+        return {}, {WHOLE_ITINERARY: "reply is not a JSON object"}
+
+    try:
+        itinerary = Itinerary.model_validate(data)
+        if not expected_days or len(itinerary.daily_itinerary) == expected_days:
+            return itinerary.model_dump(), {}
+    except ValidationError:
+        pass
+
+    normalized = {key: value for key, value in data.items() if key not in SECTION_ADAPTERS and key != "daily_itinerary"}
+    invalid = {}
+    for path, adapter in SECTION_ADAPTERS.items():
+        if path not in data:
+            invalid[path] = "missing"
+            continue
+        try:
+            normalized[path] = adapter.dump_python(adapter.validate_python(data[path]))
+        except ValidationError as exc:
+            invalid[path] = _errors(exc)
+
+    days = data.get("daily_itinerary")
+    if not isinstance(days, list):
+        days = []
+    day_count = expected_days or len(days)
+    normalized_days = []
+    for index in range(day_count):
+        path = f"daily_itinerary[{index}]"
+        if index >= len(days) or days[index] is None:
+            invalid[path] = f"missing (day {index + 1} of {day_count})"
+            normalized_days.append(None)
+            continue
+        try:
+            normalized_days.append(DayPlan.model_validate(days[index]).model_dump())
+        except ValidationError as exc:
+            invalid[path] = _errors(exc)
+            normalized_days.append(days[index])
+    normalized["daily_itinerary"] = normalized_days
+    return normalized, invalid
+
+
+def section_value(data, path):
+    match = DAY_PATH.match(path)
+    if match:
+        days = data.get("daily_itinerary") or []
+        index = int(match.group(1))
+        return days[index] if index < len(days) else None
+    return data.get(path)
+
+
+def apply_patch(data, patch, allowed_paths):
+    """
+    Merge re-emitted sections into the draft; keys outside ``allowed_paths`` are ignored
+    """
+    if not isinstance(patch, dict):
+        return data, []
+    if WHOLE_ITINERARY in allowed_paths:
+        # Nothing was usable before, so the reply is a fresh document (possibly still keyed by path)
+        return patch.get(WHOLE_ITINERARY, patch), [WHOLE_ITINERARY]
+    merged = {**data, "daily_itinerary": list(data.get("daily_itinerary") or [])}
+    applied = []
+    for path, value in patch.items():
+        if path not in allowed_paths:
+            continue
+        match = DAY_PATH.match(path)
+        if match:
+            index = int(match.group(1))
+            days = merged["daily_itinerary"]
+            days.extend([None] * (index + 1 - len(days)))
+            days[index] = value
+        else:
+            merged[path] = value
+        applied.append(path)
+    return merged, applied
+
+
+def apply_budget_plan(data, budget_plan, budget):
+    """
+    Costs come from the optimizer (or simple arithmetic), never from the model's own maths
+    """
+    fixed = dict(data)
+    if budget_plan:
+        fixed["total_cost"] = budget_plan["total_cost"]
+        fixed["remaining_budget"] = budget_plan["remaining_budget"]
+    elif isinstance(fixed.get("total_cost"), (int, float)) and budget is not None:
+        fixed["remaining_budget"] = float(budget) - fixed["total_cost"]
+    return fixed
+
+
+def repair_prompt(draft, invalid, budget_plan=None):
+    """
+    Ask for just the broken sections, keyed by path, instead of a whole new itinerary
+    """
+    if WHOLE_ITINERARY in invalid:
+        return (
+            "Your reply could not be read as JSON; do not call any tools. "
+            "Reply with the complete itinerary as a single valid JSON object and nothing else."
+        )
+    current = {path: section_value(draft, path) for path in invalid}
+    lines = [
+        "Some sections of your itinerary JSON are invalid or missing; do not call any tools. "
+        "Re-emit ONLY these sections as one JSON object keyed by the section path "
+        '(e.g. {"daily_itinerary[2]": {...}}), following the itinerary structure from the instructions. '
+        "Do not repeat any other section.",
+        "",
+        "Problems:",
+    ]
+    lines += [f"- {path}: {problem}" for path, problem in invalid.items()]
+    lines += ["", "Current values:", json.dumps(current, ensure_ascii=False, default=str)]
+    if budget_plan:
+        plan_days = []
+        for path in invalid:
+            match = DAY_PATH.match(path)
+            if match and int(match.group(1)) < len(budget_plan["days"]):
+                plan_days.append(budget_plan["days"][int(match.group(1))])
+        if plan_days:
+            lines += ["", "Budget plan for these days (use it exactly):", json.dumps(plan_days, ensure_ascii=False)]
+    return "\n".join(lines)
+
+
+class ValidationStats:
+    """
+    How often the final reply was valid, and how much repairing it took
+    """
+
+    def __init__(self):
+        self.replies = 0
+        self.valid_first_try = 0
+        self.repair_calls = 0
+        self.sections_repaired = 0
+        self.unrepaired = 0
+
+    def snapshot(self):
+        return {
+            "replies": self.replies,
+            "valid_first_try": self.valid_first_try,
+            "repair_calls": self.repair_calls,
+            "sections_repaired": self.sections_repaired,
+            "unrepaired": self.unrepaired,
+        }
+
+
+validation_stats = ValidationStats()
@@ -0,0 +1,432 @@
+import abc
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from telemetry import get_logger, metrics, span
+
+
+# "memory", "sqlite", or "package.module:factory" for a custom JobStore
+JOB_BACKEND = os.getenv("JOB_BACKEND", "memory")
+JOB_SQLITE_PATH = os.getenv("JOB_SQLITE_PATH", ".cache/jobs.sqlite")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Submissions beyond this many waiting jobs are refused with 429 instead of queueing forever
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_TIMEOUT_SECONDS = float(os.getenv("JOB_TIMEOUT_SECONDS", "900"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", str(24 * 3600)))
+# How often a stream re-reads the store, for jobs run by another process
+JOB_STREAM_POLL_SECONDS = float(os.getenv("JOB_STREAM_POLL_SECONDS", "1"))
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+
+logger = get_logger("jobs")
+
+
+class QueueFullError(Exception):
+    """Raised by ``JobQueue.submit`` when admission control refuses a job"""
+
+    def __init__(self, depth, retry_after):
+        super().__init__(f"{depth} jobs are already waiting")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+def new_job(payload, priority="normal"):
+    return {
+        "job_id": uuid.uuid4().hex,
+        "status": "queued",
+        "priority": priority,
+        "payload": payload,
+        "submitted_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+
+
+class JobStore(abc.ABC):
+    """
+    Where jobs and their progress events live. Subclass it to back jobs with another
+    database; every method may block, so the queue calls them off the event loop.
+    """
+
+    @abc.abstractmethod
+    def create(self, job):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, job_id):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append_event(self, job_id, event):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def events(self, job_id, after=0):
+        """
+        Events numbered from 1; only those after ``after``
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def unfinished(self):
+        """
+        Jobs still queued or running, oldest first, to re-queue after a restart
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def purge(self, finished_before):
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        self._jobs = {}
+        self._events = {}
+
+    def create(self, job):
+        self._jobs[job["job_id"]] = dict(job)
+        self._events[job["job_id"]] = []
+
+    def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    def update(self, job_id, **fields):
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields)
+
+    def append_event(self, job_id, event):
+        self._events.setdefault(job_id, []).append(event)
+
+    def events(self, job_id, after=0):
+        return list(enumerate(self._events.get(job_id, [])[after:], start=after + 1))
+
+    def unfinished(self):
+        return [dict(job) for job in self._jobs.values() if job["status"] not in TERMINAL_STATUSES]
+
+    def purge(self, finished_before):
+        for job_id in [j for j, job in self._jobs.items() if (job["finished_at"] or float("inf")) < finished_before]:
+            del self._jobs[job_id]
+            self._events.pop(job_id, None)
+
+
+class SqliteJobStore(JobStore):
+    """
+    Jobs in a local SQLite file, so they survive a restart and every worker process can poll them
+    """
+
+    FIELDS = ("status", "priority", "payload", "submitted_at", "started_at", "finished_at", "result", "error")
+    JSON_FIELDS = {"payload", "result"}
+
+    def __init__(self, path=JOB_SQLITE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT, priority TEXT, payload TEXT, "
+            "submitted_at REAL, started_at REAL, finished_at REAL, result TEXT, error TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events (job_id TEXT, seq INTEGER, event TEXT, PRIMARY KEY (job_id, seq))"
+        )
+        self._conn.commit()
+
+    def _encode(self, field, value):
+        return json.dumps(value, ensure_ascii=False, default=str) if field in self.JSON_FIELDS and value is not None else value
+
+    def _row(self, row):
+        job = {"job_id": row[0]}
+        for field, value in zip(self.FIELDS, row[1:]):
+            job[field] = json.loads(value) if field in self.JSON_FIELDS and value is not None else value
+        return job
+
+    def create(self, job):
+        values = [job["job_id"]] + [self._encode(field, job[field]) for field in self.FIELDS]
+        with self._lock:
+            self._conn.execute(f"INSERT INTO jobs VALUES ({', '.join('?' * len(values))})", values)
+            self._conn.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._row(row) if row is not None else None
+
+    def update(self, job_id, **fields):
+        assignments = ", ".join(f"{field} = ?" for field in fields)
+        values = [self._encode(field, value) for field, value in fields.items()]
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*values, job_id))
+            self._conn.commit()
+
+    def append_event(self, job_id, event):
+        payload = json.dumps(event, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO job_events (job_id, seq, event) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ? FROM job_events WHERE job_id = ?",
+                (job_id, payload, job_id),
+            )
+            self._conn.commit()
+
+    def events(self, job_id, after=0):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+            ).fetchall()
+        return [(seq, json.loads(event)) for seq, event in rows]
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY submitted_at"
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def purge(self, finished_before):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE finished_at < ?)",
+                (finished_before,),
+            )
+            self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (finished_before,))
+            self._conn.commit()
+
+
+def open_job_store(kind=JOB_BACKEND):
+    if kind == "memory":
+        return MemoryJobStore()
+    if kind == "sqlite":
+        return SqliteJobStore()
+    if ":" in kind:
+        module, _, factory = kind.partition(":")
+        return getattr(importlib.import_module(module), factory)()
+    raise ValueError(f"Unknown job backend: {kind!r}")
+
+
+class JobQueue:
+    """
+    Runs submitted jobs on a fixed pool of workers, highest priority first, then in order.
+
+    ``runner(job, emit)`` does the work and returns the result; ``emit(event)`` records a
+    progress event for pollers and streams. Once ``max_queued`` jobs are waiting, new
+    submissions raise ``QueueFullError`` with a ``retry_after`` estimate, so a spike is
+    turned away early instead of timing out in the queue.
+
+    Jobs found queued or running in the store at ``start()`` are run again, which assumes a
+    single process runs the jobs of a given store; other processes can still poll and stream them.
+    """
+
+    def __init__(self, runner, store=None, workers=JOB_WORKERS, max_queued=JOB_MAX_QUEUED,
+                 timeout=JOB_TIMEOUT_SECONDS, result_ttl=JOB_RESULT_TTL_SECONDS):
+        self.runner = runner
+        self.store = store
+        self.workers = workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self._queue = None
+        # Ids still waiting in the queue; a job cancelled while queued leaves it here at once,
+        # though its entry stays in the queue until a worker skips it
+        self._waiting = set()
+        # Held while a job is cancelled in place or moved from queued to running, so a job a worker
+        # has just taken can't be both reported cancelled and run
+        self._lock = asyncio.Lock()
+        self._order = itertools.count()
+        self._tasks = []
+        self._running = {}
+        self._cancelled = set()
+        self._changed = {}
+        self._run_times = []
+        self.stats = {"submitted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "cancelled": 0, "timed_out": 0}
+
+    @property
+    def depth(self):
+        return len(self._waiting)
+
+    @property
+    def running(self):
+        return len(self._running)
+
+    async def start(self):
+        if self.store is None:
+            self.store = await asyncio.to_thread(open_job_store)
+        self._queue = asyncio.PriorityQueue()
+        await asyncio.to_thread(self.store.purge, time.time() - self.result_ttl)
+        # Jobs cut off by a restart start again from scratch
+        for job in await asyncio.to_thread(self.store.unfinished):
+            await asyncio.to_thread(self.store.update, job["job_id"], status="queued", started_at=None)
+            self._enqueue(job)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _enqueue(self, job):
+        self._waiting.add(job["job_id"])
+        self._queue.put_nowait((PRIORITIES.get(job["priority"], PRIORITIES["normal"]), next(self._order), job["job_id"]))
+
+    def retry_after(self):
+        """
+        Rough seconds until a new job would start, from recent run times
+        """
+        recent = self._run_times[-50:]
+        average = sum(recent) / len(recent) if recent else 60.0
+        return max(1, round(average * (self.depth + 1) / max(self.workers, 1)))
+
+    async def submit(self, payload, priority="normal"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority {priority!r}")
+        if self._queue is None:
+            raise RuntimeError("JobQueue.start() has not run")
+        if self.depth >= self.max_queued:
+            self.stats["rejected"] += 1
+            raise QueueFullError(self.depth, self.retry_after())
+        job = new_job(payload, priority)
+        await asyncio.to_thread(self.store.create, job)
+        self._enqueue(job)
+        self.stats["submitted"] += 1
+        return job
+
+    async def get(self, job_id):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is not None and job["status"] == "queued":
+            job["queue_depth"] = self.depth
+        return job
+
+    async def cancel(self, job_id):
+        """
+        Cancel a waiting or running job; returns the job, or None if it doesn't exist
+        """
+        async with self._lock:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None or job["status"] in TERMINAL_STATUSES:
+                return job
+            task = self._running.get(job_id)
+            if task is not None:
+                self._cancelled.add(job_id)
+                task.cancel()
+            else:
+                # Queued, or taken by a worker that hasn't started it; either way _run skips it
+                self._waiting.discard(job_id)
+                await self._finish(job_id, "cancelled")
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    def _notify(self, job_id):
+        changed = self._changed.pop(job_id, None)
+        if changed is not None:
+            changed.set()
+
+    async def _emit(self, job_id, event):
+        await asyncio.to_thread(self.store.append_event, job_id, event)
+        self._notify(job_id)
+
+    async def _finish(self, job_id, status, **fields):
+        await asyncio.to_thread(self.store.update, job_id, status=status, finished_at=time.time(), **fields)
+        self.stats[status] += 1
+        await self._emit(job_id, {"event": status, **({"detail": fields["error"]} if fields.get("error") else {})})
+
+    async def _worker(self):
+        while True:
+            job_id = await self._take()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                logger.exception("Job %s crashed the worker loop: %r", job_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def _take(self):
+        _, _, job_id = await self._queue.get()
+        self._waiting.discard(job_id)
+        return job_id
+
+    async def _run(self, job_id):
+        async with self._lock:
+            # Re-read under the lock: the job may have been cancelled since it was queued
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None or job["status"] != "queued":
+                return
+            started = time.time()
+            wait = started - job["submitted_at"]
+            metrics.observe("job_wait", wait, priority=job["priority"])
+            await asyncio.to_thread(self.store.update, job_id, status="running", started_at=started)
+            await self._emit(job_id, {"event": "running", "waited": round(wait, 3)})
+
+            task = asyncio.ensure_future(self.runner(job, lambda event: self._emit(job_id, event)))
+            self._running[job_id] = task
+        with span("job", "itinerary", priority=job["priority"], wait_seconds=round(wait, 3)) as job_span:
+            try:
+                result = await asyncio.wait_for(task, self.timeout)
+            except asyncio.CancelledError:
+                job_span.status = "cancelled"
+                if job_id not in self._cancelled:
+                    # The worker itself is shutting down; the job is re-queued on the next start
+                    raise
+                await self._finish(job_id, "cancelled")
+            except asyncio.TimeoutError:
+                job_span.status = "error"
+                self.stats["timed_out"] += 1
+                await self._finish(job_id, "failed", error=f"Timed out after {self.timeout:.0f}s")
+            except Exception as e:
+                job_span.status = "error"
+                logger.warning("Job %s failed: %r", job_id, e)
+                await self._finish(job_id, "failed", error=f"Error generating itinerary: {e}")
+            else:
+                await self._finish(job_id, "succeeded", result=result)
+            finally:
+                self._running.pop(job_id, None)
+                self._cancelled.discard(job_id)
+                self._run_times = self._run_times[-99:] + [time.time() - started]
+
+    async def events(self, job_id, after=0):
+        """
+        Yield ``(seq, event)`` from event ``after`` on until the job finishes
+        """
+        while True:
+            changed = self._changed.setdefault(job_id, asyncio.Event())
+            for seq, event in await asyncio.to_thread(self.store.events, job_id, after):
+                after = seq
+                yield seq, event
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None or job["status"] in TERMINAL_STATUSES:
+                # Events written between the read above and the status check
+                for seq, event in await asyncio.to_thread(self.store.events, job_id, after):
+                    yield seq, event
+                self._changed.pop(job_id, None)
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), JOB_STREAM_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self):
+        recent = self._run_times[-50:]
+        return {
+            **self.stats,
+            "queue_depth": self.depth,
+            "running": self.running,
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "mean_run_seconds": round(sum(recent) / len(recent), 3) if recent else None,
+        }
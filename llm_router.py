@@ -0,0 +1,336 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+from langgraph.constants import TAG_NOSTREAM
+
+from replay import fixture_store
+from telemetry import get_logger, span
+
+
+logger = get_logger("llm")
+
+
+# "provider:model" specs. Tool-selection and repair turns use the cheap route, the itinerary the final one.
+LLM_TOOL_MODEL = os.getenv("LLM_TOOL_MODEL", "openai:gpt-4o-mini")
+LLM_FINAL_MODEL = os.getenv("LLM_FINAL_MODEL", "openai:gpt-4o-mini")
+# Tried in order when the primary fails, is slow (hedging) or its breaker is open.
+# Gemini specs are only used when GOOGLE_API_KEY is set.
+LLM_FALLBACK_MODELS = os.getenv("LLM_FALLBACK_MODELS", "google_genai:gemini-1.5-flash")
+
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))  # 0 disables hedging
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+LLM_RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.2"))
+LLM_RETRY_BUDGET_BURST = float(os.getenv("LLM_RETRY_BUDGET_BURST", "10"))
+
+LATENCY_WINDOW = 200
+
+
+class LLMUnavailableError(Exception):
+    """Raised when every model on a route failed or was skipped"""
+
+
+class CircuitBreaker:
+    """
+    Stops sending calls to a model after ``failure_threshold`` consecutive failures.
+
+    After ``reset_timeout`` seconds one probe call is let through; its outcome closes or
+    re-opens the breaker. If the probe never reports back, another is allowed after a further
+    ``reset_timeout``.
+    """
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURES, reset_timeout=LLM_BREAKER_RESET_SECONDS,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def available(self):
+        """
+        Whether a call could go through now; changes nothing, so skipped endpoints keep their probe
+        """
+        return self.state == "closed" or self.clock() - self.opened_at >= self.reset_timeout
+
+    def try_acquire_probe(self):
+        """
+        Claim the right to send a call; an open breaker past its timeout turns half-open and
+        hands out its one probe. Call only right before sending.
+        """
+        if self.state == "closed":
+            return True
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self.opened_at = self.clock()
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+            self.state = "open"
+            self.opened_at = self.clock()
+
+
+class RetryBudget:
+    """
+    Token bucket that caps retries and hedges to a share of first attempts.
+
+    Every request deposits ``ratio`` tokens (up to ``burst``); every retry or hedge spends one,
+    so a failing provider can't turn each request into several.
+    """
+
+    def __init__(self, ratio=LLM_RETRY_BUDGET_RATIO, burst=LLM_RETRY_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self):
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self):
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class ModelEndpoint:
+    """
+    One chat model with its own breaker and recent latencies
+    """
+
+    def __init__(self, name, model, breaker=None):
+        self.name = name
+        self.model = model
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.failures = 0
+        self._bound = {}
+
+    def bound(self, tools):
+        if not tools:
+            return self.model
+        key = tuple(t.name for t in tools)
+        if key not in self._bound:
+            self._bound[key] = self.model.bind_tools(tools)
+        return self._bound[key]
+
+    def latency_percentile(self, pct, min_samples):
+        if len(self.latencies) < max(min_samples, 1):
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(pct / 100 * len(ordered)), len(ordered) - 1)]
+
+    def snapshot(self):
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "latency_p50": self.latency_percentile(50, 1),
+            "latency_p95": self.latency_percentile(95, 1),
+        }
+
+
+class LLMRouter:
+    """
+    Picks a model per graph step and makes the call resilient.
+
+    ``routes`` maps a step ("tools", "final", "repair") to endpoints in preference order.
+    A call goes to the first endpoint whose breaker is closed. If it is still running past that
+    endpoint's ``hedge_percentile`` latency, the next endpoint is raced against it and the first
+    answer wins. Failures move on to the next endpoint. Hedges and retries both draw on a shared
+    retry budget.
+    """
+
+    def __init__(self, routes, hedge_percentile=LLM_HEDGE_PERCENTILE, hedge_min_samples=LLM_HEDGE_MIN_SAMPLES,
+                 timeout=LLM_TIMEOUT_SECONDS, retry_budget=None):
+        self.routes = routes
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.timeout = timeout
+        self.retry_budget = retry_budget or RetryBudget()
+        self.requests = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failed = 0
+
+    def endpoints(self):
+        unique = {}
+        for endpoints in self.routes.values():
+            for endpoint in endpoints:
+                unique.setdefault(endpoint.name, endpoint)
+        return unique
+
+    async def _call(self, endpoint, messages, tools, route, hedge=False):
+        # A hedge's tokens would interleave with the primary's in the stream, so keep it out
+        config = {"tags": [TAG_NOSTREAM]} if hedge else None
+        endpoint.calls += 1
+        started = time.monotonic()
+        with span("llm", endpoint.name, route=route, hedge=hedge, messages=len(messages)) as llm_span:
+            try:
+                response = await asyncio.wait_for(endpoint.bound(tools).ainvoke(messages, config=config), self.timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                endpoint.failures += 1
+                endpoint.breaker.record_failure()
+                raise
+            usage = getattr(response, "usage_metadata", None) or {}
+            llm_span.set(
+                input_tokens=usage.get("input_tokens"),
+                output_tokens=usage.get("output_tokens"),
+                cached_tokens=(usage.get("input_token_details") or {}).get("cache_read"),
+                tool_calls=len(getattr(response, "tool_calls", None) or []),
+            )
+        endpoint.latencies.append(time.monotonic() - started)
+        endpoint.breaker.record_success()
+        return response
+
+    async def _hedged(self, primary, backup, messages, tools, route):
+        delay = None
+        if self.hedge_percentile > 0 and backup is not None:
+            delay = primary.latency_percentile(self.hedge_percentile, self.hedge_min_samples)
+        # Claimed even when refused: ainvoke only sends to an open breaker when every one is open
+        primary.breaker.try_acquire_probe()
+        primary_task = asyncio.ensure_future(self._call(primary, messages, tools, route))
+        if delay is None:
+            return await primary_task
+
+        pending = {primary_task}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary_task.result()
+            if not backup.breaker.available() or not self.retry_budget.withdraw():
+                return await primary_task
+
+            backup.breaker.try_acquire_probe()
+            self.hedges += 1
+            hedge_task = asyncio.ensure_future(self._call(backup, messages, tools, route, hedge=True))
+            pending = {primary_task, hedge_task}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def ainvoke(self, messages, route="final", tools=None):
+        candidates = self.routes[route]
+        healthy = [endpoint for endpoint in candidates if endpoint.breaker.available()]
+        # With every breaker open, still try the preferred model rather than fail outright
+        forced = not healthy
+        healthy = healthy or candidates[:1]
+        self.requests += 1
+        self.retry_budget.deposit()
+
+        error = None
+        failed = None
+        for attempt, endpoint in enumerate(healthy):
+            # Another request may have taken this endpoint's probe while earlier attempts ran
+            if not forced and not endpoint.breaker.available():
+                continue
+            if failed is not None:
+                if not self.retry_budget.withdraw():
+                    break
+                self.retries += 1
+                logger.warning("LLM call on %s failed (%r); retrying on %s", failed.name, error, endpoint.name)
+            backup = healthy[attempt + 1] if attempt + 1 < len(healthy) else None
+            try:
+                return await self._hedged(endpoint, backup, messages, tools, route)
+            except Exception as e:
+                error = e
+                failed = endpoint
+        self.failed += 1
+        raise LLMUnavailableError(f"No model on the {route!r} route answered: {error!r}") from error
+
+    def snapshot(self):
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failed": self.failed,
+            "retry_tokens": round(self.retry_budget.tokens, 2),
+            "routes": {route: [e.name for e in endpoints] for route, endpoints in self.routes.items()},
+            "models": {name: endpoint.snapshot() for name, endpoint in self.endpoints().items()},
+        }
+
+
+def _replay_placeholder_key():
+    # Replayed runs never reach the provider, but the clients refuse to be built without a key
+    return "replay" if fixture_store.mode == "replay" else None
+
+
+def make_chat_model(spec):
+    """
+    Build a chat model from a "provider:model" spec
+    """
+    provider, _, model = spec.partition(":")
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(model=model, api_key=os.getenv("OPENAI_API_KEY") or _replay_placeholder_key())
+    if provider == "google_genai":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=model, google_api_key=os.getenv("GOOGLE_API_KEY") or _replay_placeholder_key())
+    if provider == "fake":
+        # Local stand-in that needs no keys or network
+        from scripted_llm import ScriptedChatModel
+        return ScriptedChatModel(latency=float(model or 0))
+    raise ValueError(f"Unknown LLM provider in {spec!r}")
+
+
+def available_fallbacks(specs):
+    usable = []
+    for spec in (s.strip() for s in specs.split(",")):
+        if not spec:
+            continue
+        if spec.startswith("google_genai:") and not os.getenv("GOOGLE_API_KEY"):
+            continue
+        usable.append(spec)
+    return usable
+
+
+def build_router(tool_model=LLM_TOOL_MODEL, final_model=LLM_FINAL_MODEL, fallback_models=LLM_FALLBACK_MODELS,
+                 factory=make_chat_model):
+    """
+    Router from "provider:model" specs. Endpoints are shared between routes, so a breaker
+    opened by one step also protects the others.
+    """
+    endpoints = {}
+
+    def endpoint(spec):
+        if spec not in endpoints:
+            endpoints[spec] = ModelEndpoint(spec, factory(spec))
+        return endpoints[spec]
+
+    fallbacks = available_fallbacks(fallback_models)
+
+    def route(primary):
+        return [endpoint(spec) for spec in dict.fromkeys([primary, *fallbacks])]
+
+    return LLMRouter({"tools": route(tool_model), "final": route(final_model), "repair": route(tool_model)})
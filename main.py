@@ -1,11 +1,34 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Literal, Optional
+import uuid
+import os
+from contextlib import asynccontextmanager
 import uvicorn
 from langchain_core.messages import HumanMessage
 from fastapi.middleware.cors import CORSMiddleware
-from agent import graph 
+import agent
+from agent import build_graph, warm_up, GRAPH_MODE
+from checkpoint import open_checkpointer
+from prefetch import normalize_cities
+from serp_client import close_serpapi_client
+from image_probe import image_prober
+from image_dedup import dedup_stats
+from cache import get_serp_cache
+from compaction import compaction_stats
+from prompts import prompt_cache_stats
+from itinerary_schema import validation_stats
+from edits import edit_stats
+from destinations import destination_pack
+from coalesce import SingleFlight, request_fingerprint
+from streaming import STREAM_MODES, graph_events, format_ndjson, format_sse, update_events
+from jobs import JobQueue, QueueFullError
+from quota import QuotaExceededError, quota, quota_context
+from replay import fixture_store
+from telemetry import get_logger, log_payload, metrics, span
+import asyncio
 
 
 class TravelPlanRequest(BaseModel):
@@ -16,8 +39,59 @@ class TravelPlanRequest(BaseModel):
     days: int
     travel_date: str
     initial_message: str = "Plan my trip to Pakistan"
+    thread_id: Optional[str] = None  # reuse to continue an earlier itinerary
 
-app = FastAPI(title="Travel Planner API", description="API for generating travel itineraries using Langgraph.")
+
+class EditRequest(TravelPlanRequest):
+    thread_id: str  # the itinerary to change
+
+
+class JobRequest(TravelPlanRequest):
+    priority: Literal["high", "normal", "low"] = "normal"
+
+# "background" warms the LLM client after the server starts accepting requests, "blocking"
+# before it does (for platforms that route traffic only once startup finishes), "off" never
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background")
+# Header naming the client whose SerpAPI and LLM quota a request spends. Only set it behind a gateway
+# that writes the header itself; by default (empty) quotas are keyed on the caller's address.
+QUOTA_CLIENT_HEADER = os.getenv("QUOTA_CLIENT_HEADER", "")
+# Clients (as quotas name them) allowed to submit high-priority jobs, comma-separated. The high lane
+# keeps nothing in reserve for other lanes, so it is closed to everyone else.
+JOB_HIGH_PRIORITY_CLIENTS = {c.strip() for c in os.getenv("JOB_HIGH_PRIORITY_CLIENTS", "").split(",") if c.strip()}
+
+
+async def warm_up_app():
+    started = asyncio.get_running_loop().time()
+    try:
+        await asyncio.to_thread(warm_up)
+        await asyncio.to_thread(get_serp_cache().purge_expired)
+        await asyncio.to_thread(destination_pack.load)
+    except Exception as e:
+        # Requests still build whatever is missing on first use
+        logger.warning("Warm-up failed: %r", e)
+        return
+    logger.info("Warm-up finished in %.2fs", asyncio.get_running_loop().time() - started)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with open_checkpointer() as checkpointer:
+        app.state.graph = build_graph(GRAPH_MODE, checkpointer=checkpointer)
+        warmup = None
+        if STARTUP_WARMUP == "blocking":
+            await warm_up_app()
+        elif STARTUP_WARMUP == "background":
+            warmup = asyncio.create_task(warm_up_app())
+        await itinerary_jobs.start()
+        yield
+        await itinerary_jobs.stop()
+        if warmup is not None and not warmup.done():
+            warmup.cancel()
+    await close_serpapi_client()
+    await image_prober.aclose()
+
+
+app = FastAPI(title="Travel Planner API", description="API for generating travel itineraries using Langgraph.", lifespan=lifespan)
 
 
 
@@ -30,39 +104,354 @@ app.add_middleware(
     allow_headers=["*"],  
 )
 
+itinerary_runs = SingleFlight()
+
+logger = get_logger("api")
+
+
+def get_graph():
+    # Falls back to the checkpointer-less graph when lifespan hooks have not run
+    return getattr(app.state, "graph", None) or agent.graph
+
+
+def thread_config(request: TravelPlanRequest):
+    return {"configurable": {"thread_id": request.thread_id or uuid.uuid4().hex}}
+
+
+def client_id(http_request: Request):
+    """
+    Who a request's SerpAPI and LLM calls are charged to: the gateway's client header when one is
+    configured, else the caller's address (a header callers set themselves would let them pick any bucket)
+    """
+    if QUOTA_CLIENT_HEADER and http_request.headers.get(QUOTA_CLIENT_HEADER):
+        return http_request.headers[QUOTA_CLIENT_HEADER]
+    return http_request.client.host if http_request.client else None
+
+
+def quota_exceeded(e: QuotaExceededError):
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+
+
+def build_initial_state(request: TravelPlanRequest):
+    return {
+        "messages": [HumanMessage(content=request.initial_message)],
+        "budget": request.budget,
+        "interests": request.interests,
+        "companions": request.companions,
+        "city": normalize_cities(request.city),
+        "days": request.days,
+        "travel_date": request.travel_date,
+        "itinerary": {},
+        "invalid_sections": {},
+        "edit_request": {},
+    }
+
+
+async def run_itinerary(initial_state, config, on_update=None):
+    # Only the last update is returned, so don't hold every intermediate state
+    final_response = None
+    with span("run", "create_itinerary", cities=len(initial_state["city"]), days=initial_state["days"]):
+        async for chunk in get_graph().astream(initial_state, config):
+            final_response = chunk
+            if on_update is not None:
+                await on_update(chunk)
+    return {**final_response, "thread_id": config["configurable"]["thread_id"]}
+
+
+async def copy_thread(final_response, config):
+    """
+    Store a shared run's final state under the follower's own thread, as if it had run there
+    """
+    graph = get_graph()
+    source = {"configurable": {"thread_id": final_response["thread_id"]}}
+    try:
+        stored = await graph.aget_state(source)
+    except ValueError:
+        # No checkpointer, so no thread can be continued anyway
+        return
+    # Written as the run's last node, so the copy ends where the shared run ended
+    last_node = next(key for key in final_response if key != "thread_id")
+    await graph.aupdate_state(config, stored.values, as_node=last_node)
+
+
+async def run_job(job, emit):
+    payload = dict(job["payload"])
+    client = payload.pop("client_id", None)
+    request = TravelPlanRequest(**payload)
+    config = {"configurable": {"thread_id": request.thread_id or job["job_id"]}}
+
+    async def on_update(chunk):
+        for event in update_events(chunk):
+            await emit(event)
+
+    await emit({"event": "start", "thread_id": config["configurable"]["thread_id"]})
+    # A job's priority is also its quota lane
+    with quota_context(client, job["priority"]):
+        result = await run_itinerary(build_initial_state(request), config, on_update)
+    # Stored as JSON, so messages become plain dicts like in the /create_itinerary response
+    return jsonable_encoder(result)
+
+
+itinerary_jobs = JobQueue(run_job)
+
+
 @app.post("/create_itinerary")
-async def plan_trip(request: TravelPlanRequest):
+async def plan_trip(request: TravelPlanRequest, response: Response, http_request: Request):
     try:
         
-        print("Received request:", request.dict())
-
-        initial_state = {
-            "messages": [HumanMessage(content=request.initial_message)],
-            "budget": request.budget,
-            "interests": request.interests,
-            "companions": request.companions,
-            "city": request.city,
-            "days": request.days,
-            "travel_date": request.travel_date,
-            "itinerary": []  
-        }
+        logger.info("Itinerary request: %s, %d days", request.city, request.days)
+        log_payload(logger, "Request", request.dict())
 
-    
-        config = {"configurable": {"thread_id": "1"}}
+        initial_state = build_initial_state(request)
 
     
-        response = [chunk async for chunk in graph.astream(initial_state, config)]
-        
+        config = thread_config(request)
+
     
-        final_response = response[-1]
+        with quota_context(client_id(http_request)):
+            if request.thread_id:
+                # Continuing a specific thread is never shared with other callers
+                final_response = await run_itinerary(initial_state, config)
+            else:
+                # A shared run is charged to the caller that started it
+                final_response, shared = await itinerary_runs.run(
+                    request_fingerprint(initial_state),
+                    lambda: run_itinerary(initial_state, config),
+                )
+                if shared:
+                    # Each caller gets its own thread, so editing one itinerary never changes another's
+                    await copy_thread(final_response, config)
+                    final_response = {**final_response, "thread_id": config["configurable"]["thread_id"]}
+                    response.headers["X-Itinerary-Coalesced"] = "true"
 
-        print("Generated response:", final_response)
+        logger.info("Itinerary ready for thread %s", final_response["thread_id"])
+        log_payload(logger, "Response", final_response)
         
         return final_response
 
+    except QuotaExceededError as e:
+        raise quota_exceeded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating itinerary: {str(e)}")
 
+
+@app.post("/edit_itinerary")
+async def edit_trip(request: EditRequest, http_request: Request):
+    """
+    Change a stored itinerary (days, cities, dates, budget, interests or party size).
+
+    Only the searches the stored results can't answer are run, and only the days the change
+    affects are written again; the rest of the itinerary is kept.
+    """
+    config = thread_config(request)
+    try:
+        stored = await get_graph().aget_state(config)
+    except ValueError:
+        raise HTTPException(status_code=409, detail="Editing needs saved threads; CHECKPOINTER is none")
+    if not stored.values.get("itinerary"):
+        raise HTTPException(status_code=404, detail=f"No itinerary for thread {request.thread_id}")
+
+    logger.info("Edit request for thread %s: %s, %d days", request.thread_id, request.city, request.days)
+    final_response = None
+    summary = {}
+    try:
+        with quota_context(client_id(http_request)), span("run", "edit_itinerary", days=request.days):
+            edit_request = request.dict(exclude={"thread_id", "initial_message"})
+            async for chunk in get_graph().astream({"edit_request": edit_request}, config):
+                summary = (chunk.get("edit") or {}).get("edit_summary", summary)
+                final_response = chunk
+    except QuotaExceededError as e:
+        raise quota_exceeded(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error editing itinerary: {str(e)}")
+    return {**final_response, "thread_id": request.thread_id, "edit": summary}
+
+
+@app.post("/create_itinerary/stream")
+async def stream_trip(request: TravelPlanRequest, http_request: Request):
+    """
+    Stream tool progress, itinerary tokens and the final document as they are produced.
+
+    Responds with Server-Sent Events when the client accepts text/event-stream, NDJSON otherwise.
+    Events are only produced as fast as the client reads them, and the graph run is
+    cancelled as soon as the client goes away.
+    """
+    logger.info("Streaming itinerary request: %s, %d days", request.city, request.days)
+    log_payload(logger, "Request", request.dict())
+
+    initial_state = build_initial_state(request)
+    config = thread_config(request)
+
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+    formatter = format_sse if use_sse else format_ndjson
+    client = client_id(http_request)
+
+    async def event_stream():
+        run = get_graph().astream(initial_state, config, stream_mode=STREAM_MODES)
+        # Set here rather than in the endpoint: the body runs in the response's context
+        with quota_context(client), span("run", "create_itinerary_stream", cities=len(initial_state["city"]),
+                                         days=initial_state["days"]) as run_span:
+            try:
+                yield formatter({"event": "start", "thread_id": config["configurable"]["thread_id"]})
+                async for mode, chunk in run:
+                    if await http_request.is_disconnected():
+                        logger.info("Client disconnected, cancelling itinerary run")
+                        run_span.status = "cancelled"
+                        return
+                    for event in graph_events(mode, chunk):
+                        yield formatter(event)
+                yield formatter({"event": "done"})
+            except Exception as e:
+                run_span.status = "error"
+                yield formatter({"event": "error", "detail": f"Error generating itinerary: {str(e)}"})
+            finally:
+                # Closing the generator cancels any in-flight LLM and SerpAPI calls
+                await run.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobRequest, response: Response, http_request: Request):
+    """
+    Queue an itinerary and return at once; poll ``/jobs/{job_id}`` or stream ``/jobs/{job_id}/stream``
+    """
+    client = client_id(http_request)
+    if request.priority == "high" and client not in JOB_HIGH_PRIORITY_CLIENTS:
+        raise HTTPException(status_code=403, detail="High priority is reserved for clients in JOB_HIGH_PRIORITY_CLIENTS")
+    payload = {**request.dict(exclude={"priority"}), "client_id": client}
+    try:
+        job = await itinerary_jobs.submit(payload, request.priority)
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=f"Itinerary queue is full: {e}",
+                            headers={"Retry-After": str(e.retry_after)})
+    logger.info("Queued job %s (%s priority): %s, %d days", job["job_id"], request.priority, request.city, request.days)
+    response.headers["Location"] = f"/jobs/{job['job_id']}"
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "queue_depth": itinerary_jobs.depth,
+        "poll": f"/jobs/{job['job_id']}",
+        "stream": f"/jobs/{job['job_id']}/stream",
+    }
+
+
+async def existing_job(job_id):
+    job = await itinerary_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job {job_id}")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await existing_job(job_id)
+    job.pop("payload", None)
+    return job
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    await existing_job(job_id)
+    job = await itinerary_jobs.cancel(job_id)
+    return {"job_id": job_id, "status": job["status"]}
+
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, http_request: Request, after: int = 0):
+    """
+    Progress events of a job, replayed from event ``after`` (or SSE ``Last-Event-ID``) until it finishes
+    """
+    await existing_job(job_id)
+    after = int(http_request.headers.get("last-event-id") or after)
+    use_sse = "text/event-stream" in http_request.headers.get("accept", "")
+
+    async def event_stream():
+        async for seq, event in itinerary_jobs.events(job_id, after):
+            if await http_request.is_disconnected():
+                return
+            yield f"id: {seq}\n" + format_sse(event) if use_sse else format_ndjson({**event, "seq": seq})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def router_snapshot():
+    """
+    The LLM router's stats, or None until a request has built it (building needs the API keys)
+    """
+    router = agent.__dict__.get("llm_router")
+    if router is None:
+        return None
+    try:
+        return router.snapshot()
+    except Exception as e:
+        logger.warning("LLM router stats unavailable: %r", e)
+        return None
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "serp_cache": get_serp_cache().snapshot(),
+        "coalescing": itinerary_runs.snapshot(),
+        "compaction": compaction_stats.snapshot(),
+        "prompt_cache": prompt_cache_stats.snapshot(),
+        "itinerary_validation": validation_stats.snapshot(),
+        "llm": router_snapshot(),
+        "image_probe": image_prober.snapshot(),
+        "image_dedup": dedup_stats.snapshot(),
+        "jobs": itinerary_jobs.snapshot(),
+        "quota": quota.snapshot(),
+        "edits": edit_stats.snapshot(),
+        "replay": fixture_store.snapshot(),
+        "destination_pack": destination_pack.snapshot(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus text exposition of span latencies, token counts, cache lookups and run counters
+    """
+    cache = get_serp_cache().snapshot()
+    runs = itinerary_runs.snapshot()
+    validation = validation_stats.snapshot()
+    llm = router_snapshot() or {"hedges": 0, "retries": 0}
+    probes = image_prober.snapshot()
+    jobs = itinerary_jobs.snapshot()
+    quotas = quota.snapshot()
+    return metrics.render(extra={
+        "itinerary_job_queue_depth": ("Jobs waiting for a worker", jobs["queue_depth"]),
+        "itinerary_jobs_running": ("Jobs being run by a worker", jobs["running"]),
+        "itinerary_jobs_submitted_total": ("Jobs accepted by POST /jobs", jobs["submitted"]),
+        "itinerary_jobs_rejected_total": ("Jobs refused because the queue was full", jobs["rejected"]),
+        "itinerary_jobs_failed_total": ("Jobs that failed or timed out", jobs["failed"]),
+        "itinerary_serp_cache_hit_ratio": ("Share of SerpAPI lookups served from cache", cache["hit_ratio"]),
+        "itinerary_serp_cache_memory_entries": ("Entries in the in-process SerpAPI cache", cache["memory_entries"]),
+        "itinerary_runs_total": ("Graph runs started by /create_itinerary", runs["runs"]),
+        "itinerary_coalesced_requests_total": ("Requests that shared another request's run", runs["coalesced"]),
+        "itinerary_repair_calls_total": ("LLM calls spent repairing invalid itinerary sections", validation["repair_calls"]),
+        "itinerary_llm_hedges_total": ("LLM calls hedged to a backup model", llm["hedges"]),
+        "itinerary_llm_retries_total": ("LLM calls retried on another model", llm["retries"]),
+        "itinerary_image_probes_total": ("Image URLs probed for liveness", probes["probed"]),
+        "itinerary_images_rejected_total": ("Images dropped as dead, non-image or hotlink-blocked", probes["rejected"]),
+        "itinerary_duplicate_images_total": ("Images dropped as copies of another result", dedup_stats.url_duplicates + dedup_stats.pixel_duplicates),
+        "itinerary_quota_serpapi_level": ("Share of the global SerpAPI budget left", quotas["serpapi"]["global_level"]),
+        "itinerary_quota_llm_level": ("Share of the global LLM budget left", quotas["llm"]["global_level"]),
+        "itinerary_quota_queued_total": ("Calls that waited for quota", quotas["serpapi"]["queued"] + quotas["llm"]["queued"]),
+        "itinerary_quota_rejected_total": ("Calls refused after waiting for quota", quotas["serpapi"]["rejected"] + quotas["llm"]["rejected"]),
+        "itinerary_quota_degraded_total": ("Optional calls skipped because quota was low", quotas["serpapi"]["degraded"] + quotas["llm"]["degraded"]),
+        "itinerary_prompt_tokens_saved_total": ("Prompt tokens removed by history compaction", compaction_stats.snapshot()["tokens_saved"]),
+    })
+
+
 if __name__ == "__main__":
     
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,242 @@
+import math
+from datetime import timedelta
+from itertools import combinations
+
+from destinations import destination_pack
+from prefetch import allocate_days, parse_travel_date
+
+
+# Budget is discretised into steps of at least this many PKR, and at most MAX_BUDGET_UNITS steps
+BUDGET_STEP = 500
+MAX_BUDGET_UNITS = 2000
+
+MAX_ACTIVITIES_PER_DAY = 2
+PEOPLE_PER_ROOM = 2
+PEOPLE_PER_VEHICLE = 4
+
+# Used for cities the destination pack doesn't cover.
+# Per person per day, with a comfort score in [0, 1]
+DEFAULT_MEAL_PLANS = [
+    {"plan": "Street food and dhabas", "cost": 1500, "score": 0.5},
+    {"plan": "Local restaurants", "cost": 3000, "score": 0.75},
+    {"plan": "Fine dining", "cost": 7000, "score": 1.0},
+]
+
+# Per person, keyed by the interest they serve
+DEFAULT_ACTIVITIES = [
+    {"name": "Heritage sites and museums", "interest": "culture", "cost": 1500},
+    {"name": "Historical monuments tour", "interest": "history", "cost": 2000},
+    {"name": "Guided hike or jeep safari", "interest": "adventure", "cost": 6000},
+    {"name": "Scenic viewpoints and lakes", "interest": "nature", "cost": 2000},
+    {"name": "Food street tasting tour", "interest": "food", "cost": 2500},
+    {"name": "Local bazaar visit", "interest": "shopping", "cost": 1000},
+    {"name": "Shrines and mosques visit", "interest": "religious", "cost": 500},
+    {"name": "City sightseeing", "interest": "sightseeing", "cost": 1500},
+]
+
+# Per vehicle
+LOCAL_TRANSPORT_PER_DAY = {"type": "Local car with driver", "cost": 5000}
+INTERCITY_TRANSFER = {"type": "Intercity transfer by road", "cost": 15000}
+
+HOTEL_WEIGHT = 3.0
+MEAL_WEIGHT = 1.0
+ACTIVITY_WEIGHT = 1.5
+UNMATCHED_INTEREST_SCORE = 0.3
+
+
+def meal_plans(city):
+    return destination_pack.city(city, "meal_plans") or DEFAULT_MEAL_PLANS
+
+
+def activity_candidates(city):
+    return destination_pack.city(city, "activities") or DEFAULT_ACTIVITIES
+
+
+def local_transport(city):
+    return destination_pack.city(city, "local_transport") or LOCAL_TRANSPORT_PER_DAY
+
+
+def intercity_transfer(city):
+    """
+    Getting to ``city`` from the previous stop
+    """
+    return destination_pack.city(city, "intercity_transfer") or INTERCITY_TRANSFER
+
+
+def interest_score(activity, interests):
+    wanted = {i.lower() for i in interests}
+    return 1.0 if activity["interest"] in wanted or activity["name"].lower() in wanted else UNMATCHED_INTEREST_SCORE
+
+
+def pareto_options(options):
+    """
+    Indexes of options not dominated by a cheaper-or-equal option with at least the same value
+    """
+    kept = []
+    best_value = float("-inf")
+    for index in sorted(range(len(options)), key=lambda i: (options[i]["cost"], -options[i]["value"])):
+        if options[index]["value"] > best_value:
+            kept.append(index)
+            best_value = options[index]["value"]
+    return kept
+
+
+def solve_groups(groups, budget):
+    """
+    Multiple-choice knapsack: pick exactly one option from every group maximising total value.
+
+    Each option is a dict with ``cost`` and ``value``. Returns the chosen option index per
+    group, or None if even the cheapest combination does not fit.
+    """
+    step = max(BUDGET_STEP, math.ceil(budget / MAX_BUDGET_UNITS)) if budget > 0 else BUDGET_STEP
+    capacity = max(int(budget // step), 0)
+    NEG = float("-inf")
+    best = [0.0] + [NEG] * capacity  # best[c]: max value using exactly c budget units
+    choices = []
+
+    for options in groups:
+        next_best = [NEG] * (capacity + 1)
+        choice = [-1] * (capacity + 1)
+        # Costs round up so a feasible pick is always within the real budget
+        costs = [math.ceil(o["cost"] / step) for o in options]
+        candidates = pareto_options(options)
+        for used, value in enumerate(best):
+            if value == NEG:
+                continue
+            for index in candidates:
+                total = used + costs[index]
+                if total > capacity:
+                    continue
+                candidate = value + options[index]["value"]
+                if candidate > next_best[total]:
+                    next_best[total] = candidate
+                    choice[total] = index
+        best = next_best
+        choices.append((choice, costs))
+
+    final_units = max(range(capacity + 1), key=lambda c: best[c])
+    if best[final_units] == NEG:
+        return None
+
+    picked = []
+    units = final_units
+    for choice, costs in reversed(choices):
+        index = choice[units]
+        picked.append(index)
+        units -= costs[index]
+    return list(reversed(picked))
+
+
+def build_groups(state):
+    """
+    Turn the fetched hotels and the meal/activity catalogues into knapsack groups.
+
+    One group per city stay (which hotel), and per day one for meals and one for activities.
+    Transport is fixed and returned separately.
+    """
+    people = max(int(state.get("companions") or 1), 1)
+    rooms = math.ceil(people / PEOPLE_PER_ROOM)
+    vehicles = math.ceil(people / PEOPLE_PER_VEHICLE)
+    interests = state.get("interests") or []
+    tool_results = state.get("tool_results") or {}
+
+    groups = []
+    slots = []
+    fixed = []
+    start = parse_travel_date(state["travel_date"])
+
+    for stay_index, stay in enumerate(allocate_days(state["city"], state["days"], state["travel_date"])):
+        city = stay["city"]
+        nights = len(stay["days"])
+        hotels = [h for h in (tool_results.get(city) or {}).get("hotels", []) if h.get("price")]
+        if hotels:
+            groups.append([
+                {
+                    "cost": h["price"] * rooms * nights,
+                    "value": HOTEL_WEIGHT * nights * (h.get("rating") or 0) / 5,
+                    "hotel": h,
+                }
+                for h in hotels
+            ])
+            slots.append(("hotel", city, stay["days"]))
+
+        for day in stay["days"]:
+            groups.append([
+                {"cost": plan["cost"] * people, "value": MEAL_WEIGHT * plan["score"], "meals": plan}
+                for plan in meal_plans(city)
+            ])
+            slots.append(("meals", city, [day]))
+
+            candidates = activity_candidates(city)
+            options = [{"cost": 0, "value": 0.0, "activities": []}]
+            for size in range(1, MAX_ACTIVITIES_PER_DAY + 1):
+                for combo in combinations(candidates, size):
+                    options.append({
+                        "cost": sum(a["cost"] for a in combo) * people,
+                        "value": ACTIVITY_WEIGHT * sum(interest_score(a, interests) for a in combo),
+                        "activities": list(combo),
+                    })
+            groups.append(options)
+            slots.append(("activities", city, [day]))
+
+            transport = intercity_transfer(city) if (stay_index > 0 and day == stay["days"][0]) else local_transport(city)
+            fixed.append({
+                "day": day,
+                "city": city,
+                "date": (start + timedelta(days=day - 1)).isoformat(),
+                "transportation": {"type": transport["type"], "cost": transport["cost"] * vehicles},
+            })
+
+    return groups, slots, fixed
+
+
+def optimize_budget(state):
+    """
+    Choose a hotel per city and meals/activities per day that maximise rating and interest
+    match while keeping the whole trip within ``state['budget']``.
+
+    Returns a plan with exact per-day and total costs. If nothing fits, the cheapest
+    option is used everywhere and ``within_budget`` is False.
+    """
+    groups, slots, fixed = build_groups(state)
+    budget = float(state["budget"])
+    fixed_cost = sum(day["transportation"]["cost"] for day in fixed)
+
+    picked = solve_groups(groups, budget - fixed_cost)
+    within_budget = picked is not None
+    if picked is None:
+        picked = [min(range(len(options)), key=lambda i: options[i]["cost"]) for options in groups]
+
+    days = {day["day"]: {**day, "hotel": None, "meals": None, "activities": []} for day in fixed}
+    for (kind, city, day_numbers), options, index in zip(slots, groups, picked):
+        option = options[index]
+        if kind == "hotel":
+            nightly = option["cost"] / len(day_numbers)
+            for day in day_numbers:
+                days[day]["hotel"] = {**option["hotel"], "cost": nightly}
+        elif kind == "meals":
+            days[day_numbers[0]]["meals"] = {"plan": option["meals"]["plan"], "cost": option["cost"]}
+        else:
+            days[day_numbers[0]]["activities"] = [
+                {"name": a["name"], "interest": a["interest"], "cost": a["cost"] * max(int(state.get("companions") or 1), 1)}
+                for a in option["activities"]
+            ]
+
+    plan_days = []
+    for number in sorted(days):
+        day = days[number]
+        day["day_cost"] = (
+            (day["hotel"]["cost"] if day["hotel"] else 0)
+            + (day["meals"]["cost"] if day["meals"] else 0)
+            + sum(a["cost"] for a in day["activities"])
+            + day["transportation"]["cost"]
+        )
+        plan_days.append(day)
+
+    total_cost = sum(day["day_cost"] for day in plan_days)
+    return {
+        "days": plan_days,
+        "total_cost": total_cost,
+        "remaining_budget": budget - total_cost,
+        "within_budget": within_budget and total_cost <= budget,
+    }
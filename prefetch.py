@@ -0,0 +1,194 @@
+import asyncio
+import json
+import math
+from datetime import date, datetime, timedelta
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from hotel_index import city_key
+from telemetry import span
+
+
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d", "%B %d, %Y", "%d %B %Y")
+IMAGE_QUERIES = {
+    "destination_images": "{city} Pakistan tourism photos",
+    "hotel_images": "{city} Pakistan hotels interior rooms",
+}
+
+
+def normalize_cities(city):
+    """
+    Accept either a list of cities or a comma separated string and return a clean list
+    """
+    if isinstance(city, str):
+        city = city.split(",")
+    return [c.strip() for c in city if c and c.strip()]
+
+
+def parse_travel_date(travel_date):
+    if isinstance(travel_date, date):
+        return travel_date
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(travel_date.strip(), fmt).date()
+        except (ValueError, AttributeError):
+            continue
+    raise ValueError(f"Unrecognised travel date: {travel_date!r}")
+
+
+def allocate_days(cities, days, travel_date):
+    """
+    Split the trip into one contiguous stay per city, earlier cities getting any extra night.
+
+    Returns a list of dicts with ``city``, ``check_in``, ``check_out`` and the 1-based ``days`` spent there.
+    """
+    cities = normalize_cities(cities)
+    if not cities:
+        return []
+    start = parse_travel_date(travel_date)
+    days = max(int(days), 1)
+    base, extra = divmod(days, len(cities))
+
+    stays = []
+    day = 1
+    current = start
+    for index, city in enumerate(cities):
+        nights = base + (1 if index < extra else 0)
+        if nights == 0:
+            continue
+        stays.append({
+            "city": city,
+            "check_in": current.isoformat(),
+            "check_out": (current + timedelta(days=nights)).isoformat(),
+            "days": list(range(day, day + nights)),
+        })
+        day += nights
+        current += timedelta(days=nights)
+    return stays
+
+
+def plan_searches(state):
+    """
+    Work out the searches the system prompt asks for, straight from the request state.
+
+    Per city: one hotels_finder call for the stay, plus destination and hotel image searches.
+    """
+    adults = max(int(state.get("companions") or 1), 1)
+    searches = []
+    for stay in allocate_days(state["city"], state["days"], state["travel_date"]):
+        city = stay["city"]
+        searches.append({
+            "city": city,
+            "purpose": "hotels",
+            "tool": "hotels_finder",
+            "args": {"params": {
+                "q": f"{city} Pakistan",
+                "check_in_date": stay["check_in"],
+                "check_out_date": stay["check_out"],
+                "adults": adults,
+                "rooms": math.ceil(adults / 2),
+            }},
+        })
+        for purpose, query in IMAGE_QUERIES.items():
+            searches.append({
+                "city": city,
+                "purpose": purpose,
+                "tool": "image_finder",
+                "args": {"q": query.format(city=city)},
+            })
+    return searches
+
+
+async def run_searches(searches, tools_by_name, config=None):
+    """
+    Run every planned search concurrently and group the results by city and purpose.
+
+    A failed search leaves an empty list and an entry in ``errors`` instead of failing the run.
+    """
+    async def run(search):
+        with span("tool", search["tool"], city=search["city"], purpose=search["purpose"]) as tool_span:
+            try:
+                return await tools_by_name[search["tool"]].ainvoke(search["args"], config)
+            except Exception as e:
+                tool_span.status = "error"
+                tool_span.error = repr(e)[:200]
+                return e
+
+    outcomes = await asyncio.gather(*(run(search) for search in searches))
+
+    results = {}
+    for search, outcome in zip(searches, outcomes):
+        city_results = results.setdefault(search["city"], {"hotels": [], "destination_images": [], "hotel_images": []})
+        if isinstance(outcome, Exception):
+            city_results.setdefault("errors", []).append(f"{search['purpose']}: {outcome}")
+        else:
+            city_results[search["purpose"]] = outcome
+    return results
+
+
+def _search_city(cities, q):
+    """
+    The planned city a search query is about (the longest one named in it), or None
+    """
+    words = f" {city_key(q)} "
+    named = [city for city in cities if city_key(city) and f" {city_key(city)} " in words]
+    return max(named, key=len, default=None)
+
+
+def _hotel_args(city, args):
+    return {"params": {
+        "q": f"{city} Pakistan",
+        "check_in_date": args.get("check_in_date"),
+        "check_out_date": args.get("check_out_date"),
+        "adults": args.get("adults") or 1,
+        "rooms": args.get("rooms") or 1,
+    }}
+
+
+def _tool_output(message):
+    if message is None or message.status == "error":
+        return None
+    try:
+        return json.loads(message.content)
+    except (TypeError, ValueError):
+        return None
+
+
+def recorded_searches(state):
+    """
+    The planned searches the assistant already made in agent mode, read back from its tool calls.
+
+    Returns {(city, purpose): (args, result)} with ``args`` in the shape ``plan_searches`` uses,
+    so the two can be compared. ``result`` is None for a call that failed or returned nothing usable.
+    """
+    cities = normalize_cities(state["city"])
+    replies = {m.tool_call_id: m for m in state["messages"] if isinstance(m, ToolMessage)}
+    recorded = {}
+    for message in state["messages"]:
+        if not isinstance(message, AIMessage):
+            continue
+        for call in message.tool_calls:
+            if call["id"] not in replies:
+                continue
+            output = _tool_output(replies[call["id"]])
+            args = call["args"]
+            if call["name"] == "hotels_finder":
+                params = args.get("params", args)
+                city = _search_city(cities, params.get("q", ""))
+                if city:
+                    recorded[(city, "hotels")] = (_hotel_args(city, params), output if isinstance(output, list) else None)
+            elif call["name"] == "hotels_batch_finder":
+                by_city = output if isinstance(output, dict) else {}
+                for name in args.get("cities", []):
+                    city = _search_city(cities, name)
+                    if city:
+                        found = by_city.get(name)
+                        recorded[(city, "hotels")] = (_hotel_args(city, args), found if isinstance(found, list) else None)
+            elif call["name"] == "image_finder":
+                q = args.get("q", "")
+                city = _search_city(cities, q)
+                if city:
+                    purpose = "hotel_images" if "hotel" in q.lower() else "destination_images"
+                    args = {"q": IMAGE_QUERIES[purpose].format(city=city)}
+                    recorded[(city, purpose)] = (args, output if isinstance(output, list) else None)
+    return recorded
@@ -0,0 +1,173 @@
+from langchain_core.messages import SystemMessage
+
+from prefetch import plan_searches
+
+
+# Everything that does not depend on the request lives here so the rendered text is
+# byte-identical across turns and requests; providers can then reuse the cached prefix.
+STATIC_SYSTEM_PROMPT = """You are a smart travel assistant. Create a detailed itinerary in JSON format for the trip request given in the next system message.
+
+   IMPORTANT: For each city in the destinations list, you must:
+    1. Use hotels_finder tool to get hotel information for EACH city separately
+    2. Use image_finder tool to get destination images for EACH city separately
+    3. Use image_finder tool to get hotel images for EACH city separately
+
+    For each city, perform these searches:
+    1. Destination images: search for "[City Name] Pakistan tourism photos"
+    2. Hotel search: use hotels_finder for each city
+    3. Hotel images: search for "[City Name] Pakistan hotels interior rooms"
+
+    hotels_batch_finder searches every city in one call. To find a cheaper or better-rated
+    hotel among ones already found for the same dates, use hotel_index_query instead of searching again.
+
+    Give each hotel an image from hotel_images. image_finder already removes duplicate photos, and images
+    shared by different hotels are reassigned afterwards, so don't search again to make them unique.
+
+    The response should be a valid JSON object with the following structure:
+    {
+        "trip_details": {
+            "destination": string,
+            "duration": number,
+            "travel_date": string,
+            "companions": number,
+            "budget": number,  # in PKR
+            "interests": string[]
+        },
+
+        "destination_images": [
+            {
+                "url": string,
+            }
+        ],
+
+        "hotel_images": [
+                           {
+                              "url": string,
+                           }
+        ],
+
+        "daily_itinerary": [
+            {
+                "day": number,
+                "date": string,
+                "day_title": string,  # e.g., "Cultural Tour", "Arrival Day", "Adventure Day"
+                "description": string,  # Brief description of the day's theme and activities
+                "hotel": {
+                    "name": string,
+                    "price": number,  # in PKR
+                    "rating": number,
+                    "reviews": number,
+                    "booking_url": string,
+                    "hotel_image": string  # One of the hotel_images URLs
+                },
+                "transportation": {
+                    "type": string,
+                    "cost": number  # in PKR
+                },
+                "meals": [
+                    {
+                        "type": string,
+                        "venue": string,
+                        "cost": number  # in PKR
+                    }
+                ],
+                "activities": [
+                    {
+                        "name": string,
+                        "description": string,
+                        "cost": number,  # in PKR
+                    }
+                ],
+            }
+        ],
+
+        "total_cost": number,  # in PKR
+        "remaining_budget": number  # in PKR
+    }
+
+    Instructions:
+    1. Use image_finder to get 8-10 high-quality images of each destination city and of its hotels.
+    2. Include destination images in the destination_images array
+    3. Include hotel images in the hotel_images array
+    4. Only use image URLs returned by image_finder; they have already been checked to load
+
+    For each day:
+    1. Provide a meaningful day_title that describes the theme (e.g., "Cultural Tour", "Adventure Day")
+    2. Include a brief description explaining the day's focus and highlights
+
+
+    In the cost_summary:
+    1. Calculate the total trip cost in PKR
+    2. Show the remaining budget from the original amount in PKR
+    """
+
+STATIC_SYSTEM_MESSAGE = SystemMessage(content=STATIC_SYSTEM_PROMPT)
+
+
+def get_request_prompt(state):
+    """
+    Small per-request suffix that follows the cached static prefix
+    """
+    cities = ', '.join(state['city'])
+    return f"""Trip request:
+    - Budget: PKR {state['budget']}
+    - Travel Interests: {', '.join(state['interests'])}
+    - Companions: {state['companions']} people
+    - Destination: {cities}
+    - Duration: {state['days']} days
+    - Travel Date: {state['travel_date']}
+
+    Run the searches above for each of these cities: {cities}.{get_stays_prompt(state)}
+    """
+
+
+def get_stays_prompt(state):
+    """
+    The hotel search for each city's stay, so agent-mode searches line up with the planned ones
+    """
+    try:
+        hotel_searches = [s["args"]["params"] for s in plan_searches(state) if s["purpose"] == "hotels"]
+    except ValueError:
+        return ""
+    if not hotel_searches:
+        return ""
+    party = hotel_searches[0]
+    lines = "".join(
+        f"\n    - {params['q']}: check in {params['check_in_date']}, check out {params['check_out_date']}"
+        for params in hotel_searches
+    )
+    return f"\n    Search hotels for {party['adults']} adults in {party['rooms']} rooms for these stays:{lines}"
+
+
+def get_system_messages(state):
+    return [STATIC_SYSTEM_MESSAGE, SystemMessage(content=get_request_prompt(state))]
+
+
+class PromptCacheStats:
+    """
+    Tracks how many input tokens the provider served from its prompt cache
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+
+    def record(self, message):
+        usage = getattr(message, "usage_metadata", None)
+        if not usage:
+            return
+        self.calls += 1
+        self.input_tokens += usage.get("input_tokens", 0)
+        self.cached_tokens += (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+
+    def snapshot(self):
+        return {
+            "calls": self.calls,
+            "input_tokens": self.input_tokens,
+            "cached_tokens": self.cached_tokens,
+            "cached_ratio": round(self.cached_tokens / self.input_tokens, 4) if self.input_tokens else 0.0,
+        }
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from telemetry import get_logger, span
+
+
+QUOTA_ENABLED = os.getenv("QUOTA_ENABLED", "1") == "1"
+# Global and per-client token buckets, in calls per minute and burst size. SerpAPI is only
+# charged for cache misses.
+QUOTA_SERPAPI_PER_MINUTE = float(os.getenv("QUOTA_SERPAPI_PER_MINUTE", "120"))
+QUOTA_SERPAPI_BURST = float(os.getenv("QUOTA_SERPAPI_BURST", "240"))
+QUOTA_SERPAPI_CLIENT_PER_MINUTE = float(os.getenv("QUOTA_SERPAPI_CLIENT_PER_MINUTE", "30"))
+QUOTA_SERPAPI_CLIENT_BURST = float(os.getenv("QUOTA_SERPAPI_CLIENT_BURST", "60"))
+QUOTA_LLM_PER_MINUTE = float(os.getenv("QUOTA_LLM_PER_MINUTE", "300"))
+QUOTA_LLM_BURST = float(os.getenv("QUOTA_LLM_BURST", "100"))
+QUOTA_LLM_CLIENT_PER_MINUTE = float(os.getenv("QUOTA_LLM_CLIENT_PER_MINUTE", "60"))
+QUOTA_LLM_CLIENT_BURST = float(os.getenv("QUOTA_LLM_CLIENT_BURST", "30"))
+# How long a call may queue for tokens before it fails
+QUOTA_WAIT_SECONDS = float(os.getenv("QUOTA_WAIT_SECONDS", "10"))
+# Below this share of the bucket left, optional calls (e.g. fallback image searches) are skipped
+QUOTA_DEGRADE_BELOW = float(os.getenv("QUOTA_DEGRADE_BELOW", "0.25"))
+QUOTA_MAX_CLIENTS = int(os.getenv("QUOTA_MAX_CLIENTS", "10000"))
+
+# Share of each global bucket a lane may not dip into, keeping headroom for higher lanes
+LANE_RESERVE = {"high": 0.0, "normal": 0.1, "low": 0.3}
+LANES = list(LANE_RESERVE)
+# Tolerance for float refill and clock arithmetic, or a waiter woken on time could find itself a hair short forever
+EPSILON = 1e-9
+
+_client = ContextVar("quota_client", default="anonymous")
+_lane = ContextVar("quota_lane", default="normal")
+
+logger = get_logger("quota")
+
+
+class QuotaExceededError(Exception):
+    """Raised when a call could not get quota before its deadline"""
+
+    def __init__(self, resource, client, retry_after):
+        super().__init__(f"{resource} quota exhausted for {client}; retry in {retry_after:.0f}s")
+        self.resource = resource
+        self.client = client
+        self.retry_after = retry_after
+
+
+class MonotonicClock:
+    def now(self):
+        return time.monotonic()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class SimulatedClock:
+    """
+    Virtual time for offline tests: ``sleep`` blocks until ``advance`` moves time past its end
+    """
+
+    def __init__(self, start=0.0):
+        self.time = start
+        self._sleepers = []
+        self._order = 0
+
+    def now(self):
+        return self.time
+
+    async def sleep(self, seconds):
+        future = asyncio.get_running_loop().create_future()
+        self._order += 1
+        heapq.heappush(self._sleepers, (self.time + max(seconds, 0), self._order, future))
+        await future
+
+    async def advance(self, seconds):
+        """
+        Move time forward, waking sleepers in order and letting them run before time moves on
+        """
+        target = self.time + seconds
+        await self._settle()
+        while self._sleepers and self._sleepers[0][0] <= target:
+            wake_at, _, future = heapq.heappop(self._sleepers)
+            self.time = wake_at
+            if not future.done():
+                future.set_result(None)
+            await self._settle()
+        self.time = target
+
+    async def _settle(self):
+        # A few loop turns, so tasks that just started or woke can take tokens or go back to sleep
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    @property
+    def sleepers(self):
+        return len(self._sleepers)
+
+
+class TokenBucket:
+    def __init__(self, per_minute, burst, clock):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock.now()
+
+    def _refill(self):
+        now = self.clock.now()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def level(self):
+        self._refill()
+        return self.tokens / self.capacity if self.capacity else 0.0
+
+    def wait_time(self, cost, floor=0.0):
+        """
+        Seconds until ``cost`` tokens can be taken while leaving ``floor`` tokens in the bucket
+        """
+        self._refill()
+        missing = cost + floor - self.tokens
+        if missing <= EPSILON:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, cost):
+        self._refill()
+        self.tokens -= cost
+
+
+class ResourceQuota:
+    """
+    A global bucket and one bucket per client for a single upstream (SerpAPI, the LLM)
+    """
+
+    def __init__(self, name, per_minute, burst, client_per_minute, client_burst, clock, max_clients=QUOTA_MAX_CLIENTS):
+        self.name = name
+        self.clock = clock
+        self.global_bucket = TokenBucket(per_minute, burst, clock)
+        self.client_limits = (client_per_minute, client_burst)
+        self.max_clients = max_clients
+        self._clients = OrderedDict()
+        # Queued calls by ticket (arrival order): (lane rank, client, cost)
+        self._queue = {}
+        self._tickets = itertools.count()
+        self.stats = {"granted": 0, "queued": 0, "rejected": 0, "degraded": 0}
+
+    def client_bucket(self, client):
+        bucket = self._clients.get(client)
+        if bucket is None:
+            bucket = self._clients[client] = TokenBucket(*self.client_limits, self.clock)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        self._clients.move_to_end(client)
+        return bucket
+
+    def enqueue(self, client, lane, cost):
+        ticket = next(self._tickets)
+        self._queue[ticket] = (LANES.index(lane), client, cost)
+        return ticket
+
+    def dequeue(self, ticket):
+        self._queue.pop(ticket, None)
+
+    def wait_time(self, client, lane, cost, ticket=float("inf")):
+        """
+        Seconds until ``client`` may spend ``cost`` in ``lane``, after the calls queued ahead of
+        ``ticket`` in the same lane (all of them for a new call); None while a higher lane is queued
+        """
+        rank = LANES.index(lane)
+        ahead = ahead_for_client = 0
+        for other, (other_rank, other_client, other_cost) in self._queue.items():
+            if other_rank < rank:
+                return None
+            if other < ticket:
+                if other_rank == rank:
+                    ahead += other_cost
+                if other_client == client:
+                    ahead_for_client += other_cost
+        floor = LANE_RESERVE[lane] * self.global_bucket.capacity
+        return max(self.global_bucket.wait_time(cost + ahead, floor),
+                   self.client_bucket(client).wait_time(cost + ahead_for_client))
+
+    def level(self, client):
+        return min(self.global_bucket.level(), self.client_bucket(client).level())
+
+    def snapshot(self):
+        return {
+            **self.stats,
+            "global_level": round(self.global_bucket.level(), 3),
+            "clients": len(self._clients),
+            "waiting": {lane: sum(rank == LANES.index(lane) for rank, _, _ in self._queue.values()) for lane in LANES},
+        }
+
+
+class QuotaScheduler:
+    """
+    Token-bucket admission for calls to paid upstreams, shared by every request in the process.
+
+    Each call needs tokens from the resource's global bucket and from the calling client's
+    bucket. Calls that can't be served at once queue until tokens refill or their deadline
+    passes. Lanes ("high", "normal", "low") keep part of the global bucket back for higher
+    lanes, and a lane waits while a higher one is queued. ``degraded`` tells callers to skip
+    optional work when a budget runs low.
+    """
+
+    def __init__(self, resources, clock=None, wait_seconds=QUOTA_WAIT_SECONDS, degrade_below=QUOTA_DEGRADE_BELOW,
+                 enabled=True):
+        self.clock = clock or MonotonicClock()
+        self.resources = {
+            name: ResourceQuota(name, *limits, clock=self.clock) for name, limits in resources.items()
+        }
+        self.wait_seconds = wait_seconds
+        self.degrade_below = degrade_below
+        self.enabled = enabled
+
+    async def acquire(self, resource, cost=1, client=None, lane=None, deadline=None):
+        if not self.enabled:
+            return
+        quota = self.resources[resource]
+        client = client or _client.get()
+        lane = lane or _lane.get()
+        give_up_at = self.clock.now() + (self.wait_seconds if deadline is None else deadline)
+
+        wait = quota.wait_time(client, lane, cost)
+        if wait == 0:
+            self._grant(quota, client, cost)
+            return
+
+        remaining = give_up_at - self.clock.now()
+        # Fail now rather than queue for tokens that won't come before the deadline
+        if wait is not None and wait > remaining:
+            self._reject(quota, client, lane, wait)
+
+        quota.stats["queued"] += 1
+        ticket = quota.enqueue(client, lane, cost)
+        try:
+            with span("quota", resource, client=client, lane=lane):
+                while wait is None or wait > 0:
+                    remaining = give_up_at - self.clock.now()
+                    if remaining <= EPSILON or (wait is not None and wait > remaining):
+                        self._reject(quota, client, lane, self.wait_seconds if wait is None else wait)
+                    # Waiters sleep until their place in the queue is due, so a refill wakes one
+                    # call instead of all of them; a higher lane's queue is checked again shortly
+                    await self.clock.sleep(min(remaining, 1.0) if wait is None else wait)
+                    wait = quota.wait_time(client, lane, cost, ticket)
+        finally:
+            quota.dequeue(ticket)
+        self._grant(quota, client, cost)
+
+    def _reject(self, quota, client, lane, retry_after):
+        quota.stats["rejected"] += 1
+        logger.info("%s quota exhausted for client %s (%s lane)", quota.name, client, lane)
+        raise QuotaExceededError(quota.name, client, retry_after)
+
+    def _grant(self, quota, client, cost):
+        quota.global_bucket.take(cost)
+        quota.client_bucket(client).take(cost)
+        quota.stats["granted"] += 1
+
+    def degraded(self, resource, client=None):
+        """
+        True when the caller's budget for ``resource`` is low enough to skip optional calls
+        """
+        if not self.enabled:
+            return False
+        quota = self.resources[resource]
+        low = quota.level(client or _client.get()) < self.degrade_below
+        if low:
+            quota.stats["degraded"] += 1
+        return low
+
+    def snapshot(self):
+        return {"enabled": self.enabled, **{name: quota.snapshot() for name, quota in self.resources.items()}}
+
+
+def default_limits():
+    return {
+        "serpapi": (QUOTA_SERPAPI_PER_MINUTE, QUOTA_SERPAPI_BURST, QUOTA_SERPAPI_CLIENT_PER_MINUTE, QUOTA_SERPAPI_CLIENT_BURST),
+        "llm": (QUOTA_LLM_PER_MINUTE, QUOTA_LLM_BURST, QUOTA_LLM_CLIENT_PER_MINUTE, QUOTA_LLM_CLIENT_BURST),
+    }
+
+
+quota = QuotaScheduler(default_limits(), enabled=QUOTA_ENABLED)
+
+
+@contextmanager
+def quota_context(client, lane="normal"):
+    """
+    Charge calls made inside the block (and tasks started from it) to ``client`` in ``lane``
+    """
+    client_token = _client.set(client or "anonymous")
+    lane_token = _lane.set(lane if lane in LANE_RESERVE else "normal")
+    try:
+        yield
+    finally:
+        _client.reset(client_token)
+        _lane.reset(lane_token)
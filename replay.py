@@ -0,0 +1,198 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+from telemetry import get_logger, span
+
+
+# off: call upstreams as usual; record: call them and store each answer; replay: answer from
+# stored fixtures only, so runs need no keys or network
+REPLAY_MODE = os.getenv("REPLAY_MODE", "off")
+REPLAY_DIR = os.getenv("REPLAY_DIR", ".cache/replay")
+# Replayed calls sleep for their recorded latency times this (0 = answer at once)
+REPLAY_LATENCY_SCALE = float(os.getenv("REPLAY_LATENCY_SCALE", "0"))
+
+MODES = ("off", "record", "replay")
+
+logger = get_logger("replay")
+
+
+class ReplayMissError(LookupError):
+    """Raised in replay mode when a call has no recorded fixture"""
+
+    def __init__(self, kind, key, request):
+        super().__init__(f"No recorded {kind} fixture {key[:12]} for {request}")
+        self.kind = kind
+        self.key = key
+
+
+def fixture_key(kind, request):
+    """
+    Content address of a call: the same kind and request always map to the same fixture
+    """
+    canonical = json.dumps({"kind": kind, "request": request}, sort_keys=True, separators=(",", ":"),
+                           ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def llm_request(messages, route, tools=None):
+    """
+    What identifies a model call: the messages' roles, text and tool calls (not their ids,
+    which differ between runs), the route and the tools offered
+    """
+    return {
+        "route": route,
+        "tools": sorted(getattr(tool, "name", None) or getattr(tool, "__name__", str(tool)) for tool in tools or []),
+        "messages": [
+            {
+                "type": message.type,
+                "content": message.content,
+                "tool_calls": [{"name": call["name"], "args": call["args"]} for call in getattr(message, "tool_calls", None) or []],
+            }
+            for message in messages
+        ],
+    }
+
+
+def describe_llm_request(request):
+    """
+    Stored instead of the full prompt, which can run to tens of kilobytes
+    """
+    last = request["messages"][-1]["content"] if request["messages"] else ""
+    return {
+        "route": request["route"],
+        "tools": request["tools"],
+        "messages": len(request["messages"]),
+        "last_message": str(last)[:200],
+    }
+
+
+def encode_message(message):
+    return message_to_dict(message)
+
+
+def decode_message(data):
+    return messages_from_dict([data])[0]
+
+
+class FixtureStore:
+    """
+    Record/replay for calls to paid or flaky upstreams (SerpAPI, the LLM, image hosts).
+
+    Each call is stored once as ``{dir}/{kind}/{key}.json.gz``, keyed by a hash of what was
+    asked, so identical calls share a fixture and re-recording a run only rewrites what changed.
+    Files are written with a fixed gzip timestamp, so the same answer gives the same bytes.
+    """
+
+    def __init__(self, mode=REPLAY_MODE, directory=REPLAY_DIR, latency_scale=REPLAY_LATENCY_SCALE,
+                 sleep=asyncio.sleep):
+        if mode not in MODES:
+            raise ValueError(f"REPLAY_MODE must be one of {', '.join(MODES)}, not {mode!r}")
+        self.mode = mode
+        self.directory = directory
+        self.latency_scale = latency_scale
+        self.sleep = sleep
+        # Fixtures already read in this process, by key
+        self._loaded = {}
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0, "bytes_written": 0}
+
+    @property
+    def active(self):
+        """
+        Recording or replaying; callers then skip their caches so every call reaches the store
+        """
+        return self.mode != "off"
+
+    def path(self, kind, key):
+        return os.path.join(self.directory, kind, f"{key}.json.gz")
+
+    async def call(self, kind, request, live, encode=None, decode=None, describe=None):
+        """
+        Result of ``live()`` (a coroutine function), recorded or replayed depending on the mode.
+
+        ``request`` is whatever identifies the call and must be JSON-serialisable; ``describe``
+        shortens it for the stored file when it is large. ``encode``/``decode`` turn results
+        that aren't plain JSON (e.g. chat messages) into something that is and back.
+        """
+        if self.mode == "off":
+            return await live()
+        key = fixture_key(kind, request)
+        if self.mode == "replay":
+            return await self._replay(kind, key, request, decode)
+
+        started = time.perf_counter()
+        result = await live()
+        latency = time.perf_counter() - started
+        record = {
+            "kind": kind,
+            "request": describe(request) if describe else request,
+            "latency": round(latency, 4),
+            "response": encode(result) if encode else result,
+        }
+        await asyncio.to_thread(self._write, kind, key, record)
+        self._loaded[key] = record
+        self.stats["recorded"] += 1
+        return result
+
+    async def _replay(self, kind, key, request, decode):
+        record = self._loaded.get(key)
+        if record is None:
+            record = await asyncio.to_thread(self._read, kind, key)
+            if record is None:
+                self.stats["misses"] += 1
+                # Callers decide how bad a miss is: searches and model calls fail, probes degrade
+                logger.debug("No %s fixture for %s", kind, key[:12])
+                raise ReplayMissError(kind, key, request)
+            self._loaded[key] = record
+        self.stats["replayed"] += 1
+        if self.latency_scale > 0 and record.get("latency"):
+            with span("replay", kind):
+                await self.sleep(record["latency"] * self.latency_scale)
+        response = record["response"]
+        return decode(response) if decode else response
+
+    def _read(self, kind, key):
+        try:
+            with gzip.open(self.path(kind, key), "rt", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, kind, key, record):
+        path = self.path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+        data = gzip.compress(payload.encode(), mtime=0)
+        # Write then rename, so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self.stats["bytes_written"] += len(data)
+
+    def fixtures(self):
+        """
+        {kind: (files, bytes)} for what is on disk
+        """
+        found = {}
+        if not os.path.isdir(self.directory):
+            return found
+        for kind in sorted(os.listdir(self.directory)):
+            folder = os.path.join(self.directory, kind)
+            if not os.path.isdir(folder):
+                continue
+            files = [entry for entry in os.scandir(folder) if entry.name.endswith(".json.gz")]
+            found[kind] = (len(files), sum(entry.stat().st_size for entry in files))
+        return found
+
+    def snapshot(self):
+        return {"mode": self.mode, "directory": self.directory, **self.stats}
+
+
+fixture_store = FixtureStore()
@@ -0,0 +1,186 @@
+"""
+Offline chat model that plays the itinerary script without calling any provider.
+
+Used by the benchmarks and by the ``fake`` provider (``LLM_FINAL_MODEL=fake:<latency>``).
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from typing import Any, Dict
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import Field, PrivateAttr
+
+from itinerary_schema import WHOLE_ITINERARY, section_value
+from prefetch import plan_searches
+
+
+REQUEST_FIELD = re.compile(r"^\s*- (Destination|Duration|Travel Date|Budget|Companions): (.+)$", re.MULTILINE)
+REPAIR_SECTION = re.compile(r"^- ([a-z_]+(?:\[\d+\])?): ", re.MULTILINE)
+REPAIR_MARKER = "Re-emit ONLY these sections"
+EDIT_MARKER = "Write ONLY these sections"
+
+
+def parse_request(messages):
+    """
+    Read the trip request back out of the system prompt
+    """
+    fields = {}
+    for message in messages:
+        if isinstance(message, SystemMessage):
+            fields.update(REQUEST_FIELD.findall(message.content))
+    cities = [c.strip() for c in fields.get("Destination", "Lahore").split(",") if c.strip()]
+    days = int(re.match(r"\d+", fields.get("Duration", "3")).group())
+    try:
+        start = date.fromisoformat(fields.get("Travel Date", "").strip())
+    except ValueError:
+        start = date.today()
+    budget = float(re.sub(r"[^\d.]", "", fields.get("Budget", "100000")) or 100000)
+    companions = int(re.match(r"\d+", fields.get("Companions", "2")).group())
+    return {"cities": cities, "days": days, "start": start, "budget": budget, "companions": companions}
+
+
+def scripted_tool_calls(request):
+    """
+    The planned searches for the request, as the tool calls a model following the prompt makes
+    """
+    state = {"city": request["cities"], "days": request["days"],
+             "travel_date": request["start"].isoformat(), "companions": request["companions"]}
+    return [
+        {"name": search["tool"], "id": f"call_{uuid.uuid4().hex[:12]}", "args": search["args"]}
+        for search in plan_searches(state)
+    ]
+
+
+def scripted_itinerary(request):
+    days = []
+    for day in range(request["days"]):
+        city = request["cities"][day * len(request["cities"]) // request["days"]]
+        days.append({
+            "day": day + 1,
+            "date": (request["start"] + timedelta(days=day)).isoformat(),
+            "day_title": f"Exploring {city}",
+            "description": f"A day around {city}.",
+            "hotel": {"name": f"Serena Hotel {city}", "price": 15000, "rating": 4.5, "reviews": 1200,
+                      "booking_url": "https://www.booking.com/", "hotel_image": f"https://upload.wikimedia.org/{city}.jpg"},
+            "transportation": {"type": "Car", "cost": 3000},
+            "meals": [{"type": "Dinner", "venue": "Local restaurant", "cost": 2500}],
+            "activities": [{"name": f"{city} old city walk", "description": "Guided walk", "cost": 2000}],
+        })
+    total = 22500 * request["days"]
+    return {
+        "trip_details": {"destination": ", ".join(request["cities"]), "duration": request["days"],
+                         "travel_date": request["start"].isoformat(), "companions": 2,
+                         "budget": request["budget"], "interests": []},
+        "destination_images": [{"url": f"https://upload.wikimedia.org/{c}.jpg"} for c in request["cities"]],
+        "hotel_images": [{"url": f"https://upload.wikimedia.org/{c}-hotel.jpg"} for c in request["cities"]],
+        "daily_itinerary": days,
+        "total_cost": total,
+        "remaining_budget": request["budget"] - total,
+    }
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Fake model that first asks for every per-city search, then answers with an itinerary.
+
+    Each call sleeps ``latency`` plus uniform ``jitter`` seconds. ``counters`` is shared
+    across bound copies and records LLM turns and tool calls requested. With
+    ``truncate_rate`` that share of itineraries stops early, as if the output hit a length
+    limit, and repair and edit requests are answered with just the sections asked for.
+    ``tail_rate`` of calls take ``tail_latency`` instead, and ``error_rate`` of calls fail,
+    to imitate a degraded provider.
+    """
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    chunk_size: int = 40
+    truncate_rate: float = 0.0
+    tail_rate: float = 0.0
+    tail_latency: float = 0.0
+    error_rate: float = 0.0
+    counters: Dict[str, int] = Field(default_factory=lambda: {"llm_turns": 0, "tool_calls": 0})
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self):
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _delay(self):
+        if random.random() < self.tail_rate:
+            return self.tail_latency
+        return self.latency + random.uniform(0, self.jitter)
+
+    def _maybe_fail(self):
+        if random.random() < self.error_rate:
+            raise ConnectionError("scripted provider error")
+
+    def _itinerary_text(self, request):
+        text = json.dumps(scripted_itinerary(request))
+        if random.random() < self.truncate_rate:
+            return text[:int(len(text) * 0.7)]
+        return text
+
+    def _respond(self, messages):
+        request = parse_request(messages)
+        has_results = any(isinstance(m, ToolMessage) for m in messages)
+        last = messages[-1].content if isinstance(messages[-1], HumanMessage) else ""
+        with self._lock:
+            self.counters["llm_turns"] += 1
+            if REPAIR_MARKER in last or EDIT_MARKER in last:
+                itinerary = scripted_itinerary(request)
+                patch = {path: section_value(itinerary, path) for path in REPAIR_SECTION.findall(last)}
+                return AIMessage(content=json.dumps(patch))
+            if last.startswith("Your reply could not be read as JSON"):
+                return AIMessage(content=json.dumps({WHOLE_ITINERARY: scripted_itinerary(request)}))
+            if has_results or "do not call any tools" in last:
+                return AIMessage(content=self._itinerary_text(request))
+            calls = scripted_tool_calls(request)
+            self.counters["tool_calls"] += len(calls)
+            return AIMessage(content="", tool_calls=calls)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay())
+        self._maybe_fail()
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages))])
+
+    def _chunks(self, message):
+        if message.tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": index}
+                for index, call in enumerate(message.tool_calls)
+            ]))
+            return
+        for start in range(0, len(message.content), self.chunk_size):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=message.content[start:start + self.chunk_size]))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay())
+        self._maybe_fail()
+        for chunk in self._chunks(self._respond(messages)):
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        self._maybe_fail()
+        for chunk in self._chunks(self._respond(messages)):
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,145 @@
+import asyncio
+import os
+
+import httpx
+
+from cache import IGNORED_KEY_PARAMS, get_serp_cache
+from quota import quota
+from replay import fixture_store
+from telemetry import span
+
+
+SERPAPI_BASE_URL = os.getenv("SERPAPI_BASE_URL", "https://serpapi.com")
+SERPAPI_TIMEOUT_SECONDS = float(os.getenv("SERPAPI_TIMEOUT_SECONDS", "20"))
+SERPAPI_MAX_CONCURRENCY = int(os.getenv("SERPAPI_MAX_CONCURRENCY", "16"))
+SERPAPI_MAX_CONNECTIONS = int(os.getenv("SERPAPI_MAX_CONNECTIONS", "32"))
+
+
+class SerpApiError(Exception):
+    """
+    Raised when a SerpAPI request fails or returns a non-200 response
+    """
+
+
+class SerpApiClient:
+    """
+    Async SerpAPI client sharing one keep-alive connection pool per event loop.
+
+    Concurrency is bounded by a semaphore so a burst of itineraries cannot open
+    more in-flight searches than ``max_concurrency``.
+    """
+
+    def __init__(self, base_url=SERPAPI_BASE_URL, timeout=SERPAPI_TIMEOUT_SECONDS,
+                 max_concurrency=SERPAPI_MAX_CONCURRENCY, max_connections=SERPAPI_MAX_CONNECTIONS):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_connections = max_connections
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_client(self):
+        # httpx pools and asyncio semaphores are bound to the loop that created them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+                headers={"User-Agent": "create-itinerary-agent"},
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client
+
+    async def search(self, params, timeout=None):
+        """
+        Run a single SerpAPI search and return the decoded JSON payload
+        """
+        client = self._ensure_client()
+        query = {key: value for key, value in params.items() if value is not None}
+        query.setdefault("output", "json")
+
+        with span("serpapi", query.get("engine", "unknown")) as search_span:
+            async with self._semaphore:
+                search_span.set(queued=round(search_span.duration, 6))
+                try:
+                    response = await client.get(
+                        "/search",
+                        params=query,
+                        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+                    )
+                except httpx.TimeoutException as e:
+                    raise SerpApiError(f"SerpAPI request timed out for engine={query.get('engine')}") from e
+                except httpx.HTTPError as e:
+                    raise SerpApiError(f"SerpAPI request failed: {e}") from e
+
+            search_span.set(status_code=response.status_code, payload_bytes=len(response.content))
+            if response.status_code != 200:
+                raise SerpApiError(f"SerpAPI returned HTTP {response.status_code}: {response.text[:200]}")
+
+            return response.json()
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+
+_client = None
+
+
+def get_serpapi_client():
+    """
+    Return the process-wide SerpAPI client
+    """
+    global _client
+    if _client is None:
+        _client = SerpApiClient()
+    return _client
+
+
+async def close_serpapi_client():
+    if _client is not None:
+        await _client.aclose()
+
+
+async def cached_search(params, namespace):
+    """
+    SerpAPI search served through the shared two-tier cache for ``namespace``.
+
+    Only searches that reach SerpAPI are charged to the caller's quota. Searches go through
+    the fixture store, so they can be recorded and replayed without a key; while it records
+    or replays the cache is skipped, or cached answers would never reach (or come from) a fixture.
+    """
+    fetched = False
+
+    async def search():
+        await quota.acquire("serpapi")
+        return await get_serpapi_client().search(params)
+
+    async def fetch():
+        nonlocal fetched
+        fetched = True
+        request = {key: value for key, value in params.items() if value is not None and key not in IGNORED_KEY_PARAMS}
+        return await fixture_store.call("serpapi", request, search)
+
+    with span("serp_cache", namespace) as cache_span:
+        if fixture_store.active:
+            cache_span.set(cache="bypass")
+            return await fetch()
+        result = await get_serp_cache().get_or_fetch(
+            namespace,
+            params,
+            fetch,
+            cacheable=lambda data: "error" not in data,
+        )
+        # A stale hit refreshes in the background, so only a fetch before returning is a miss
+        cache_span.set(cache="miss" if fetched else "hit")
+        return result
@@ -0,0 +1,119 @@
+import json
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+from itinerary_schema import parse_itinerary_text
+
+
+STREAM_MODES = ["updates", "messages"]
+
+# Nodes whose model output is user-facing itinerary text
+TEXT_NODES = {"assistant"}
+
+
+def parse_json_text(text):
+    """
+    Best-effort decode of a model reply that may be fenced, commented or cut off; the section
+    still being written is kept, as far as it got
+    """
+    return parse_itinerary_text(text, drop_unfinished=False)[0]
+
+
+def _result_size(content):
+    decoded = content
+    if isinstance(content, str):
+        try:
+            decoded = json.loads(content)
+        except ValueError:
+            return None
+    return len(decoded) if isinstance(decoded, list) else None
+
+
+def update_events(update):
+    """
+    Turn one ``updates`` chunk ({node: state_update}) into progress events
+    """
+    events = []
+    for node, values in update.items():
+        if not isinstance(values, dict):
+            continue
+        for message in values.get("messages", []):
+            if isinstance(message, AIMessage) and message.tool_calls:
+                events.append({
+                    "event": "tool_calls",
+                    "node": node,
+                    "calls": [{"name": call["name"], "args": call["args"]} for call in message.tool_calls],
+                })
+            elif isinstance(message, ToolMessage):
+                events.append({
+                    "event": "tool_result",
+                    "node": node,
+                    "tool": message.name,
+                    "status": message.status,
+                    "items": _result_size(message.content),
+                })
+            elif isinstance(message, AIMessage) and node in TEXT_NODES:
+                content = message.content if isinstance(message.content, str) else ""
+                events.append({
+                    "event": "final",
+                    "node": node,
+                    "itinerary": parse_json_text(content),
+                    "content": content,
+                })
+        if "tool_results" in values:
+            events.append({
+                "event": "prefetch",
+                "node": node,
+                "cities": {
+                    city: {purpose: len(items) for purpose, items in results.items() if isinstance(items, list)}
+                    for city, results in values["tool_results"].items()
+                },
+            })
+        if "budget_plan" in values:
+            plan = values["budget_plan"]
+            events.append({
+                "event": "budget_plan",
+                "node": node,
+                "total_cost": plan["total_cost"],
+                "remaining_budget": plan["remaining_budget"],
+                "within_budget": plan["within_budget"],
+            })
+        if values.get("invalid_sections"):
+            events.append({"event": "repair", "node": node, "sections": list(values["invalid_sections"])})
+        if values.get("itinerary"):
+            events.append({
+                "event": "itinerary",
+                "node": node,
+                "itinerary": values["itinerary"],
+                "errors": values.get("itinerary_errors") or {},
+                "repair_attempts": values.get("repair_attempts", 0),
+            })
+    return events
+
+
+def message_events(chunk):
+    """
+    Turn one ``messages`` chunk (message, metadata) into a token event, if it carries text
+    """
+    message, metadata = chunk
+    if not isinstance(message, AIMessageChunk) or metadata.get("langgraph_node") not in TEXT_NODES:
+        return []
+    if not isinstance(message.content, str) or not message.content:
+        return []
+    return [{"event": "token", "node": metadata["langgraph_node"], "content": message.content}]
+
+
+def graph_events(mode, chunk):
+    if mode == "updates":
+        return update_events(chunk)
+    if mode == "messages":
+        return message_events(chunk)
+    return []
+
+
+def format_ndjson(event):
+    return json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+
+def format_sse(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
@@ -0,0 +1,320 @@
+import asyncio
+import atexit
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Share of debug payload dumps (states, requests, responses) actually written
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+TELEMETRY_SPAN_BUFFER = int(os.getenv("TELEMETRY_SPAN_BUFFER", "2048"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+# ---------------------------------------------------------------------------
+# Logging: records are handed to a queue and written by a background thread, so
+# a slow stdout never blocks the event loop.
+
+_listener = None
+
+
+def setup_logging(level=LOG_LEVEL, stream=None):
+    global _listener
+    root = logging.getLogger("itinerary")
+    if _listener is not None:
+        return root
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return root
+
+
+def get_logger(name):
+    setup_logging()
+    return logging.getLogger(f"itinerary.{name}")
+
+
+def log_payload(logger, message, payload):
+    """
+    Debug-log a large payload for a sampled share of calls; nothing is serialized otherwise
+    """
+    if not logger.isEnabledFor(logging.DEBUG) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    text = json.dumps(payload, ensure_ascii=False, default=str)
+    if len(text) > LOG_PAYLOAD_MAX_CHARS:
+        text = text[:LOG_PAYLOAD_MAX_CHARS] + f"... ({len(text)} chars)"
+    logger.debug("%s %s", message, text)
+
+
+# ---------------------------------------------------------------------------
+# Tracing
+
+_current_span = ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    One timed operation. ``kind`` is the layer (request, node, tool, serpapi, llm) and
+    ``name`` the specific thing (node name, tool name, engine, model).
+    """
+
+    __slots__ = ("kind", "name", "trace_id", "span_id", "parent_id", "attributes", "start", "end", "status", "error")
+
+    def __init__(self, kind, name, parent=None, attributes=None):
+        self.kind = kind
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(8).hex()
+        self.span_id = os.urandom(4).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self):
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration": round(self.duration, 6),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class InMemorySpanExporter:
+    """
+    Keeps the most recent finished spans, for tests and the offline benchmarks
+    """
+
+    def __init__(self, max_spans=TELEMETRY_SPAN_BUFFER):
+        self._spans = deque(maxlen=max_spans)
+
+    def __call__(self, span):
+        self._spans.append(span)
+
+    def spans(self, kind=None, name=None):
+        return [s for s in self._spans if (kind is None or s.kind == kind) and (name is None or s.name == name)]
+
+    def clear(self):
+        self._spans.clear()
+
+
+class Tracer:
+    def __init__(self, exporters=None):
+        self.exporters = list(exporters or [])
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    @contextmanager
+    def span(self, kind, name, **attributes):
+        span = Span(kind, name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "cancelled" if isinstance(e, (asyncio.CancelledError, GeneratorExit)) else "error"
+            span.error = repr(e)[:200]
+            raise
+        finally:
+            span.end = time.perf_counter()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Closed from another context, e.g. a streaming generator finalized elsewhere
+                pass
+            for exporter in self.exporters:
+                exporter(span)
+
+
+def current_span():
+    return _current_span.get()
+
+
+# ---------------------------------------------------------------------------
+# Metrics
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(key)} {value}" for key, value in self.values.items()]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for index, upper in enumerate(self.buckets):
+            if value <= upper:
+                series[0][index] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for upper, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', repr(float(upper))),))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {count}")
+            lines.append(f"{self.name}_sum{_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Prometheus-style metrics fed by finished spans and explicit counters
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.span_duration = Histogram("itinerary_span_duration_seconds", "Latency of traced operations")
+        self.payload_bytes = Counter("itinerary_payload_bytes_total", "Bytes of payload handled by traced operations")
+        self.llm_tokens = Counter("itinerary_llm_tokens_total", "LLM tokens by model and kind")
+        self.cache_lookups = Counter("itinerary_serp_cache_lookups_total", "SerpAPI cache lookups by namespace and result")
+        self.job_wait = Histogram("itinerary_job_wait_seconds", "Time jobs spent queued before a worker picked them up",
+                                  buckets=LATENCY_BUCKETS + (300, 600, 1800))
+        self.metrics = [self.span_duration, self.payload_bytes, self.llm_tokens, self.cache_lookups, self.job_wait]
+
+    def __call__(self, span):
+        with self._lock:
+            self.span_duration.observe(span.duration, kind=span.kind, name=span.name, status=span.status)
+            size = span.attributes.get("payload_bytes")
+            if size:
+                self.payload_bytes.inc(size, kind=span.kind, name=span.name)
+            for kind in ("input_tokens", "output_tokens", "cached_tokens"):
+                tokens = span.attributes.get(kind)
+                if tokens:
+                    self.llm_tokens.inc(tokens, model=span.name, kind=kind.replace("_tokens", ""))
+            result = span.attributes.get("cache")
+            if result:
+                self.cache_lookups.inc(namespace=span.name, result=result)
+
+    def observe(self, name, value, **labels):
+        """
+        Record a value that isn't a span duration, e.g. ``observe("job_wait", seconds)``
+        """
+        with self._lock:
+            getattr(self, name).observe(value, **labels)
+
+    def render(self, extra=None):
+        """
+        Text exposition format; ``extra`` adds values read from elsewhere as {name: (help, value)},
+        typed as counters when the name ends in ``_total`` and gauges otherwise
+        """
+        with self._lock:
+            lines = []
+            for metric in self.metrics:
+                lines += metric.render()
+        for name, (help_text, value) in (extra or {}).items():
+            kind = "counter" if name.endswith("_total") else "gauge"
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+span_exporter = InMemorySpanExporter()
+tracer = Tracer([metrics, span_exporter])
+span = tracer.span
+
+
+def message_bytes(messages):
+    """
+    Rough payload size of a list of messages, without serializing them
+    """
+    total = 0
+    for message in messages:
+        content = getattr(message, "content", "")
+        total += len(content) if isinstance(content, str) else sum(len(str(part)) for part in content)
+    return total
+
+
+def traced_node(name, node):
+    """
+    Wrap a graph node so every run is a ``node`` span. The signature is preserved, so
+    LangGraph still passes ``config`` to nodes that take it.
+    """
+    call = getattr(node, "__call__", None)
+    if inspect.iscoroutinefunction(node) or inspect.iscoroutinefunction(call):
+        @functools.wraps(node)
+        async def wrapper(*args, **kwargs):
+            with span("node", name) as node_span:
+                update = await node(*args, **kwargs)
+                _record_update(node_span, update)
+                return update
+    else:
+        @functools.wraps(node)
+        def wrapper(*args, **kwargs):
+            with span("node", name) as node_span:
+                update = node(*args, **kwargs)
+                _record_update(node_span, update)
+                return update
+    return wrapper
+
+
+def _record_update(node_span, update):
+    if isinstance(update, dict) and update.get("messages"):
+        node_span.set(messages=len(update["messages"]), payload_bytes=message_bytes(update["messages"]))
@@ -0,0 +1,57 @@
+import asyncio
+
+import httpx
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+import main
+from agent import AgentState
+from coalesce import SingleFlight, request_fingerprint
+
+
+PAYLOAD = {"budget": 100000, "interests": ["culture"], "companions": 2, "city": "Lahore",
+           "days": 2, "travel_date": "2025-06-01"}
+
+
+def slow_graph():
+    async def validate(state):
+        # Long enough for both requests to join the same run
+        await asyncio.sleep(0.05)
+        return {"itinerary": {"destination": state["city"][0]}}
+
+    builder = StateGraph(AgentState)
+    builder.add_node("validate", validate)
+    builder.add_edge(START, "validate")
+    builder.add_edge("validate", END)
+    return builder.compile(checkpointer=MemorySaver())
+
+
+async def plan_twice(graph):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(*(client.post("/create_itinerary", json=PAYLOAD) for _ in range(2)))
+    states = [await graph.aget_state({"configurable": {"thread_id": r.json()["thread_id"]}}) for r in responses]
+    return responses, states
+
+
+def test_coalesced_callers_get_their_own_threads(monkeypatch):
+    graph = slow_graph()
+    monkeypatch.setattr(main.app.state, "graph", graph, raising=False)
+    monkeypatch.setattr(main, "itinerary_runs", SingleFlight(response_ttl=0))
+    responses, states = asyncio.run(plan_twice(graph))
+    assert [r.status_code for r in responses] == [200, 200]
+    assert sorted(r.headers.get("X-Itinerary-Coalesced", "false") for r in responses) == ["false", "true"]
+    leader, follower = (r.json()["thread_id"] for r in responses)
+    assert leader != follower
+    assert main.itinerary_runs.stats["runs"] == 1
+    # The follower's thread holds the shared result and is finished, ready for an edit
+    for state in states:
+        assert state.values["itinerary"] == {"destination": "Lahore"}
+        assert state.next == ()
+
+
+def test_fingerprint_ignores_cosmetic_differences():
+    a = {**PAYLOAD, "city": ["Lahore"], "interests": ["Culture ", "food"]}
+    b = {**PAYLOAD, "city": ["lahore"], "interests": ["food", "culture"], "budget": 100000.0}
+    assert request_fingerprint(a) == request_fingerprint(b)
+    assert request_fingerprint(a) != request_fingerprint({**a, "days": 3})
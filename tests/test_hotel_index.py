@@ -0,0 +1,28 @@
+from hotel_index import HotelIndex
+
+
+def hotels():
+    return [
+        {"name": "Budget Inn", "price": 6000, "rating": 3.9, "hotel_class": 2},
+        {"name": "Midway", "price": 15000, "rating": 4.2, "hotel_class": 3},
+        {"name": "Serena", "price": 45000, "rating": 4.8, "hotel_class": 5},
+    ]
+
+
+def test_only_a_search_for_the_same_stay_answers():
+    index = HotelIndex()
+    index.add("Hotels in Skardu, Pakistan", "2025-06-01", "2025-06-03", hotels(), adults=2)
+    assert index.query("Skardu", "2025-06-01", "2025-06-03")
+    assert index.query("skardu pakistan", "2025-06-01", "2025-06-03", adults=2)
+    assert index.query("Skardu", "2025-07-01", "2025-07-03") is None
+    assert index.query("Skardu", "2025-06-01", "2025-06-04") is None
+    assert index.query("Skardu", "2025-06-01", "2025-06-03", adults=4) is None
+
+
+def test_filters_and_price_band():
+    index = HotelIndex()
+    index.add("Skardu", "2025-06-01", "2025-06-03", hotels())
+    assert [h["name"] for h in index.query("Skardu", "2025-06-01", "2025-06-03", price_band="mid")] == ["Midway"]
+    cheapest = index.query("Skardu", "2025-06-01", "2025-06-03", max_price=20000, sort_by="price", limit=1)
+    assert [h["name"] for h in cheapest] == ["Budget Inn"]
+    assert [h["name"] for h in index.query("Skardu", "2025-06-01", "2025-06-03", min_rating=4.5)] == ["Serena"]
@@ -0,0 +1,17 @@
+from image_dedup import url_fingerprint
+
+
+def test_size_variants_on_one_host_share_a_fingerprint():
+    assert url_fingerprint("https://cdn.example.com/img/badshahi-mosque-1024x768.jpg") == \
+        url_fingerprint("https://cdn.example.com/img/badshahi-mosque_thumb.jpg")
+    assert url_fingerprint("https://upload.wikimedia.org/wikipedia/commons/thumb/a/ab/Badshahi_Mosque.jpg/320px-Badshahi_Mosque.jpg") == \
+        url_fingerprint("https://upload.wikimedia.org/wikipedia/commons/a/ab/Badshahi_Mosque.jpg")
+
+
+def test_same_name_on_other_hosts_is_not_a_duplicate():
+    assert url_fingerprint("https://blog-one.com/photos/badshahi-mosque.jpg") != \
+        url_fingerprint("https://travel-two.pk/uploads/badshahi-mosque.jpg")
+
+
+def test_generic_names_fall_back_to_the_path():
+    assert url_fingerprint("https://example.com/a/12345678.jpg") != url_fingerprint("https://example.com/b/12345678.jpg")
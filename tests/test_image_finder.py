@@ -0,0 +1,40 @@
+import asyncio
+
+import agent
+import image_dedup
+
+
+def page(query, count):
+    slug = query.replace(" ", "-")
+    return {"images_results": [{"original": f"https://upload.wikimedia.org/{slug}/photo-{n}-of-{slug}.jpg"}
+                               for n in range(count)]}
+
+
+def find_images(monkeypatch, pages):
+    searched = []
+
+    async def cached_search(params, namespace):
+        searched.append(params["q"])
+        return page(params["q"], pages.get(params["q"], 0))
+
+    async def all_live(images):
+        return images
+
+    monkeypatch.setattr(agent, "cached_search", cached_search)
+    monkeypatch.setattr(agent, "filter_live_images", all_live)
+    monkeypatch.setattr(agent.destination_pack, "images", lambda q, safe="active": None)
+    monkeypatch.setattr(agent.quota, "degraded", lambda resource: False)
+    monkeypatch.setattr(image_dedup, "IMAGE_DEDUP_PIXELS", False)
+    return asyncio.run(agent.image_finder.ainvoke({"q": "Hunza"})), searched
+
+
+def test_fallback_searches_stop_once_there_are_enough_images(monkeypatch):
+    images, searched = find_images(monkeypatch, {"Hunza": 2, "Hunza wallpaper": 10})
+    assert searched == ["Hunza", "Hunza wallpaper"]
+    assert len(images) >= 8
+
+
+def test_fallback_searches_run_in_order_while_images_are_short(monkeypatch):
+    images, searched = find_images(monkeypatch, {"Hunza": 2, "Hunza wallpaper": 1, "Hunza landscape photos": 1})
+    assert searched == ["Hunza", "Hunza wallpaper", "Hunza landscape photos", "Hunza tourism photos"]
+    assert len(images) == 4
@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+
+from cache import TwoTierCache
+from image_probe import ImageProber
+
+CHUNK = 64 * 1024
+
+
+class EndlessImage(httpx.AsyncByteStream):
+    """
+    An image body that counts how much of it was read
+    """
+
+    def __init__(self):
+        self.sent = 0
+
+    async def __aiter__(self):
+        while self.sent < 100 * CHUNK:
+            self.sent += CHUNK
+            yield b"\xff" * CHUNK
+
+
+def run_with(handler, work):
+    async def scenario():
+        prober = ImageProber(cache=TwoTierCache(path=None), deadline=1)
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        prober._ensure_client = lambda: client
+        prober._semaphore = asyncio.Semaphore(4)
+        try:
+            return await work(prober)
+        finally:
+            await client.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_ranged_get_fallback_reads_only_headers():
+    body = EndlessImage()
+
+    def handler(request):
+        if request.method == "HEAD":
+            return httpx.Response(405)
+        # Ignores Range and starts sending the whole image
+        return httpx.Response(200, headers={"content-type": "image/jpeg", "content-length": str(100 * CHUNK)}, stream=body)
+
+    verdict = run_with(handler, lambda prober: prober.verdict("https://example.com/big.jpg"))
+    assert verdict["ok"]
+    assert body.sent <= CHUNK
+
+
+def test_fetch_stops_once_the_body_is_too_large():
+    body = EndlessImage()
+
+    def handler(request):
+        return httpx.Response(200, headers={"content-type": "image/jpeg"}, stream=body)
+
+    blob = run_with(handler, lambda prober: prober.fetch("https://example.com/thumb.jpg", 3 * CHUNK))
+    assert blob is None
+    assert body.sent <= 4 * CHUNK
+
+
+def test_images_that_cannot_be_checked_are_kept():
+    def handler(request):
+        if "down" in request.url.path:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(404)
+
+    images = [{"url": "https://example.com/down.jpg"}, {"url": "https://example.com/gone.jpg"}]
+    kept = run_with(handler, lambda prober: prober.filter_live(images))
+    assert kept == [{"url": "https://example.com/down.jpg"}]
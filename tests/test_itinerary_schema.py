@@ -0,0 +1,91 @@
+import json
+
+from itinerary_schema import parse_itinerary_text, validate_sections
+
+
+def day(number):
+    return {
+        "day": number,
+        "date": f"2025-06-0{number}",
+        "day_title": "Old city",
+        "description": "Walk the old city",
+        "hotel": {"name": "Hotel One", "price": 5000, "booking_url": "https://www.example.com/hotel-one"},
+        "transportation": {"type": "Car", "cost": 5000},
+        "meals": [{"type": "Lunch", "cost": 1500}],
+        "activities": [{"name": "Fort", "cost": 1000}],
+    }
+
+
+def itinerary_text(days=3):
+    return json.dumps({
+        "trip_details": {"destination": "Lahore", "duration": days, "travel_date": "2025-06-01",
+                         "companions": 2, "budget": 100000, "interests": ["culture"]},
+        "destination_images": [{"url": "https://example.com/a.jpg"}],
+        "hotel_images": [],
+        "daily_itinerary": [day(n) for n in range(1, days + 1)],
+        "total_cost": 42000,
+        "remaining_budget": 58000,
+    })
+
+
+def cut_after(text, marker, start_marker=None):
+    start = text.index(start_marker) if start_marker else 0
+    return text[:text.index(marker, start) + len(marker)]
+
+
+def test_complete_reply_parses_as_complete():
+    data, complete = parse_itinerary_text(itinerary_text())
+    assert complete
+    assert validate_sections(data, 3)[1] == {}
+
+
+def test_day_cut_off_inside_a_string_is_marked_invalid():
+    text = cut_after(itinerary_text(), '"booking_url": "https://www.', start_marker='"day": 2')
+    data, complete = parse_itinerary_text(text)
+    assert not complete
+    # Day 2 is not kept with a half-written booking_url and no transport or meals
+    assert data["daily_itinerary"][0]["day"] == 1
+    assert data["daily_itinerary"][1] is None
+    _, invalid = validate_sections(data, 3)
+    assert {"daily_itinerary[1]", "daily_itinerary[2]", "total_cost"} <= set(invalid)
+    assert "daily_itinerary[0]" not in invalid
+
+
+def test_partial_number_is_dropped():
+    text = cut_after(itinerary_text(), '"total_cost": 42')
+    data, _ = parse_itinerary_text(text)
+    assert "total_cost" not in data
+    assert "total_cost" in validate_sections(data, 3)[1]
+
+
+def test_cut_off_section_is_dropped():
+    text = cut_after(itinerary_text(), '"companions": 2')
+    data, _ = parse_itinerary_text(text)
+    assert "trip_details" not in data
+    assert "trip_details" in validate_sections(data, 3)[1]
+
+
+def test_cut_between_days_keeps_the_written_days():
+    full = itinerary_text()
+    text = full[:full.index('{"day": 3')]
+    data, _ = parse_itinerary_text(text)
+    assert [d["day"] for d in data["daily_itinerary"]] == [1, 2]
+    _, invalid = validate_sections(data, 3)
+    assert "daily_itinerary[2]" in invalid and "daily_itinerary[1]" not in invalid
+
+
+def test_comma_inside_a_cut_off_string_is_not_a_cut_point():
+    data, _ = parse_itinerary_text('{"a": 1, "b": {"description": "Forts, mosques and', drop_unfinished=False)
+    assert data == {"a": 1, "b": {}}
+
+
+def test_cut_off_repair_patch_drops_the_unfinished_section():
+    patch = json.dumps({"daily_itinerary[1]": day(2), "daily_itinerary[2]": day(3)})
+    data, _ = parse_itinerary_text(patch[:-40])
+    assert list(data) == ["daily_itinerary[1]"]
+
+
+def test_streaming_keeps_the_section_being_written():
+    text = cut_after(itinerary_text(), '"day_title": "Old city"', start_marker='"day": 2')
+    data, _ = parse_itinerary_text(text, drop_unfinished=False)
+    assert data["daily_itinerary"][1]["day_title"] == "Old city"
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+
+import pytest
+
+from jobs import JobQueue, JobStore, MemoryJobStore, QueueFullError
+
+
+async def never_run(job, emit):
+    raise AssertionError("no worker should run this job")
+
+
+def test_job_store_is_abstract():
+    with pytest.raises(TypeError):
+        JobStore()
+
+
+def test_cancelled_queued_jobs_free_their_slot():
+    async def scenario():
+        # No workers, so submitted jobs stay queued
+        queue = JobQueue(never_run, store=MemoryJobStore(), workers=0, max_queued=2)
+        await queue.start()
+        first = await queue.submit({"n": 1})
+        await queue.submit({"n": 2})
+        with pytest.raises(QueueFullError):
+            await queue.submit({"n": 3})
+        cancelled = await queue.cancel(first["job_id"])
+        assert cancelled["status"] == "cancelled"
+        assert queue.depth == 1
+        await queue.submit({"n": 3})
+        assert queue.depth == 2
+        await queue.stop()
+
+    asyncio.run(scenario())
+
+
+def test_worker_skips_jobs_cancelled_while_queued():
+    async def scenario():
+        release = asyncio.Event()
+        ran = []
+
+        async def runner(job, emit):
+            ran.append(job["payload"]["n"])
+            await release.wait()
+            return {}
+
+        queue = JobQueue(runner, store=MemoryJobStore(), workers=1)
+        await queue.start()
+        await queue.submit({"n": 1})
+        await asyncio.sleep(0)
+        second = await queue.submit({"n": 2})
+        await queue.submit({"n": 3})
+        await queue.cancel(second["job_id"])
+        assert queue.depth == 1
+        release.set()
+        await queue._queue.join()
+        await queue.stop()
+        assert ran == [1, 3] and queue.depth == 0
+
+    asyncio.run(scenario())
+
+
+class PausingStore(MemoryJobStore):
+    """
+    Holds the first read of a job, as read, until released, as a slow database would
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.reading = threading.Event()
+        self.release = threading.Event()
+        self._paused = False
+
+    def get(self, job_id):
+        job = super().get(job_id)
+        if not self._paused:
+            self._paused = True
+            self.reading.set()
+            self.release.wait(5)
+        return job
+
+
+def test_job_cancelled_while_a_worker_starts_it_does_not_finish():
+    async def scenario():
+        finished = []
+
+        async def runner(job, emit):
+            await asyncio.sleep(0.05)
+            finished.append(job["job_id"])
+            return {}
+
+        store = PausingStore()
+        queue = JobQueue(runner, store=store, workers=0)
+        await queue.start()
+        job = await queue.submit({"n": 1})
+        # A worker takes the job and is still reading it when the cancel arrives
+        taken = await queue._take()
+        run = asyncio.create_task(queue._run(taken))
+        await asyncio.to_thread(store.reading.wait, 5)
+        cancel = asyncio.create_task(queue.cancel(taken))
+        await asyncio.sleep(0.01)
+        store.release.set()
+        await asyncio.gather(run, cancel)
+        assert finished == []
+        assert (await queue.get(job["job_id"]))["status"] == "cancelled"
+        assert queue.stats["cancelled"] == 1 and queue.stats["succeeded"] == 0
+        await queue.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,80 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from llm_router import CircuitBreaker, LLMRouter, ModelEndpoint
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeModel:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    async def ainvoke(self, messages, config=None):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("provider down")
+        return AIMessage(content="ok")
+
+
+def tripped_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    return breaker
+
+
+def test_half_open_breaker_hands_out_one_probe():
+    clock = Clock()
+    breaker = tripped_breaker(clock)
+    assert not breaker.available()
+    clock.now = 30
+    # Looking does not use up the probe
+    assert breaker.available() and breaker.available()
+    assert breaker.state == "open"
+    assert breaker.try_acquire_probe()
+    assert breaker.state == "half_open"
+    assert not breaker.available()
+    assert not breaker.try_acquire_probe()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.available()
+    clock.now = 60
+    assert breaker.try_acquire_probe()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.available()
+
+
+def test_backup_keeps_its_probe_when_primary_answers():
+    clock = Clock()
+    backup = ModelEndpoint("backup", FakeModel(), tripped_breaker(clock))
+    primary = ModelEndpoint("primary", FakeModel(), CircuitBreaker(clock=clock))
+    router = LLMRouter({"final": [primary, backup]}, hedge_percentile=0)
+    clock.now = 30
+    for _ in range(3):
+        asyncio.run(router.ainvoke([HumanMessage(content="hi")]))
+    assert backup.model.calls == 0
+    assert backup.breaker.state == "open" and backup.breaker.available()
+
+
+def test_probe_goes_to_the_endpoint_that_is_called():
+    clock = Clock()
+    primary = ModelEndpoint("primary", FakeModel(fail=True), tripped_breaker(clock))
+    backup = ModelEndpoint("backup", FakeModel(), CircuitBreaker(clock=clock))
+    router = LLMRouter({"final": [primary, backup]}, hedge_percentile=0)
+    clock.now = 30
+    response = asyncio.run(router.ainvoke([HumanMessage(content="hi")]))
+    assert response.content == "ok"
+    # The probe failed, so the primary is open again and the backup answered
+    assert primary.model.calls == 1 and backup.model.calls == 1
+    assert primary.breaker.state == "open" and not primary.breaker.available()
+    primary.model.fail = False
+    clock.now = 60
+    asyncio.run(router.ainvoke([HumanMessage(content="hi")]))
+    assert primary.model.calls == 2 and primary.breaker.state == "closed"
@@ -0,0 +1,65 @@
+import math
+import random
+from itertools import product
+
+import pytest
+
+import optimizer
+from optimizer import BUDGET_STEP, optimize_budget, solve_groups
+
+
+def random_groups(rng):
+    return [
+        [{"cost": rng.randrange(0, 20000, 100), "value": round(rng.random() * 5, 2)} for _ in range(rng.randint(1, 4))]
+        for _ in range(rng.randint(1, 5))
+    ]
+
+
+def best_fitting_value(groups, budget):
+    # Brute force over every combination, with costs rounded up to budget steps as the solver does
+    capacity = int(budget // BUDGET_STEP)
+    values = [
+        sum(option["value"] for option in combo)
+        for combo in product(*groups)
+        if sum(math.ceil(option["cost"] / BUDGET_STEP) for option in combo) <= capacity
+    ]
+    return max(values) if values else None
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_knapsack_stays_within_budget_and_is_optimal(seed):
+    rng = random.Random(seed)
+    groups = random_groups(rng)
+    budget = rng.randrange(0, 60000, 250)
+    picked = solve_groups(groups, budget)
+    expected = best_fitting_value(groups, budget)
+    if expected is None:
+        assert picked is None
+        return
+    chosen = [options[index] for options, index in zip(groups, picked)]
+    assert sum(option["cost"] for option in chosen) <= budget
+    assert sum(option["value"] for option in chosen) == pytest.approx(expected)
+
+
+def trip(budget):
+    hotels = [{"name": "Budget Inn", "price": 4000, "rating": 3.5}, {"name": "Serena", "price": 30000, "rating": 4.8}]
+    return {"budget": budget, "interests": ["history", "food"], "companions": 2, "city": ["Lahore", "Islamabad"],
+            "days": 4, "travel_date": "2025-06-01",
+            "tool_results": {"Lahore": {"hotels": hotels}, "Islamabad": {"hotels": hotels}}}
+
+
+@pytest.mark.parametrize("budget", [80000, 150000, 400000])
+def test_plan_total_stays_within_budget(monkeypatch, budget):
+    monkeypatch.setattr(optimizer.destination_pack, "city", lambda city, field: None)
+    plan = optimize_budget(trip(budget))
+    assert plan["within_budget"]
+    assert plan["total_cost"] <= budget
+    assert plan["total_cost"] == sum(day["day_cost"] for day in plan["days"])
+    assert plan["remaining_budget"] == budget - plan["total_cost"]
+
+
+def test_plan_reports_a_budget_that_cannot_be_met(monkeypatch):
+    monkeypatch.setattr(optimizer.destination_pack, "city", lambda city, field: None)
+    plan = optimize_budget(trip(10000))
+    assert not plan["within_budget"]
+    assert plan["total_cost"] > 10000
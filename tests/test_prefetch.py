@@ -0,0 +1,91 @@
+import json
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from agent import assistant_route
+from edits import plan_edit_searches
+from prefetch import plan_searches, recorded_searches
+
+
+HOTEL = {"name": "Shangrila", "price": 12000}
+IMAGE = {"url": "https://example.com/skardu.jpg"}
+
+
+def trip(*messages):
+    return {"city": ["Lahore", "Skardu"], "days": 4, "travel_date": "2025-06-01", "companions": 2,
+            "messages": [HumanMessage(content="Plan my trip"), *messages]}
+
+
+def turn(*calls):
+    """
+    One assistant turn calling ``calls`` as (name, args, output), followed by the tool replies
+    """
+    ids = [f"call_{index}" for index in range(len(calls))]
+    message = AIMessage(content="", tool_calls=[
+        {"name": name, "args": args, "id": call_id} for call_id, (name, args, _) in zip(ids, calls)
+    ])
+    replies = [
+        ToolMessage(content=f"Error: {name} failed", name=name, tool_call_id=call_id, status="error")
+        if output is None else ToolMessage(content=json.dumps(output), name=name, tool_call_id=call_id)
+        for call_id, (name, _, output) in zip(ids, calls)
+    ]
+    return [message, *replies]
+
+
+def image_calls(city, output):
+    return [("image_finder", {"q": f"{city} tourist attractions"}, output),
+            ("image_finder", {"q": f"best hotels in {city} rooms"}, output)]
+
+
+def test_recorded_searches_match_the_plan_shape():
+    state = trip(*turn(
+        ("hotels_batch_finder", {"cities": ["Lahore"], "check_in_date": "2025-06-01",
+                                 "check_out_date": "2025-06-03", "adults": 2}, {"Lahore": [HOTEL]}),
+        ("hotels_finder", {"params": {"q": "Hotels in Skardu, Pakistan", "check_in_date": "2025-06-03",
+                                      "check_out_date": "2025-06-05"}}, None),
+        *image_calls("Skardu", [IMAGE]),
+    ))
+    planned = {(s["city"], s["purpose"]): s["args"] for s in plan_searches(state)}
+    recorded = recorded_searches(state)
+
+    assert set(recorded) == {("Lahore", "hotels"), ("Skardu", "hotels"),
+                             ("Skardu", "destination_images"), ("Skardu", "hotel_images")}
+    assert recorded[("Lahore", "hotels")] == (planned[("Lahore", "hotels")], [HOTEL])
+    assert recorded[("Skardu", "hotels")][1] is None
+    # Same city and dates, but one adult in one room instead of two
+    assert recorded[("Skardu", "hotels")][0] != planned[("Skardu", "hotels")]
+    assert recorded[("Skardu", "hotel_images")] == (planned[("Skardu", "hotel_images")], [IMAGE])
+
+
+def test_route_waits_for_every_planned_search_not_a_call_count():
+    # A batch search and an index lookup count as calls but leave the image searches undone
+    first = turn(
+        ("hotels_batch_finder", {"cities": ["Lahore", "Skardu"], "check_in_date": "2025-06-01",
+                                 "check_out_date": "2025-06-05"}, {"Lahore": [HOTEL], "Skardu": [HOTEL]}),
+        *[("hotel_index_query", {"city": "Skardu", "check_in_date": "2025-06-01",
+                                 "check_out_date": "2025-06-05"}, []) for _ in range(6)],
+    )
+    assert assistant_route(trip()) == "tools"
+    assert assistant_route(trip(*first)) == "tools"
+
+    # Failed searches still count as done
+    second = turn(*image_calls("Lahore", None), *image_calls("Skardu", [IMAGE]))
+    assert assistant_route(trip(*first, *second)) == "final"
+
+
+def test_route_without_a_readable_date_waits_for_any_result():
+    state = {**trip(), "travel_date": "sometime in June"}
+    assert assistant_route(state) == "tools"
+    state["messages"] += turn(*image_calls("Lahore", [IMAGE]))
+    assert assistant_route(state) == "final"
+
+
+def test_agent_mode_edit_reuses_the_recorded_searches():
+    old = trip(*turn(*[(s["tool"], s["args"], [IMAGE] if s["tool"] == "image_finder" else [HOTEL])
+                       for s in plan_searches(trip())]))
+    # Lahore keeps its stay; Hunza replaces Skardu and needs all three searches
+    reused, searches = plan_edit_searches(old, {**old, "city": ["Lahore", "Hunza"]})
+
+    assert [(s["city"], s["purpose"]) for s in searches] == [
+        ("Hunza", "hotels"), ("Hunza", "destination_images"), ("Hunza", "hotel_images")]
+    assert reused == {"Lahore": {"hotels": [HOTEL], "destination_images": [IMAGE], "hotel_images": [IMAGE]}}
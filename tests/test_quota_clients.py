@@ -0,0 +1,43 @@
+import asyncio
+
+import httpx
+from starlette.requests import Request
+
+import main
+
+
+def request(headers=None, host="203.0.113.7"):
+    scope = {
+        "type": "http",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": (host, 50000),
+    }
+    return Request(scope)
+
+
+def test_client_header_is_ignored_unless_a_gateway_is_configured(monkeypatch):
+    monkeypatch.setattr(main, "QUOTA_CLIENT_HEADER", "")
+    assert main.client_id(request({"X-Client-Id": "someone-else"})) == "203.0.113.7"
+
+
+def test_configured_gateway_header_names_the_client(monkeypatch):
+    monkeypatch.setattr(main, "QUOTA_CLIENT_HEADER", "X-Client-Id")
+    assert main.client_id(request({"X-Client-Id": "team-a"})) == "team-a"
+    assert main.client_id(request()) == "203.0.113.7"
+
+
+def submit(priority):
+    async def post():
+        transport = httpx.ASGITransport(app=main.app, client=("203.0.113.7", 50000))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/jobs", json={"budget": 100000, "interests": ["culture"], "companions": 2,
+                                                    "city": "Lahore", "days": 2, "travel_date": "2025-06-01",
+                                                    "priority": priority})
+    return asyncio.run(post())
+
+
+def test_high_priority_is_refused_to_unlisted_clients(monkeypatch):
+    monkeypatch.setattr(main, "JOB_HIGH_PRIORITY_CLIENTS", {"198.51.100.1"})
+    response = submit("high")
+    assert response.status_code == 403
+    assert main.itinerary_jobs.depth == 0
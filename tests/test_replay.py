@@ -0,0 +1,44 @@
+import asyncio
+
+import cache
+import serp_client
+from replay import FixtureStore
+
+
+class CountingSerpApi:
+    def __init__(self):
+        self.searches = 0
+
+    async def search(self, params):
+        self.searches += 1
+        return {"images_results": [{"original": f"https://example.com/{self.searches}.jpg"}]}
+
+
+def search_twice(monkeypatch, tmp_path, mode):
+    api = CountingSerpApi()
+    store = FixtureStore(mode=mode, directory=str(tmp_path / "replay"))
+    monkeypatch.setattr(serp_client, "fixture_store", store)
+    monkeypatch.setattr(serp_client, "get_serpapi_client", lambda: api)
+    monkeypatch.setattr(cache, "_serp_cache", cache.TwoTierCache(path=None))
+    params = {"engine": "google_images", "q": "Lahore fort"}
+
+    async def run():
+        return [await serp_client.cached_search(params, "images") for _ in range(2)]
+
+    return asyncio.run(run()), api, store
+
+
+def test_cache_answers_repeats_when_not_recording(monkeypatch, tmp_path):
+    results, api, store = search_twice(monkeypatch, tmp_path, "off")
+    assert api.searches == 1 and results[0] == results[1]
+
+
+def test_every_recorded_search_reaches_the_fixture_store(monkeypatch, tmp_path):
+    results, api, store = search_twice(monkeypatch, tmp_path, "record")
+    assert api.searches == 2
+    assert store.stats["recorded"] == 2
+    # Replaying needs no SerpAPI and no cache
+    monkeypatch.setattr(serp_client, "fixture_store", FixtureStore(mode="replay", directory=store.directory))
+    monkeypatch.setattr(cache, "_serp_cache", cache.TwoTierCache(path=None))
+    replayed = asyncio.run(serp_client.cached_search({"engine": "google_images", "q": "Lahore fort"}, "images"))
+    assert replayed == results[-1] and api.searches == 2
@@ -0,0 +1,27 @@
+import asyncio
+
+import httpx
+
+import agent
+import main
+
+
+def get(path):
+    async def fetch():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+    return asyncio.run(fetch())
+
+
+def missing_keys():
+    raise RuntimeError("OPENAI_API_KEY is not set")
+
+
+def test_stats_and_metrics_do_not_build_the_router(monkeypatch):
+    monkeypatch.delitem(agent.__dict__, "llm_router", raising=False)
+    monkeypatch.setitem(agent.LAZY_ATTRIBUTES, "llm_router", missing_keys)
+    stats = get("/stats")
+    assert stats.status_code == 200 and stats.json()["llm"] is None
+    assert get("/metrics").status_code == 200
+    assert "llm_router" not in agent.__dict__
@@ -0,0 +1,90 @@
+import asyncio
+import json
+import os
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from telemetry import span
+
+
+TOOL_MAX_CONCURRENCY = int(os.getenv("TOOL_MAX_CONCURRENCY", "12"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "45"))
+
+CONTENT_BLOCK_TYPES = {"text", "image_url", "image", "json", "search_result", "custom_tool_call_output", "document", "file"}
+
+
+def tool_content(output):
+    """
+    ToolMessage content for a tool's return value, as langgraph's ToolNode renders it
+    (kept local so importing this module doesn't pull in langgraph.prebuilt)
+    """
+    if isinstance(output, str) or (
+        isinstance(output, list)
+        and all(isinstance(x, dict) and x.get("type") in CONTENT_BLOCK_TYPES for x in output)
+    ):
+        return output
+    try:
+        return json.dumps(output, ensure_ascii=False)
+    except Exception:
+        return str(output)
+
+
+class ParallelToolNode:
+    """
+    Graph node that runs every tool call from the latest assistant turn concurrently.
+
+    Calls are capped by ``max_concurrency`` and each one gets its own timeout
+    (``tool_timeouts`` overrides ``default_timeout`` per tool name). A failed or
+    timed-out call becomes an error ``ToolMessage`` so the remaining results still
+    reach the model, which can retry or work around the missing data.
+    """
+
+    def __init__(self, tools, max_concurrency=TOOL_MAX_CONCURRENCY,
+                 default_timeout=TOOL_TIMEOUT_SECONDS, tool_timeouts=None):
+        self.tools_by_name = {t.name: t for t in tools}
+        self.max_concurrency = max_concurrency
+        self.default_timeout = default_timeout
+        self.tool_timeouts = tool_timeouts or {}
+
+    async def _run_call(self, call, semaphore, config):
+        name = call["name"]
+        tool = self.tools_by_name.get(name)
+        if tool is None:
+            return ToolMessage(
+                content=f"Error: unknown tool '{name}'. Available tools: {', '.join(self.tools_by_name)}",
+                name=name, tool_call_id=call["id"], status="error",
+            )
+
+        timeout = self.tool_timeouts.get(name, self.default_timeout)
+        with span("tool", name) as tool_span:
+            async with semaphore:
+                try:
+                    result = await asyncio.wait_for(tool.ainvoke(call["args"], config), timeout)
+                except asyncio.TimeoutError:
+                    tool_span.status = "timeout"
+                    return ToolMessage(
+                        content=f"Error: {name} timed out after {timeout:g}s",
+                        name=name, tool_call_id=call["id"], status="error",
+                    )
+                except Exception as e:
+                    tool_span.status = "error"
+                    tool_span.error = repr(e)[:200]
+                    return ToolMessage(
+                        content=f"Error: {name} failed: {e!r}",
+                        name=name, tool_call_id=call["id"], status="error",
+                    )
+
+            content = tool_content(result)
+            tool_span.set(payload_bytes=len(content) if isinstance(content, str) else None)
+            return ToolMessage(content=content, name=name, tool_call_id=call["id"])
+
+    async def __call__(self, state, config=None):
+        last_message = state["messages"][-1]
+        if not isinstance(last_message, AIMessage) or not last_message.tool_calls:
+            return {"messages": []}
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        messages = await asyncio.gather(
+            *(self._run_call(call, semaphore, config) for call in last_message.tool_calls)
+        )
+        return {"messages": list(messages)}
@@ -0,0 +1,156 @@
+import re
+from urllib.parse import urlsplit
+
+
+# Image URLs that tend to expire, need auth, or block hotlinking
+PROBLEMATIC_IMAGE_PATTERNS = [
+    r'lh\d+\.googleusercontent\.com/p/',
+    r'drive\.google\.com',
+    r'photos\.google\.com',
+    r'\.trvl-media\.com',
+    r'booking\.com.*images',
+    r'expedia\.com.*images',
+    r'[?&](?:token|auth|signature|expires)=',
+    r'lh\d+\.googleusercontent\.com.*=s\d+$',
+    r'[?&](?:utm_|fbclid|gclid)',
+]
+
+# One alternation compiled once: a single scan per URL instead of one per pattern
+PROBLEMATIC_IMAGE_RE = re.compile("|".join(f"(?:{p})" for p in PROBLEMATIC_IMAGE_PATTERNS), re.IGNORECASE)
+
+PREFERRED_IMAGE_DOMAINS = frozenset([
+    'upload.wikimedia.org',
+    'commons.wikimedia.org',
+    'unsplash.com',
+    'pixabay.com',
+    'pexels.com',
+    'flickr.com',
+    'staticflickr.com',
+])
+
+# SerpAPI-internal links that must never be shown as booking links
+INVALID_BOOKING_RE = re.compile(
+    "|".join(re.escape(p) for p in ['serpapi.com', 'search.json', 'property_token=', 'engine=google_hotels'])
+)
+
+BOOKING_DOMAINS = frozenset([
+    'sastaticket.pk',
+    'flypakistan.pk',
+    'booking.com',
+    'expedia.com',
+    'hotels.com',
+    'agoda.com',
+    'priceline.com',
+    'kayak.com',
+    'trivago.com',
+    'hotel.com',
+    'google.com',
+    'hotelscombined.com',
+])
+
+IMAGE_URL_FIELDS = ('original', 'link', 'thumbnail', 'source')
+
+
+def host_of(url):
+    """
+    Lower-cased host of ``url``; also handles scheme-less values like "booking.com/x"
+    """
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return ""
+    if host is None and "://" not in url:
+        host = url.split("/", 1)[0].split("?", 1)[0].split(":", 1)[0]
+    return (host or "").lower()
+
+
+def domain_in(host, domains):
+    """
+    True when ``host`` or any parent domain of it is in ``domains`` (suffix-set lookup)
+    """
+    while host:
+        if host in domains:
+            return True
+        _, _, host = host.partition(".")
+    return False
+
+
+def is_problematic_url(url):
+    """
+    Check if URL is from known problematic sources
+    """
+    if not url:
+        return True
+    return PROBLEMATIC_IMAGE_RE.search(url) is not None
+
+
+def is_valid_booking_url(url):
+    """
+    Check if URL is a valid booking URL, prioritizing Pakistani sites
+    """
+    if not url or not isinstance(url, str):
+        return False
+    if INVALID_BOOKING_RE.search(url.lower()):
+        return False
+    if url.startswith(('http://', 'https://')) and '.' in url:
+        return True
+    return domain_in(host_of(url), BOOKING_DOMAINS)
+
+
+def classify_image(img):
+    """
+    Pick URLs for one image result in a single pass over its candidate fields.
+
+    Returns ``(preferred_url, fallback_url)``: the first usable URL on a preferred
+    domain, and the first usable URL of any kind. Either may be None.
+    """
+    preferred = fallback = None
+    for field in IMAGE_URL_FIELDS:
+        url = img.get(field)
+        if not url or not isinstance(url, str) or PROBLEMATIC_IMAGE_RE.search(url):
+            continue
+        if fallback is None:
+            fallback = url
+        if domain_in(host_of(url), PREFERRED_IMAGE_DOMAINS):
+            preferred = url
+            break
+    return preferred, fallback
+
+
+def filter_reliable_images(image_results, max_images=10, exclude=None, with_thumbnails=False):
+    """
+    Filter image results to exclude problematic URLs and prioritize reliable sources.
+
+    Images on preferred domains come first, then the rest, each image contributing at
+    most one URL. ``exclude`` is an optional set of URLs that are already taken.
+    ``with_thumbnails`` also returns each result's ``thumbnail``, for image_dedup.
+    """
+    seen = set(exclude or ())
+    preferred_urls = []
+    fallback_urls = []
+    thumbnails = {}
+
+    for img in image_results:
+        if len(preferred_urls) >= max_images:
+            break
+        preferred, fallback = classify_image(img)
+        if preferred is not None:
+            if preferred not in seen:
+                seen.add(preferred)
+                preferred_urls.append(preferred)
+                thumbnails.setdefault(preferred, img.get("thumbnail"))
+        elif fallback is not None:
+            fallback_urls.append(fallback)
+            thumbnails.setdefault(fallback, img.get("thumbnail"))
+
+    selected = preferred_urls
+    for url in fallback_urls:
+        if len(selected) >= max_images:
+            break
+        if url not in seen:
+            seen.add(url)
+            selected.append(url)
+
+    if with_thumbnails:
+        return [{"url": url, "thumbnail": thumbnails.get(url)} for url in selected]
+    return [{"url": url} for url in selected]